@@ -32,27 +32,52 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 
-# PDF (ReportLab)
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.units import cm
-from reportlab.lib import colors
-from reportlab.platypus import (
-    SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image as RLImage
-)
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-
 import base64
 import plotly.io as pio
 
 from config.departments import get_department_config
+from services.pdf_reports import (
+    build_report_bundle,
+    create_report_executor,
+    executor_is_usable,
+    render_pdf_observations_report,
+    render_pdf_report,
+    report_bundle_jobs,
+)
+from services.report_engine import prepare_logo
+from services.ai_summary import (
+    DEFAULT_TOKEN_BUDGET,
+    EMPTY_SUMMARY,
+    ObservationSummarizer,
+    ObsPayload,
+    build_obs_payload,
+)
+from services.task_manager import (
+    STATUS_CANCELLED as TASK_CANCELLED,
+    STATUS_DONE as TASK_DONE,
+    STATUS_FAILED as TASK_FAILED,
+    STATUS_LABELS as TASK_LABELS,
+    Task,
+    TaskCancelled,
+    TaskManager,
+)
+from services.excel_reports import render_consolidated_excel
+from services.outbox import (
+    STATUS_FAILED,
+    STATUS_LABELS,
+    STATUS_SENT,
+    Outbox,
+    OutboxWorker,
+    idempotency_key,
+    rows_content_hash,
+)
 from services.email_notifications import (
-    build_prof_email_html,
+    build_email_message,
     clear_lock,
-    lock_is_active,
-    send_email_reminder,
-    set_last_reminder_month,
     set_lock,
 )
+from services.email_templates import render_prof_emails
+from services.notification_ledger import NotificationLedger, changed_rows, row_fingerprints, transition_fingerprint
 from ui.components import (
     niveau_from_statut,
     render_badged_table,
@@ -61,6 +86,24 @@ from ui.components import (
     statut_badge_text,
     style_table,
 )
+from utils.analytics import (
+    cached_hour_anomalies,
+    overload_cells,
+    project_completion,
+    workload_matrix,
+    workload_summary,
+)
+from utils.workbook_diff import (
+    CHANGE_ADDED,
+    CHANGE_MODIFIED,
+    CHANGE_REMOVED,
+    DELTA_PREFIX,
+    diff_summary,
+    diff_workbooks,
+)
+from utils.artifacts import ArtifactCache, artifact_key, bytes_digest, frame_signature
+from utils.obs_themes import cached_observation_themes
+from utils.snapshot_store import TREND_METRICS, SnapshotStore
 from utils.data_pipeline import (
     DEFAULT_THRESHOLDS,
     MOIS_COLS,
@@ -105,6 +148,92 @@ st.set_page_config(
 )
 
 
+@st.cache_resource(show_spinner=False)
+def snapshot_store(profile: str) -> SnapshotStore:
+    """Historique SQLite des versions du classeur, un fichier par profil."""
+    return SnapshotStore(Path(".streamlit") / f"snapshots_{profile}.sqlite3")
+
+
+@st.cache_resource(show_spinner=False)
+def export_cache(profile: str) -> ArtifactCache:
+    """Exports générés (Excel, PDF), réutilisés entre reruns, sessions et envoi DG."""
+    return ArtifactCache(
+        max_bytes=64 * 1024 * 1024,
+        disk_dir=Path(".streamlit") / "artifacts" / profile,
+        max_disk_bytes=256 * 1024 * 1024,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def notification_outbox(profile: str) -> Outbox:
+    """File d'envoi persistante des notifications (idempotente), un fichier par profil."""
+    return Outbox(Path(".streamlit") / f"outbox_{profile}.sqlite3")
+
+
+@st.cache_resource(show_spinner=False)
+def notification_ledger(profile: str) -> NotificationLedger:
+    """Empreintes des alertes déjà envoyées (mode « changements uniquement »)."""
+    return NotificationLedger(notification_outbox(profile).path)
+
+
+@st.cache_resource(show_spinner=False, validate=lambda w: w.is_alive())
+def outbox_worker(profile: str) -> OutboxWorker:
+    """Worker d'envoi en arrière-plan : survit aux sessions, reprend la file au redémarrage."""
+    return OutboxWorker(notification_outbox(profile), _get_smtp_config)
+
+
+@st.cache_resource(show_spinner=False, validate=executor_is_usable)
+def report_executor():
+    """Pool de processus partagé pour le rendu PDF (hors du GIL des sessions Streamlit)."""
+    return create_report_executor()
+
+
+@st.cache_resource(show_spinner=False)
+def ai_summary_cache(profile: str) -> ArtifactCache:
+    """Réponses du modèle par (modèle, prompt) : même données => pas de nouvel appel API."""
+    return ArtifactCache(
+        max_bytes=8 * 1024 * 1024,
+        disk_dir=Path(".streamlit") / "ai_cache" / profile,
+        max_disk_bytes=32 * 1024 * 1024,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def task_manager() -> TaskManager:
+    """Tâches longues (PDF, IA, envois) hors du thread du script : survivent aux reruns."""
+    return TaskManager(max_per_profile=int(safe_secret("TASKS_PER_PROFILE", 2)), result_ttl_s=1800)
+
+
+def show_task(task: Optional[Task]) -> None:
+    """
+    Progression d'une tâche de fond, rafraîchie chaque seconde avec un bouton
+    d'annulation ; la page est relancée à la fin pour afficher le résultat.
+    """
+    if task is None:
+        return
+    if task.status == TASK_FAILED:
+        st.error(f"{task.label} — erreur : {task.error}")
+        return
+    if task.status == TASK_CANCELLED:
+        st.info(f"🛑 {task.label} : annulé.")
+        return
+    if not task.active:
+        return
+
+    @st.fragment(run_every=1.0)
+    def _poll():
+        if not task.active:
+            st.rerun()
+        text = f"{TASK_LABELS[task.status]} — {task.label}" + (f" : {task.message}" if task.message else "")
+        st.progress(task.progress, text=text)
+        if task.output:
+            st.markdown(task.output)
+        if st.button("🛑 Annuler", key=f"cancel_{task.id}", disabled=task.cancel_requested.is_set()):
+            task_manager().cancel(task.id)
+
+    _poll()
+
+
 def safe_secret(key: str, default=""):
     try:
         return st.secrets.get(key, default)
@@ -129,57 +258,33 @@ def _get_smtp_config() -> dict:
     except ValueError as exc:
         raise RuntimeError("SMTP_PORT invalide (entier attendu).") from exc
 
+    # Optionnels : parallélisme et débit max (messages/s) des envois groupés
+    try:
+        smtp_workers = max(1, int(safe_secret("SMTP_WORKERS", 3)))
+        smtp_rate = max(0.0, float(safe_secret("SMTP_RATE", 2.0)))
+    except (TypeError, ValueError) as exc:
+        raise RuntimeError("SMTP_WORKERS / SMTP_RATE invalides (nombres attendus).") from exc
+
     return {
         "smtp_host": smtp_host,
         "smtp_port": smtp_port,
         "smtp_user": smtp_user,
         "smtp_pass": smtp_pass,
         "smtp_from": smtp_from,
+        "smtp_workers": smtp_workers,
+        "smtp_rate": smtp_rate,
     }
 
 
+# Colonnes dont le contenu identifie une notification enseignant (clé d'idempotence)
+NOTIF_CONTENT_COLS = ["Classe", "Semestre", "Type", "Matière", "VHP", "VHR", "Écart", "Statut_auto", "Raison_alerte", "_lot"]
+
+
 # ==============================
 # ✅ RESUME IA (OPENAI) — OBSERVATIONS
 # ==============================
 from openai import OpenAI
 
-def _build_obs_payload(df_obs: pd.DataFrame, max_lines: int = 300) -> str:
-    """
-    Transforme les observations en texte court, lisible par un LLM.
-    On limite le nombre de lignes pour éviter les prompts énormes.
-    """
-    cols_needed = ["Classe", "Matière", "Écart", "Statut_auto", "Observations"]
-    for c in cols_needed:
-        if c not in df_obs.columns:
-            df_obs[c] = ""
-
-    d = df_obs.copy()
-    d["Observations"] = (
-        d["Observations"].astype(str)
-        .replace({"nan": "", "None": ""})
-        .fillna("")
-        .str.strip()
-    )
-    d = d[d["Observations"].str.len() > 0].copy()
-
-    # Prioriser : retards les plus critiques d'abord
-    if "Écart" in d.columns:
-        d["Écart"] = pd.to_numeric(d["Écart"], errors="coerce").fillna(0)
-        d = d.sort_values("Écart", ascending=True)
-
-    d = d.head(max_lines)
-
-    lines = []
-    for _, r in d.iterrows():
-        lines.append(
-            f"- Classe: {str(r.get('Classe','')).strip()} | "
-            f"Matière: {str(r.get('Matière','')).strip()} | "
-            f"Statut: {str(r.get('Statut_auto','')).strip()} | "
-            f"Écart(h): {r.get('Écart', 0)} | "
-            f"Obs: {str(r.get('Observations','')).strip()}"
-        )
-    return "\n".join(lines)
-
 
 def summarize_observations_with_openai(
     df_filtered: pd.DataFrame,
@@ -187,57 +292,38 @@ def summarize_observations_with_openai(
     mois_max: str,
     cfg: dict,
     model: str = "gpt-4.1-mini",
-    max_lines: int = 300
+    max_lines: int = 300,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+    on_delta=None,
+    on_progress=None,
+    api_key: Optional[str] = None,
+    payload: Optional[ObsPayload] = None,
+    cache: Optional[ArtifactCache] = None,
 ) -> str:
     """
-    Retourne un résumé DG-ready des observations.
+    Retourne un résumé DG-ready des observations (dédupliquées, dans un budget
+    de tokens ; mis en cache par prompt et modèle ; map-reduce par classe au-delà
+    de quelques centaines de lignes). `api_key` est lue dans les secrets si
+    absente (à passer depuis le script quand l'appel se fait dans une tâche de
+    fond, comme `cache`) ; `payload` évite de reconstruire un payload déjà calculé.
     """
-    api_key = str(safe_secret("OPENAI_API_KEY", "")).strip()
+    if payload is None:
+        payload = build_obs_payload(df_filtered, max_lines=max_lines, token_budget=token_budget)
+    lines = payload.lines
+    if not lines:
+        return EMPTY_SUMMARY
+
+    if api_key is None:
+        api_key = str(safe_secret("OPENAI_API_KEY", "")).strip()
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY manquant dans .streamlit/secrets.toml")
 
-    client = OpenAI(api_key=api_key)
-
-    # garder uniquement observations
-    df_obs = df_filtered.copy()
-    if "Observations" not in df_obs.columns:
-        df_obs["Observations"] = ""
-
-    payload = _build_obs_payload(df_obs, max_lines=max_lines)
-    if not payload.strip():
-        return "Aucune observation renseignée sur la période sélectionnée."
-
-    system = (
-        "Tu es un assistant de pilotage académique. "
-        "Tu dois produire un résumé professionnel, clair, actionnable, style Direction Générale. "
-        "Ne divulgue aucune donnée sensible (emails, infos perso)."
-    )
-
-    user = f"""
-Contexte:
-- Département: {cfg.get('department_long','')}
-- Période: {mois_min} → {mois_max}
-
-Données (observations consolidées):
-{payload}
-
-Tâche:
-1) Résumé exécutif (5–8 lignes)
-2) Points critiques récurrents (5–10 puces)
-3) Actions recommandées (3–7 actions)
-4) Synthèse par classe (1–2 lignes par classe max)
-Format: Markdown.
-""".strip()
-
-    # API Responses (recommandée)
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
+    if cache is None:
+        cache = ai_summary_cache(cfg["dept_code"])
+    summarizer = ObservationSummarizer(OpenAI(api_key=api_key), model=model, cache=cache)
+    return summarizer.summarize(
+        lines, cfg.get("department_long", ""), mois_min, mois_max, on_delta=on_delta, on_progress=on_progress
     )
-    return resp.output_text
 
 
 
@@ -1007,523 +1093,7 @@ unsafe_allow_html=True
 
 # Paramètres + utilitaires déplacés dans `utils/data_pipeline.py`
 
-# -----------------------------
-# PDF (ReportLab)
-# -----------------------------
-def build_pdf_report(
-    df: pd.DataFrame,
-    title: str,
-    mois_couverts: List[str],
-    thresholds: dict,
-    logo_bytes: Optional[bytes] = None,
-    author_name: str = "",
-    assistant_name: str = "",
-    department: str = "",
-    institution: str = "",
-) -> bytes:
-    styles = getSampleStyleSheet()
-    H1 = ParagraphStyle("H1", parent=styles["Heading1"], fontSize=16, spaceAfter=10)
-    H2 = ParagraphStyle("H2", parent=styles["Heading2"], fontSize=12, spaceAfter=6)
-    P  = ParagraphStyle("P", parent=styles["BodyText"], fontSize=9, leading=12)
-    Small = ParagraphStyle("Small", parent=styles["BodyText"], fontSize=8, leading=10)
-
-    out = io.BytesIO()
-    doc = SimpleDocTemplate(out, pagesize=A4, leftMargin=1.6*cm, rightMargin=1.6*cm, topMargin=1.4*cm, bottomMargin=1.4*cm)
-
-    story = []
-
-    # Couverture
-    # -----------------------------
-    # COUVERTURE PRO (HEADER OFFICIEL)
-    # -----------------------------
-    now_dt = dt.datetime.now()
-    date_gen = now_dt.strftime("%d/%m/%Y %H:%M")
-    periode_str = " – ".join(mois_couverts) if mois_couverts else "—"
-
-    # Tableau en-tête (logo + infos)
-    logo_cell = ""
-    if logo_bytes:
-        try:
-            img = RLImage(io.BytesIO(logo_bytes))
-            img.drawHeight = 2.2*cm
-            img.drawWidth  = 2.2*cm
-            logo_cell = img
-        except Exception:
-            logo_cell = ""
-
-    header_rows = [
-        [
-            logo_cell,
-            Paragraph(
-                f"""
-                <b>{institution}</b><br/>
-                {department}<br/>
-                <font size="9" color="#475569">
-                Rapport officiel de suivi des enseignements<br/>
-                </font>
-                """,
-                P
-            ),
-            Paragraph(
-                f"""
-                <b>Date :</b> {date_gen}<br/>
-                <b>Période :</b> {periode_str}<br/>
-                <b>Référence :</b> {department.split('(')[-1].replace(')','').strip() or 'DEPT'}-SUIVI-{now_dt.strftime("%Y%m")}
-                """,
-                P
-            )
-        ]
-    ]
-
-    header_tbl = Table(header_rows, colWidths=[2.6*cm, 9.4*cm, 4.0*cm])
-    header_tbl.setStyle(TableStyle([
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ("ALIGN", (0,0), (0,0), "LEFT"),
-        ("ALIGN", (2,0), (2,0), "RIGHT"),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-    ]))
-
-    story.append(header_tbl)
-
-    # Bandeau titre (style "document officiel")
-    banner = Table(
-        [[Paragraph(f"<b>{title}</b>", ParagraphStyle("Banner", parent=H1, textColor=colors.white, fontSize=14))]],
-        colWidths=[15.9*cm]
-    )
-    banner.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#0B3D91")),
-        ("LEFTPADDING", (0,0), (-1,-1), 10),
-        ("RIGHTPADDING", (0,0), (-1,-1), 10),
-        ("TOPPADDING", (0,0), (-1,-1), 8),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-    ]))
-    story.append(banner)
-
-    story.append(Spacer(1, 10))
-
-    # Bloc signatures (Auteur + Assistante)
-    sign_tbl = Table(
-        [[
-            Paragraph(
-                f"<b>Auteur :</b> {author_name}<br/>"
-                f"<font size='8' color='#475569'>{CFG['author_role']}</font>",
-                P,
-            ),
-            Paragraph(
-                f"<b>{CFG['assistant_label']} :</b> {assistant_name}<br/>"
-                f"<font size='8' color='#475569'>{CFG['assistant_role']}</font>",
-                P,
-            ),
-        ]],
-        colWidths=[7.9*cm, 8.0*cm]
-    )
-    sign_tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#F6F8FC")),
-        ("BOX", (0,0), (-1,-1), 0.4, colors.HexColor("#E3E8F0")),
-        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.HexColor("#E3E8F0")),
-        ("LEFTPADDING", (0,0), (-1,-1), 10),
-        ("RIGHTPADDING", (0,0), (-1,-1), 10),
-        ("TOPPADDING", (0,0), (-1,-1), 8),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-    ]))
-    story.append(sign_tbl)
-
-    story.append(Spacer(1, 10))
-
-
-    # KPIs globaux
-    total = len(df)
-    taux_moy = float(df["Taux"].mean() * 100) if total else 0.0
-    nb_term = int((df["Statut_auto"] == "Terminé").sum())
-    nb_enc  = int((df["Statut_auto"] == "En cours").sum())
-    nb_nd   = int((df["Statut_auto"] == "Non démarré").sum())
-
-    kpi_table = Table(
-        [
-            ["Matières", "Taux moyen", "Terminées", "En cours", "Non démarrées"],
-            [str(total), f"{taux_moy:.1f}%", str(nb_term), str(nb_enc), str(nb_nd)],
-        ],
-        colWidths=[3.0*cm, 3.0*cm, 3.0*cm, 3.0*cm, 3.4*cm],
-    )
-    kpi_table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#0B3D91")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("ALIGN", (0,0), (-1,-1), "CENTER"),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-        ("BACKGROUND", (0,1), (-1,1), colors.whitesmoke),
-    ]))
-    story.append(kpi_table)
-    story.append(Spacer(1, 12))
-
-    # Alertes synthèse
-    story.append(Paragraph("Synthèse – alertes clés", H2))
-    crit = df[(df["Écart"] <= thresholds["ecart_critique"]) | (df["Statut_auto"] == "Non démarré")].copy()
-    if crit.empty:
-        story.append(Paragraph("Aucune alerte critique détectée selon les seuils actuels.", P))
-    else:
-        # Top 12 alertes
-        crit = crit.sort_values(["Classe", "Écart"])
-        rows = [["Classe", "Matière", "VHP", "VHR", "Écart", "Statut"]]
-        for _, r in crit.head(12).iterrows():
-            rows.append([str(r["Classe"]), str(r["Matière"])[:45], f"{r['VHP']:.0f}", f"{r['VHR']:.0f}", f"{r['Écart']:.0f}", str(r["Statut_auto"])])
-        t = Table(rows, colWidths=[2.4*cm, 8.2*cm, 1.3*cm, 1.3*cm, 1.3*cm, 2.6*cm])
-        t.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#F0F3F8")),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("FONTSIZE", (0,0), (-1,-1), 8),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
-            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ]))
-        story.append(t)
-        story.append(Paragraph("NB : liste limitée aux 12 premières alertes (tri par écart).", Small))
-        
-    story.append(PageBreak())
-
-    # Détail par classe
-    story.append(Paragraph("Détail par classe", H1))
-    for classe, g in df.groupby("Classe"):
-        story.append(Paragraph(f"Classe : {classe}", H2))
-
-        # KPIs classe
-        total_c = len(g)
-        taux_c = float(g["Taux"].mean() * 100) if total_c else 0.0
-        nd_c = int((g["Statut_auto"] == "Non démarré").sum())
-        enc_c = int((g["Statut_auto"] == "En cours").sum())
-        term_c = int((g["Statut_auto"] == "Terminé").sum())
-        story.append(Paragraph(f"Matières: <b>{total_c}</b> — Taux moyen: <b>{taux_c:.1f}%</b> — Terminé: <b>{term_c}</b> — En cours: <b>{enc_c}</b> — Non démarré: <b>{nd_c}</b>", P))
-        story.append(Spacer(1, 6))
-
-        # Table compacte (top retards)
-        gg = g.sort_values("Écart").copy()
-        rows = [["Matière", "VHP", "VHR", "Écart", "Taux", "Statut"]]
-        for _, r in gg.head(20).iterrows():
-            rows.append([str(r["Matière"])[:45], f"{r['VHP']:.0f}", f"{r['VHR']:.0f}", f"{r['Écart']:.0f}", f"{(r['Taux']*100):.0f}%", str(r["Statut_auto"])])
-        t = Table(rows, colWidths=[8.6*cm, 1.3*cm, 1.3*cm, 1.3*cm, 1.3*cm, 2.2*cm])
-        t.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#0B3D91")),
-            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-            ("FONTSIZE", (0,0), (-1,-1), 8),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
-            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ]))
-        story.append(t)
-        story.append(Spacer(1, 8))
-
-    def _footer(canvas, doc_):
-        canvas.saveState()
-        canvas.setFont("Helvetica", 8)
-        canvas.setFillColor(colors.HexColor("#475569"))
-        canvas.drawString(1.6*cm, 1.0*cm, f"{department} — Rapport de suivi des enseignements")
-        canvas.drawRightString(19.4*cm, 1.0*cm, f"Généré le {dt.datetime.now().strftime('%d/%m/%Y %H:%M')}  |  Page {doc_.page}")
-        canvas.restoreState()
-
-    doc.build(story, onFirstPage=_footer, onLaterPages=_footer)
-
-    return out.getvalue()
-def build_pdf_observations_report(
-    df: pd.DataFrame,
-    title: str,
-    mois_couverts: List[str],
-    logo_bytes: Optional[bytes] = None,
-    author_name: str = "",
-    assistant_name: str = "",
-    department: str = "",
-    institution: str = "",
-    max_rows_per_class: int = 9999,  # mets 18 si tu veux limiter
-) -> bytes:
-    styles = getSampleStyleSheet()
-    H1 = ParagraphStyle("H1", parent=styles["Heading1"], fontSize=16, spaceAfter=10)
-    H2 = ParagraphStyle("H2", parent=styles["Heading2"], fontSize=12, spaceAfter=6)
-    P  = ParagraphStyle("P", parent=styles["BodyText"], fontSize=9, leading=12)
-    Small = ParagraphStyle("Small", parent=styles["BodyText"], fontSize=8, leading=10)
-
-    # =========================================================
-    # ✅ WRAP PDF (Observations) — Anti chevauchement + texte long
-    # =========================================================
-    from reportlab.lib.enums import TA_LEFT
-
-    CELL = ParagraphStyle(
-        "CELL_OBS",
-        parent=styles["BodyText"],
-        fontSize=8.2,
-        leading=10.5,
-        spaceBefore=0,
-        spaceAfter=0,
-        alignment=TA_LEFT,
-        wordWrap="CJK",   # wrap robuste (mots longs)
-    )
-
-    HEAD = ParagraphStyle(
-        "HEAD_OBS",
-        parent=styles["BodyText"],
-        fontSize=8.4,
-        leading=10,
-        spaceBefore=0,
-        spaceAfter=0,
-        alignment=TA_LEFT,
-        textColor=colors.white,
-    )
-
-    def _esc(x) -> str:
-        s = "" if x is None else str(x)
-        return (
-            s.replace("&", "&amp;")
-             .replace("<", "&lt;")
-             .replace(">", "&gt;")
-        )
-
-    def Pcell(x, allow_br: bool = True) -> Paragraph:
-        """
-        Cellule PDF WRAP : support retours ligne via <br/>.
-        """
-        s = _esc(x).strip()
-        if allow_br:
-            s = s.replace("\n", "<br/>")
-        return Paragraph(s if s else "—", CELL)
-
-    out = io.BytesIO()
-    doc = SimpleDocTemplate(
-        out,
-        pagesize=A4,
-        leftMargin=1.6*cm, rightMargin=1.6*cm,
-        topMargin=1.4*cm, bottomMargin=1.4*cm
-    )
-
-    story = []
-
-    # -----------------------------
-    # Filtrage : uniquement lignes avec Observations
-    # -----------------------------
-    d = df.copy()
-    if "Observations" not in d.columns:
-        d["Observations"] = ""
-
-    d["Observations"] = (
-        d["Observations"].astype(str)
-        .replace({"nan": "", "None": ""})
-        .fillna("")
-        .str.replace("\r", "", regex=False)  # ✅ garder \n (retours ligne)
-        .str.strip()
-    )
-
-    d = d[d["Observations"].str.len() > 0].copy()
-
-    now_dt = dt.datetime.now()
-    date_gen = now_dt.strftime("%d/%m/%Y %H:%M")
-    periode_str = " – ".join(mois_couverts) if mois_couverts else "—"
-
-    # -----------------------------
-    # Couverture officielle (même style que ton PDF principal)
-    # -----------------------------
-    logo_cell = ""
-    if logo_bytes:
-        try:
-            img = RLImage(io.BytesIO(logo_bytes))
-            img.drawHeight = 2.2*cm
-            img.drawWidth  = 2.2*cm
-            logo_cell = img
-        except Exception:
-            logo_cell = ""
-
-    header_rows = [[
-        logo_cell,
-        Paragraph(
-            f"""
-            <b>{institution}</b><br/>
-            {department}<br/>
-            <font size="9" color="#475569">
-            Rapport officiel — Suivi des enseignements (Observations)<br/>
-            </font>
-            """,
-            P
-        ),
-        Paragraph(
-            f"""
-            <b>Date :</b> {date_gen}<br/>
-            <b>Période :</b> {periode_str}<br/>
-            <b>Référence :</b> {department.split('(')[-1].replace(')','').strip() or 'DEPT'}-OBS-{now_dt.strftime("%Y%m")}
-            """,
-            P
-        )
-    ]]
-
-    header_tbl = Table(header_rows, colWidths=[2.6*cm, 9.4*cm, 4.0*cm])
-    header_tbl.setStyle(TableStyle([
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-        ("ALIGN", (0,0), (0,0), "LEFT"),
-        ("ALIGN", (2,0), (2,0), "RIGHT"),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-    ]))
-    story.append(header_tbl)
-
-    banner = Table(
-        [[Paragraph(f"<b>{title}</b>", ParagraphStyle("Banner", parent=H1, textColor=colors.white, fontSize=14))]],
-        colWidths=[15.9*cm]
-    )
-    banner.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#0B3D91")),
-        ("LEFTPADDING", (0,0), (-1,-1), 10),
-        ("RIGHTPADDING", (0,0), (-1,-1), 10),
-        ("TOPPADDING", (0,0), (-1,-1), 8),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-        ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
-    ]))
-    story.append(banner)
-    story.append(Spacer(1, 10))
-
-    sign_tbl = Table(
-        [[
-            Paragraph(
-                f"<b>Auteur :</b> {author_name}<br/>"
-                f"<font size='8' color='#475569'>{CFG['author_role']}</font>",
-                P,
-            ),
-            Paragraph(
-                f"<b>{CFG['assistant_label']} :</b> {assistant_name}<br/>"
-                f"<font size='8' color='#475569'>{CFG['assistant_role']}</font>",
-                P,
-            ),
-        ]],
-        colWidths=[7.9*cm, 8.0*cm]
-    )
-    sign_tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#F6F8FC")),
-        ("BOX", (0,0), (-1,-1), 0.4, colors.HexColor("#E3E8F0")),
-        ("INNERGRID", (0,0), (-1,-1), 0.25, colors.HexColor("#E3E8F0")),
-        ("LEFTPADDING", (0,0), (-1,-1), 10),
-        ("RIGHTPADDING", (0,0), (-1,-1), 10),
-        ("TOPPADDING", (0,0), (-1,-1), 8),
-        ("BOTTOMPADDING", (0,0), (-1,-1), 8),
-    ]))
-    story.append(sign_tbl)
-    story.append(Spacer(1, 12))
-
-    # -----------------------------
-    # Si aucune observation
-    # -----------------------------
-    if d.empty:
-        story.append(Paragraph("Aucune observation renseignée sur la période sélectionnée.", P))
-        story.append(Paragraph("Le suivi des enseignements par observations ne peut pas être établi sans commentaires.", Small))
-
-        def _footer(canvas, doc_):
-            canvas.saveState()
-            canvas.setFont("Helvetica", 8)
-            canvas.setFillColor(colors.HexColor("#475569"))
-            canvas.drawString(1.6*cm, 1.0*cm, f"{department} — Suivi des enseignements (Observations)")
-            canvas.drawRightString(19.4*cm, 1.0*cm, f"Généré le {dt.datetime.now().strftime('%d/%m/%Y %H:%M')}  |  Page {doc_.page}")
-            canvas.restoreState()
-
-        doc.build(story, onFirstPage=_footer, onLaterPages=_footer)
-        return out.getvalue()
-
-    # -----------------------------
-    # Synthèse (KPIs)
-    # -----------------------------
-    if "Classe" not in d.columns:
-        d["Classe"] = "—"
-    if "Responsable" not in d.columns:
-        d["Responsable"] = "—"
-
-    total_obs = len(d)
-    nb_classes = int(d["Classe"].nunique())
-    nb_resp = int(d["Responsable"].nunique())
-
-    kpi_table = Table(
-        [
-            ["Modules avec observation", "Classes concernées", "Responsables concernés"],
-            [str(total_obs), str(nb_classes), str(nb_resp)],
-        ],
-        colWidths=[5.2*cm, 5.2*cm, 5.5*cm],
-    )
-    kpi_table.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#0B3D91")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("ALIGN", (0,0), (-1,-1), "CENTER"),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-        ("BACKGROUND", (0,1), (-1,1), colors.whitesmoke),
-    ]))
-    story.append(kpi_table)
-    story.append(Spacer(1, 10))
-    story.append(Paragraph("Détail — Observations par classe", H1))
-
-    # -----------------------------
-    # Détail par classe
-    # -----------------------------
-    sort_cols = ["Classe"]
-    if "Écart" in d.columns:
-        sort_cols += ["Écart"]
-    d = d.sort_values(sort_cols, ascending=[True] + ([True] if "Écart" in d.columns else []))
-
-    for classe, g in d.groupby("Classe"):
-        story.append(Paragraph(f"Classe : {classe}", H2))
-
-        gg = g.copy()
-        if max_rows_per_class and max_rows_per_class > 0:
-            gg = gg.head(max_rows_per_class)
-
-        # ✅ Table WRAP : Paragraph dans toutes les cellules texte
-        rows = [[
-            Paragraph("<b>Sem</b>", HEAD),
-            Paragraph("<b>Type</b>", HEAD),
-            Paragraph("<b>Matière</b>", HEAD),
-            Paragraph("<b>Responsable</b>", HEAD),
-            Paragraph("<b>Observation</b>", HEAD),
-        ]]
-
-        for _, r in gg.iterrows():
-            sem  = r.get("Semestre", "")
-            typ  = r.get("Type", "")
-            mat  = r.get("Matière", "")
-            resp = r.get("Responsable", "")
-            obs  = r.get("Observations", "")  # ✅ PAS TRONQUÉ
-
-            rows.append([
-                Pcell(sem,  allow_br=False),
-                Pcell(typ,  allow_br=False),
-                Pcell(mat,  allow_br=True),
-                Pcell(resp, allow_br=True),
-                Pcell(obs,  allow_br=True),
-            ])
-
-        t = Table(
-            rows,
-            colWidths=[1.0*cm, 1.5*cm, 4.0*cm, 3.1*cm, 6.3*cm],  # total ~ 15.9cm
-            repeatRows=1,
-            splitByRow=1,  # ✅ découpage multi-pages
-        )
-
-        t.setStyle(TableStyle([
-            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#0B3D91")),
-            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
 
-            ("FONTSIZE", (0,0), (-1,-1), 8),
-            ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D7DEE8")),
-            ("VALIGN", (0,0), (-1,-1), "TOP"),
-
-            ("LEFTPADDING", (0,0), (-1,-1), 6),
-            ("RIGHTPADDING", (0,0), (-1,-1), 6),
-            ("TOPPADDING", (0,0), (-1,-1), 4),
-            ("BOTTOMPADDING", (0,0), (-1,-1), 4),
-        ]))
-
-        story.append(t)
-        story.append(Spacer(1, 10))
-
-    def _footer(canvas, doc_):
-        canvas.saveState()
-        canvas.setFont("Helvetica", 8)
-        canvas.setFillColor(colors.HexColor("#475569"))
-        canvas.drawString(1.6*cm, 1.0*cm, f"{department} — Suivi des enseignements (Observations)")
-        canvas.drawRightString(19.4*cm, 1.0*cm, f"Généré le {dt.datetime.now().strftime('%d/%m/%Y %H:%M')}  |  Page {doc_.page}")
-        canvas.restoreState()
-
-    doc.build(story, onFirstPage=_footer, onLaterPages=_footer)
-    return out.getvalue()
 
 with st.sidebar:
     LOGO_JPG = Path(CFG["logo_path"])
@@ -1859,30 +1429,39 @@ with st.sidebar:
 
 
 
-    def do_send(attachments=None):
-        # 1) lock anti double-envoi
-        set_lock(month_key)
-
+    def do_send(outbox: Outbox, worker: OutboxWorker, sender: str, attachments=None, content_hash=""):
+        """
+        Met le rappel DG en file (clé : mois + destinataires + contenu des pièces
+        jointes) et attend son envoi par le worker. Un second clic sur le même
+        contenu ne renvoie rien. Retourne la ligne de statut du message, ou None
+        si un autre envoi du mois est déjà en cours (verrou partagé entre sessions
+        et processus). `outbox`, `worker` et `sender` sont résolus dans le thread
+        du script (appel depuis une tâche de fond).
+        """
+        owner = set_lock(month_key, profile=CFG["dept_code"])
+        if owner is None:
+            return None
+        sent = False
         try:
-            cfg_smtp = _get_smtp_config()
-            send_email_reminder(
-                smtp_host=cfg_smtp["smtp_host"],
-                smtp_port=cfg_smtp["smtp_port"],
-                smtp_user=cfg_smtp["smtp_user"],
-                smtp_pass=cfg_smtp["smtp_pass"],
-                sender=cfg_smtp["smtp_from"],
-                recipients=recipients,
-                subject=subject,
-                body_text=body_text,
-                body_html=body_html,
-                attachments=attachments or [],
-            )
-            # 2) marquer envoyé pour le mois
-            set_last_reminder_month(month_key)
-
+            status = _enqueue_dg_reminder(outbox, worker, sender, attachments, content_hash)
+            sent = status["status"] == STATUS_SENT
+            return status
         finally:
-            # 3) libérer le lock même en cas d'erreur
-            clear_lock()
+            clear_lock(month_key, owner, profile=CFG["dept_code"], sent=sent)
+
+    def _enqueue_dg_reminder(outbox: Outbox, worker: OutboxWorker, sender: str, attachments, content_hash):
+        msg = build_email_message(
+            sender=sender,
+            recipients=recipients,
+            subject=subject,
+            body_text=body_text,
+            body_html=body_html,
+            attachments=attachments or [],
+        )
+        key = idempotency_key(month_key, "rappel_dg", ",".join(sorted(recipients)), content_hash)
+        outbox.enqueue("dg", month_key, [(key, ", ".join(recipients), "DG/DGE", msg)], lot="rappel_dg")
+        worker.wake()
+        return worker.wait_for([key], timeout_s=120).iloc[0]
 
     # Le bouton d'envoi est dans le tab Export (où les fichiers sont disponibles)
     st.caption("📩 Le bouton d'envoi au DG se trouve en bas de l'onglet **Exports**.")
@@ -1955,6 +1534,9 @@ except ValueError as _exc:
     st.error(f"❌ Fichier Excel invalide : {_exc}")
     st.stop()
 
+# Empreinte du classeur : clé des caches par version de données
+dataset_hash = hashlib.sha1(file_bytes).hexdigest()
+
 # Auto-refresh uniquement en mode URL
 # if import_mode == "URL (auto)" and auto_refresh:
 #     time.sleep(refresh_sec)
@@ -1967,6 +1549,22 @@ if df.empty:
         st.json(quality)
     st.stop()
 
+# Historique : chaque version distincte du classeur est enregistrée une seule fois
+try:
+    _store = snapshot_store(CFG["dept_code"])
+    if _store.record(dataset_hash, df, source=source_label or ""):
+        _store.compact()
+except Exception as _exc:
+    _store = None
+    st.caption(f"⚠️ Historique indisponible : {_exc}")
+
+# Reprendre les notifications restées en file (redémarrage, session fermée pendant l'envoi)
+try:
+    if notification_outbox(CFG["dept_code"]).pending_count():
+        outbox_worker(CFG["dept_code"]).wake()
+except Exception as _exc:
+    st.caption(f"⚠️ File d'envoi indisponible : {_exc}")
+
 # Appliquer période couverte (recalcul VHR/Taux sur sous-ensemble)
 df_period = df.copy()
 df_period["VHR"] = df_period[mois_couverts].sum(axis=1)
@@ -2075,6 +1673,9 @@ for _col in ["Type", "Semestre", "Responsable", "Email", "Observations", "Début
     if _col not in filtered.columns:
         filtered[_col] = ""
 
+# Projection de fin (rythme récent jusqu'au dernier mois de la période)
+filtered = filtered.join(project_completion(filtered, asof=mois_max))
+
 
 # ✅ Classes réellement disponibles après filtres (important pour l'onglet "Par classe")
 classes_filtered = sorted(filtered["Classe"].dropna().unique().tolist())
@@ -2086,8 +1687,8 @@ if not classes_filtered:
 # -----------------------------
 # Onglets (Ultra)
 # -----------------------------
-tab_overview, tab_classes, tab_matieres, tab_enseignants, tab_mensuel, tab_alertes, tab_qualite, tab_export = st.tabs(
-    ["Vue globale", "Par classe", "Par matière", "Par enseignant", "Analyse mensuelle", "Alertes", "Qualité des données", "Exports"]
+tab_overview, tab_classes, tab_matieres, tab_enseignants, tab_mensuel, tab_alertes, tab_qualite, tab_changes, tab_history, tab_export = st.tabs(
+    ["Vue globale", "Par classe", "Par matière", "Par enseignant", "Analyse mensuelle", "Alertes", "Qualité des données", "Changements", "Historique", "Exports"]
 )
 
 
@@ -2265,14 +1866,14 @@ with tab_classes:
 
     st.write(f"### Retards (Top 15) — {cls1}")
     tA = A.sort_values("Écart").head(15)[
-    ["Matière","VHP","VHR","Écart","Taux","Statut_auto","Observations"]
+    ["Matière","VHP","VHR","Écart","Taux","Statut_auto","Rythme_h_mois","Fin_projetée","Observations"]
     ].copy()
 
     tA["Taux (%)"] = (tA["Taux"] * 100).round(1)
     tA["Statut"] = tA["Statut_auto"].apply(statut_badge_text)
 
     st.dataframe(
-        tA[["Matière","VHP","VHR","Écart","Taux (%)","Statut","Observations"]],
+        tA[["Matière","VHP","VHR","Écart","Taux (%)","Statut","Rythme_h_mois","Fin_projetée","Observations"]],
         use_container_width=True,
         column_config={
             "Taux (%)": st.column_config.ProgressColumn(
@@ -2282,6 +1883,8 @@ with tab_classes:
             "VHP": st.column_config.NumberColumn("VHP", format="%.0f"),
             "VHR": st.column_config.NumberColumn("VHR", format="%.0f"),
             "Statut": st.column_config.TextColumn("Statut"),
+            "Rythme_h_mois": st.column_config.NumberColumn("Rythme (h/mois)", format="%.1f"),
+            "Fin_projetée": st.column_config.TextColumn("Fin projetée"),
         }
     )
 
@@ -2289,14 +1892,14 @@ with tab_classes:
 
     st.write(f"### Retards (Top 15) — {cls2}")
     tB = B.sort_values("Écart").head(15)[
-    ["Matière","VHP","VHR","Écart","Taux","Statut_auto","Observations"]
+    ["Matière","VHP","VHR","Écart","Taux","Statut_auto","Rythme_h_mois","Fin_projetée","Observations"]
     ].copy()
 
     tB["Taux (%)"] = (tB["Taux"] * 100).round(1)
     tB["Statut"] = tB["Statut_auto"].apply(statut_badge_text)
 
     st.dataframe(
-        tB[["Matière","VHP","VHR","Écart","Taux (%)","Statut","Observations"]],
+        tB[["Matière","VHP","VHR","Écart","Taux (%)","Statut","Rythme_h_mois","Fin_projetée","Observations"]],
         use_container_width=True,
         column_config={
             "Taux (%)": st.column_config.ProgressColumn(
@@ -2306,6 +1909,8 @@ with tab_classes:
             "VHP": st.column_config.NumberColumn("VHP", format="%.0f"),
             "VHR": st.column_config.NumberColumn("VHR", format="%.0f"),
             "Statut": st.column_config.TextColumn("Statut"),
+            "Rythme_h_mois": st.column_config.NumberColumn("Rythme (h/mois)", format="%.1f"),
+            "Fin_projetée": st.column_config.TextColumn("Fin projetée"),
         }
     )
 
@@ -2437,6 +2042,82 @@ with tab_enseignants:
             }
         )
 
+        st.divider()
+
+        # 5) Calendrier de charge (Responsable × Mois)
+        st.write("### Calendrier de charge — Responsable × Mois")
+
+        cc1, cc2 = st.columns(2)
+        with cc1:
+            seuil_charge = st.slider(
+                "Seuil de surcharge (heures / mois)",
+                5, 200,
+                int(DEFAULT_THRESHOLDS["charge_mensuelle_max"]),
+                5,
+                key="seuil_charge_mensuelle"
+            )
+        with cc2:
+            top_charge = st.slider("Top enseignants les plus chargés", 5, 100, 20, 5, key="top_charge_ens")
+
+        charge_mois = workload_matrix(tmp, mois_couverts)
+        charge_synth = workload_summary(charge_mois, seuil_charge)
+
+        nb_surcharge = int((charge_synth["Nb_mois_surcharge"] > 0).sum()) if not charge_synth.empty else 0
+        st.caption(
+            f"📌 {len(charge_mois)} enseignant(s) • {nb_surcharge} avec au moins un mois > {seuil_charge} h"
+        )
+
+        top_synth = charge_synth.head(top_charge)
+        st.dataframe(
+            top_synth,
+            use_container_width=True,
+            column_config={
+                "Total_h": st.column_config.NumberColumn("Total (h)", format="%.0f"),
+                "Pic_h": st.column_config.NumberColumn("Pic (h)", format="%.0f"),
+                "Mois_pic": st.column_config.TextColumn("Mois du pic"),
+                "Mois_surcharge": st.column_config.TextColumn("Mois en surcharge"),
+                "Nb_mois_surcharge": st.column_config.NumberColumn("Nb mois surcharge", format="%d"),
+            }
+        )
+
+        if not top_synth.empty:
+            top_mat = charge_mois.loc[top_synth["Responsable"]]
+            fig = px.imshow(
+                top_mat.values,
+                x=top_mat.columns,
+                y=top_mat.index,
+                aspect="auto",
+                color_continuous_scale="Blues",
+                title=f"Heatmap — charge mensuelle (Top {len(top_mat)})"
+            )
+            fig.update_layout(height=max(320, 26 * len(top_mat)), margin=dict(l=10, r=10, t=60, b=10))
+            st.plotly_chart(fig, use_container_width=True)
+
+        st.write("#### Mois en surcharge")
+        surcharges = overload_cells(charge_mois, seuil_charge)
+        if surcharges.empty:
+            st.success(f"Aucun mois au-dessus de {seuil_charge} h avec les filtres actuels ✅")
+        else:
+            st.dataframe(
+                surcharges,
+                use_container_width=True,
+                height=260,
+                column_config={"Heures": st.column_config.NumberColumn("Heures", format="%.0f")}
+            )
+
+        charge_export = charge_mois.reset_index().merge(
+            charge_synth[["Responsable", "Total_h", "Pic_h", "Nb_mois_surcharge"]],
+            on="Responsable",
+            how="left",
+        )
+        st.download_button(
+            "⬇️ Télécharger le calendrier de charge (CSV)",
+            data=charge_export.to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"{export_prefix}_charge_mensuelle.csv",
+            mime="text/csv",
+            key="dl_charge_csv"
+        )
+
 
 # ====== ANALYSE MENSUELLE ======
 with tab_mensuel:
@@ -2510,6 +2191,8 @@ with tab_alertes:
         tmp["Début_dt"].isna() | (tmp["Début_dt"] <= today_dt)
     )
     tmp["Alerte_fin_depassee"] = (tmp["Statut_auto"] != "Terminé") & tmp["Fin_dt"].notna() & (tmp["Fin_dt"] < today_dt)
+    # Fin prévue pas encore atteinte mais rythme actuel insuffisant pour la tenir
+    tmp["Alerte_projection"] = tmp["Projection_hors_délai"].astype(bool) & ~tmp["Alerte_fin_depassee"]
 
     def raison_alerte(row):
         reasons = []
@@ -2519,16 +2202,19 @@ with tab_alertes:
             reasons.append("🔻 Retard critique")
         if bool(row.get("Alerte_non_demarre", False)):
             reasons.append("🛑 Non démarré")
+        if bool(row.get("Alerte_projection", False)):
+            reasons.append("📉 Fin projetée hors délai")
         return " • ".join(reasons)
 
     tmp["Raison_alerte"] = tmp.apply(raison_alerte, axis=1)
     tmp["En_alerte"] = tmp["Raison_alerte"].ne("")
 
-    # Priorité (fin dépassée > retard critique > non démarré) puis écart
+    # Priorité (fin dépassée > retard critique > non démarré / projection) puis écart
     tmp["_prio"] = (
         tmp["Alerte_fin_depassee"].astype(int) * 3
         + tmp["Alerte_retard_critique"].astype(int) * 2
         + tmp["Alerte_non_demarre"].astype(int) * 1
+        + tmp["Alerte_projection"].astype(int) * 1
     )
     tmp = tmp.sort_values(["_prio", "Écart"], ascending=[False, True])
 
@@ -2537,14 +2223,16 @@ with tab_alertes:
     nb_fin = int(tmp["Alerte_fin_depassee"].sum())
     nb_ret = int(tmp["Alerte_retard_critique"].sum())
     nb_nd  = int(tmp["Alerte_non_demarre"].sum())
+    nb_proj = int(tmp["Alerte_projection"].sum())
 
     st.markdown(
         f"""
-        <div style="display:grid;grid-template-columns:repeat(4,minmax(0,1fr));gap:12px;margin:10px 0 4px 0;">
+        <div style="display:grid;grid-template-columns:repeat(5,minmax(0,1fr));gap:12px;margin:10px 0 4px 0;">
           <div class="kpi kpi-bad"><div class="kpi-title">Total alertes</div><div class="kpi-value">{nb_alertes}</div></div>
           <div class="kpi kpi-bad"><div class="kpi-title">Fin dépassée</div><div class="kpi-value">{nb_fin}</div></div>
           <div class="kpi kpi-bad"><div class="kpi-title">Retards critiques</div><div class="kpi-value">{nb_ret}</div></div>
           <div class="kpi kpi-warn"><div class="kpi-title">Non démarrés</div><div class="kpi-value">{nb_nd}</div></div>
+          <div class="kpi kpi-warn"><div class="kpi-title">Fin projetée hors délai</div><div class="kpi-value">{nb_proj}</div></div>
         </div>
         """,
         unsafe_allow_html=True
@@ -2564,14 +2252,14 @@ with tab_alertes:
 
         alerts = tmp.loc[
             tmp["En_alerte"],
-            ["Classe","Matière","VHP","VHR","Écart","Taux","Statut_auto","Raison_alerte","Observations"]
+            ["Classe","Matière","VHP","VHR","Écart","Taux","Statut_auto","Rythme_h_mois","Fin_projetée","Fin prévue","Raison_alerte","Observations"]
         ].copy()
 
         alerts["Taux (%)"] = (alerts["Taux"] * 100).round(1)
         alerts["Statut"] = alerts["Statut_auto"].apply(statut_badge_text)
 
         st.dataframe(
-            alerts[["Classe","Matière","VHP","VHR","Écart","Taux (%)","Statut","Raison_alerte","Observations"]],
+            alerts[["Classe","Matière","VHP","VHR","Écart","Taux (%)","Statut","Rythme_h_mois","Fin_projetée","Fin prévue","Raison_alerte","Observations"]],
             use_container_width=True,
             height=520,
             column_config={
@@ -2579,6 +2267,8 @@ with tab_alertes:
                 "Écart": st.column_config.NumberColumn("Écart (h)", format="%.0f"),
                 "VHP": st.column_config.NumberColumn("VHP", format="%.0f"),
                 "VHR": st.column_config.NumberColumn("VHR", format="%.0f"),
+                "Rythme_h_mois": st.column_config.NumberColumn("Rythme (h/mois)", format="%.1f"),
+                "Fin_projetée": st.column_config.TextColumn("Fin projetée"),
             }
         )
 
@@ -2615,19 +2305,36 @@ with tab_alertes:
         # ---------------------------------------------------------
         st.write("### 🎯 Choisir le lot à envoyer")
 
-        lot = st.selectbox(
-            "Type d'envoi",
-            [
-                "🚨 Toutes les alertes (Non démarré + Retard critique + Fin dépassée)",
-                "🛑 Seulement Non démarré",
-                "🔻 Seulement Retard critique",
-                "⛔ Seulement Fin dépassée",
-                "📌 Information : En cours (pas alerte)",
-                "✅ Information : Terminé (pas alerte)",
-            ],
-            index=0,
-            key="lot_prof"
+        lots_options = [
+            "🚨 Toutes les alertes (Non démarré + Retard critique + Fin dépassée + Fin projetée)",
+            "🛑 Seulement Non démarré",
+            "🔻 Seulement Retard critique",
+            "⛔ Seulement Fin dépassée",
+            "📉 Seulement Fin projetée hors délai",
+            "📌 Information : En cours (pas alerte)",
+            "✅ Information : Terminé (pas alerte)",
+        ]
+        digest_mode = st.checkbox(
+            "📬 Mode digest : un seul email par enseignant regroupant plusieurs lots",
+            value=False,
+            key="digest_mode",
         )
+        if digest_mode:
+            lots_sel = st.multiselect(
+                "Lots à regrouper (une section par lot)",
+                options=lots_options[1:],
+                default=lots_options[1:4],
+                key="lots_digest",
+            )
+            lot = "📬 Digest : " + " + ".join(l.split(" ", 1)[1].replace("Seulement ", "") for l in lots_sel)
+        else:
+            lot = st.selectbox(
+                "Type d'envoi",
+                lots_options,
+                index=0,
+                key="lot_prof"
+            )
+            lots_sel = [lot]
 
         # ---------------------------------------------------------
         # 2) Construire alerts_send (IMPORTANT : base = tmp)
@@ -2636,27 +2343,39 @@ with tab_alertes:
         base = tmp[tmp["Email"].str.contains("@", na=False)].copy()
 
         cols_keep = [
-            "Responsable", "Email", "Classe", "Matière", "Semestre", "Type",
+            "_rowkey", "Responsable", "Email", "Classe", "Matière", "Semestre", "Type",
             "VHP", "VHR", "Écart", "Taux", "Statut_auto",
             "Raison_alerte", "Observations",
-            "Alerte_non_demarre", "Alerte_retard_critique", "Alerte_fin_depassee"
+            "Alerte_non_demarre", "Alerte_retard_critique", "Alerte_fin_depassee", "Alerte_projection"
         ]
         for c in cols_keep:
             if c not in base.columns:
                 base[c] = ""
 
-        if lot.startswith("🚨"):
-            alerts_send = base[base["En_alerte"]].copy()
-        elif lot.startswith("🛑"):
-            alerts_send = base[base["Alerte_non_demarre"]].copy()
-        elif lot.startswith("🔻"):
-            alerts_send = base[base["Alerte_retard_critique"]].copy()
-        elif lot.startswith("⛔"):
-            alerts_send = base[base["Alerte_fin_depassee"]].copy()
-        elif lot.startswith("📌"):
-            alerts_send = base[base["Statut_auto"] == "En cours"].copy()
-        else:  # ✅ Terminé
-            alerts_send = base[base["Statut_auto"] == "Terminé"].copy()
+        def lot_mask(frame: pd.DataFrame, lot_label: str) -> pd.Series:
+            if lot_label.startswith("🚨"):
+                return frame["En_alerte"]
+            if lot_label.startswith("🛑"):
+                return frame["Alerte_non_demarre"]
+            if lot_label.startswith("🔻"):
+                return frame["Alerte_retard_critique"]
+            if lot_label.startswith("⛔"):
+                return frame["Alerte_fin_depassee"]
+            if lot_label.startswith("📉"):
+                return frame["Alerte_projection"]
+            if lot_label.startswith("📌"):
+                return frame["Statut_auto"] == "En cours"
+            return frame["Statut_auto"] == "Terminé"  # ✅ Terminé
+
+        if digest_mode:
+            # Une ligne par (ligne, lot) : les sections du digest sont rendues en une passe groupée
+            cols_keep = cols_keep + ["_lot"]
+            alerts_send = pd.concat(
+                [base[lot_mask(base, l)].assign(_lot=l) for l in lots_sel] or [base.iloc[:0].assign(_lot="")],
+                ignore_index=True,
+            )
+        else:
+            alerts_send = base[lot_mask(base, lot)].copy()
 
         alerts_send = alerts_send[cols_keep].copy()
 
@@ -2712,7 +2431,7 @@ with tab_alertes:
 
             st.write("Aperçu (lot sélectionné) :")
             st.dataframe(
-                alerts_send_sel[["Responsable","Email","Classe","Semestre","Type","Matière","Écart","Statut","Raison_alerte","Observations"]].head(80),
+                alerts_send_sel[(["_lot"] if digest_mode else []) + ["Responsable","Email","Classe","Semestre","Type","Matière","Écart","Statut","Raison_alerte","Observations"]].head(80),
                 use_container_width=True,
                 height=320
             )
@@ -2724,6 +2443,32 @@ with tab_alertes:
             # ---------------------------------------------------------
             st.write("### 🚀 Envoyer (admin)")
 
+            # Registre des envois : ne renvoyer que les lignes nouvelles ou modifiées
+            alerts_send_sel["_notif_fp"] = row_fingerprints(alerts_send_sel)
+            only_changes = st.checkbox(
+                "🔁 Envoyer uniquement les changements depuis le dernier envoi",
+                value=False,
+                key="send_only_changes",
+                help="Ignore les enseignants dont les alertes (statut, tranche d'écart) n'ont pas changé "
+                     "depuis le dernier email reçu pour ce lot ; aux autres, n'envoie que les lignes nouvelles ou modifiées.",
+            )
+            if only_changes:
+                try:
+                    rows_to_send, ledger_summary = changed_rows(alerts_send_sel, notification_ledger(CFG["dept_code"]), lot)
+                except Exception as e:
+                    st.warning(f"Registre des envois indisponible : {e} — envoi complet.")
+                    rows_to_send = alerts_send_sel
+                else:
+                    n_same = int(ledger_summary["Inchangé"].sum())
+                    st.caption(
+                        f"🧾 {n_same} enseignant(s) inchangé(s) ignoré(s) • "
+                        f"{len(ledger_summary) - n_same} à notifier • {len(rows_to_send)} ligne(s) nouvelles ou modifiées"
+                    )
+                    with st.expander("Détail par enseignant", expanded=False):
+                        st.dataframe(ledger_summary, use_container_width=True, height=240)
+            else:
+                rows_to_send = alerts_send_sel
+
             if st.button("📩 Envoyer maintenant aux enseignants", key="send_prof_alerts"):
                 if not st.session_state.get("is_admin", False):
                     st.error("Accès refusé : PIN incorrect.")
@@ -2733,64 +2478,152 @@ with tab_alertes:
                     st.warning("Aucune ligne à envoyer (vérifie lot + sélection).")
                     st.stop()
 
-                sent, errors = 0, 0
-                grp = alerts_send_sel.groupby(["Responsable", "Email"])
+                if rows_to_send.empty:
+                    st.info("Aucun changement depuis le dernier envoi : rien à notifier.")
+                    st.stop()
+
+                try:
+                    cfg_smtp = _get_smtp_config()
+                except RuntimeError as e:
+                    st.error(str(e))
+                    st.stop()
+
+                # État complet de chaque enseignant et dernier état envoyé : la clé couvre la transition,
+                # pas seulement les lignes du message (un retour X → Y → X est bien renotifié)
+                fps_by_prof = alerts_send_sel.groupby(["Responsable", "Email"])["_notif_fp"].agg(list)
+                try:
+                    last_sent_fps = notification_ledger(CFG["dept_code"]).last_sent(lot, rows_to_send["Email"].astype(str))
+                except Exception as e:
+                    last_sent_fps = {}
+                    st.caption(f"⚠️ Registre des envois illisible : {e}")
+
+                messages, profs_msg, keys_msg = [], [], []
+                grp = rows_to_send.groupby(["Responsable", "Email"])
+                lot_mail = f"{lot} — changements depuis le dernier envoi" if only_changes else lot
+
+                # Texte + HTML de tous les enseignants en une passe (gabarit compilé une fois)
+                bodies = render_prof_emails(
+                    rows_to_send, lot_mail, mois_min, mois_max, thresholds, CFG,
+                    section_col="_lot" if digest_mode else None,
+                    sections=lots_sel if digest_mode else None,
+                )
 
+                n_already = 0
                 for (prof, mail), gprof in grp:
-                    # Texte fallback
-                    lignes_txt = []
-                    for _, r in gprof.sort_values(["Statut_auto", "Écart"]).iterrows():
-                        lignes_txt.append(
-                            f"- {r.get('Classe','')} | {r.get('Semestre','')} | {r.get('Type','')} | {r.get('Matière','')} | "
-                            f"VHP={int(float(r.get('VHP',0) or 0))} VHR={int(float(r.get('VHR',0) or 0))} "
-                            f"Écart={int(float(r.get('Écart',0) or 0))} | {r.get('Statut_auto','')} | {r.get('Raison_alerte','')}"
-                        )
-
-                    body_text_prof = (
-                        f"{CFG['dept_code']} — Notification de suivi des enseignements\n"
-                        f"Période : {mois_min} → {mois_max}\n\n"
-                        f"Bonjour {prof},\n\n"
-                        f"Lot : {lot}\n"
-                        f"Éléments concernés : {len(gprof)}\n\n"
-                        + "\n".join(lignes_txt)
-                        + f"\n\n{CFG['department_long']}\n"
-                    )
+                    prof_fps = fps_by_prof[(prof, mail)]
+                    prof_last = last_sent_fps.get((str(prof).strip(), str(mail).strip().lower()), set())
+                    if prof_last and set(prof_fps) == prof_last:
+                        # Même état que le dernier email reçu : rien de neuf pour cet enseignant
+                        n_already += 1
+                        continue
+                    body_text_prof, body_html_prof = bodies[(prof, mail)]
+                    subject_prof = f"{CFG['dept_code']} — Notification ({mois_min}→{mois_max}) : {lot_mail.split(' ',1)[1]} — {len(gprof)} élément(s)"
+                    if digest_mode:
+                        subject_prof = f"{CFG['dept_code']} — Notification ({mois_min}→{mois_max}) : {gprof['_lot'].nunique()} lot(s) — {len(gprof)} élément(s)"
+                    messages.append(build_email_message(
+                        sender=cfg_smtp["smtp_from"],
+                        recipients=[mail],
+                        subject=subject_prof,
+                        body_text=body_text_prof,
+                        body_html=body_html_prof,
+                    ))
+                    profs_msg.append((prof, mail))
+                    transition = transition_fingerprint(prof_fps, prof_last)
+                    keys_msg.append(idempotency_key(
+                        month_key, lot, mail, rows_content_hash(gprof, NOTIF_CONTENT_COLS) + transition
+                    ))
+
+                if n_already:
+                    st.info(f"ℹ️ {n_already} enseignant(s) déjà notifié(s) dans cet état : ignoré(s).")
+                if not messages:
+                    st.stop()
 
-                    # ✅ HTML : tu as déjà build_prof_email_html global, on l’utilise ici
-                    body_html_prof = build_prof_email_html(
-                        prof=prof,
-                        lot_label=lot,
-                        mois_min=mois_min,
-                        mois_max=mois_max,
-                        thresholds=thresholds,
-                        gprof=gprof,
-                        cfg=CFG,
+                # Outbox persistante : une clé par (mois, lot, email, contenu, transition d'état) => pas de doublon
+                # au re-clic ; l'envoi continue en arrière-plan si la session se ferme.
+                _outbox = notification_outbox(CFG["dept_code"])
+                added = _outbox.enqueue(
+                    "prof",
+                    month_key,
+                    [(k, mail, prof, m) for k, (prof, mail), m in zip(keys_msg, profs_msg, messages)],
+                    lot=lot,
+                )
+                if added < len(messages):
+                    st.info(f"ℹ️ {len(messages) - added} notification(s) identique(s) déjà en file ou envoyée(s) : ignorée(s).")
+
+                # Empreintes de l'état complet de chaque enseignant, prises en compte une fois le message envoyé
+                try:
+                    notification_ledger(CFG["dept_code"]).record(
+                        (k, prof, mail, lot, fps_by_prof[(prof, mail)]) for k, (prof, mail) in zip(keys_msg, profs_msg)
                     )
+                except Exception as e:
+                    st.caption(f"⚠️ Registre des envois non mis à jour : {e}")
+
+                _worker = outbox_worker(CFG["dept_code"])
+                _worker.wake()
+
+                def _wait_batch(ctx):
+                    def _on_poll(status):
+                        n_done = int(status["status"].isin([STATUS_SENT, STATUS_FAILED]).sum())
+                        try:
+                            ctx.progress(
+                                n_done / max(1, len(status)),
+                                f"{n_done}/{len(status)} "
+                                f"(✅ {int((status['status'] == STATUS_SENT).sum())} • ❌ {int((status['status'] == STATUS_FAILED).sum())})",
+                            )
+                        except TaskCancelled:
+                            # Les messages pas encore partis sont retirés de la file
+                            _outbox.cancel_pending(keys_msg)
+                            raise
+
+                    return _worker.wait_for(keys_msg, timeout_s=600, on_poll=_on_poll)
+
+                task_manager().submit(
+                    CFG["dept_code"], "notif_enseignants", f"Envoi des notifications ({len(keys_msg)} enseignant(s))",
+                    _wait_batch, key=artifact_key("notif_enseignants", *sorted(keys_msg)),
+                )
 
-                    subject_prof = f"{CFG['dept_code']} — Notification ({mois_min}→{mois_max}) : {lot.split(' ',1)[1]} — {len(gprof)} élément(s)"
-                    try:
-                        cfg_smtp = _get_smtp_config()
-                        send_email_reminder(
-                            smtp_host=cfg_smtp["smtp_host"],
-                            smtp_port=cfg_smtp["smtp_port"],
-                            smtp_user=cfg_smtp["smtp_user"],
-                            smtp_pass=cfg_smtp["smtp_pass"],
-                            sender=cfg_smtp["smtp_from"],
-                            recipients=[mail],
-                            subject=subject_prof,
-                            body_text=body_text_prof,
-                            body_html=body_html_prof,
-                        )
-                        sent += 1
-                    except Exception as e:
-                        errors += 1
-                        st.error(f"Erreur envoi à {prof} ({mail}) : {e}")
+            # Dernier envoi groupé (conservé entre reruns) : progression puis bilan
+            batch_task = task_manager().latest(CFG["dept_code"], "notif_enseignants")
+            show_task(batch_task)
+            if batch_task is not None and batch_task.status == TASK_DONE:
+                status = batch_task.result
+                sent = int((status["status"] == STATUS_SENT).sum())
+                errors = int((status["status"] == STATUS_FAILED).sum())
+                waiting = len(status) - sent - errors
+                if waiting:
+                    st.info(f"📤 {waiting} notification(s) encore en file : elles partiront en arrière-plan.")
+                if errors:
+                    st.dataframe(
+                        status[status["status"] == STATUS_FAILED]
+                        .rename(columns={"label": "Enseignant", "recipient": "Email", "attempts": "Tentatives", "last_error": "Erreur"})
+                        [["Enseignant", "Email", "Tentatives", "Erreur"]],
+                        use_container_width=True,
+                    )
 
                 if sent:
                     st.success(f"✅ Emails envoyés à {sent} enseignant(s).")
                 if errors:
                     st.warning(f"⚠️ {errors} envoi(s) en échec.")
 
+            with st.expander("📬 File d'envoi du mois (outbox)", expanded=False):
+                _outbox = notification_outbox(CFG["dept_code"])
+                _summary = _outbox.summary(month_key)
+                if _summary.empty:
+                    st.caption("Aucune notification enregistrée ce mois-ci.")
+                else:
+                    _summary["status"] = _summary["status"].map(STATUS_LABELS).fillna(_summary["status"])
+                    st.dataframe(
+                        _summary.pivot_table(index=["kind", "lot"], columns="status", values="n", fill_value=0).reset_index(),
+                        use_container_width=True,
+                    )
+                    _failed = _outbox.failures(month_key)
+                    if not _failed.empty:
+                        st.dataframe(_failed, use_container_width=True, height=200)
+                        if st.button("🔁 Relancer les échecs", key="outbox_retry_failed") and st.session_state.get("is_admin", False):
+                            n_retry = _outbox.retry_failed(month_key)
+                            outbox_worker(CFG["dept_code"]).wake()
+                            st.success(f"{n_retry} notification(s) remise(s) en file.")
+
 
     # =========================================================
     # 3) GRAPHIQUES
@@ -2808,6 +2641,10 @@ with tab_alertes:
         fin = tmp[tmp["Alerte_fin_depassee"]].groupby("Classe").size().sort_values(ascending=False)
         st.bar_chart(fin)
 
+        st.write("### Fin projetée hors délai — par classe")
+        proj = tmp[tmp["Alerte_projection"]].groupby("Classe").size().sort_values(ascending=False)
+        st.bar_chart(proj)
+
 
 # ====== QUALITÉ DES DONNÉES ======
 with tab_qualite:
@@ -2834,6 +2671,185 @@ with tab_qualite:
     suspects = df_period[df_period["Matière_vide"] | (df_period["VHP"]<=0)].head(100)
     st.dataframe(suspects[["Classe","Matière","VHP"] + MOIS_COLS], use_container_width=True)
 
+    st.write("### Anomalies de saisie — heures mensuelles")
+    st.caption("Tout le classeur (hors filtres) • Ligne = numéro de ligne dans la feuille Excel (Classe).")
+
+    anomalies = cached_hour_anomalies(dataset_hash, df)
+    if anomalies.empty:
+        st.success("Aucune anomalie détectée dans les heures saisies ✅")
+    else:
+        par_type = anomalies["Anomalie"].value_counts().reset_index()
+        par_type.columns = ["Anomalie", "Nombre"]
+        qa1, qa2 = st.columns([1, 2])
+        with qa1:
+            st.dataframe(par_type, use_container_width=True, hide_index=True)
+        with qa2:
+            types_sel = st.multiselect(
+                "Types d'anomalies",
+                par_type["Anomalie"].tolist(),
+                default=par_type["Anomalie"].tolist(),
+                key="anomalies_types"
+            )
+            st.caption(
+                f"📌 {anomalies[['Classe', 'Ligne']].drop_duplicates().shape[0]} ligne(s) concernée(s) "
+                f"sur {len(df)}"
+            )
+
+        st.dataframe(
+            anomalies[anomalies["Anomalie"].isin(types_sel)],
+            use_container_width=True,
+            height=420,
+            hide_index=True,
+            column_config={
+                "Classe": st.column_config.TextColumn("Feuille (Classe)"),
+                "Ligne": st.column_config.NumberColumn("Ligne Excel", format="%d"),
+                "Heures": st.column_config.NumberColumn("Heures", format="%.0f"),
+                "VHP": st.column_config.NumberColumn("VHP", format="%.0f"),
+            }
+        )
+
+# ====== CHANGEMENTS (VERSIONS DU CLASSEUR) ======
+with tab_changes:
+    st.subheader("Changements depuis une version précédente du classeur")
+    st.caption("Comparaison ligne à ligne (clé stable Classe/Matière/Semestre/Type/Responsable) • tout le classeur, hors filtres.")
+
+    previous_versions = pd.DataFrame()
+    if _store is not None:
+        previous_versions = _store.list_snapshots(with_rows_only=True)
+        previous_versions = previous_versions[previous_versions["content_hash"] != dataset_hash].reset_index(drop=True)
+
+    if previous_versions.empty:
+        st.info("Aucune version précédente connue : le fil des changements apparaîtra à la prochaine mise à jour du classeur.")
+    else:
+        def _version_label(i: int) -> str:
+            v = previous_versions.iloc[i]
+            seen = pd.Timestamp(v["created_at"]).strftime("%d/%m/%Y %H:%M")
+            return f"{seen} — {v['source'] or 'source inconnue'} ({v['content_hash'][:8]})"
+
+        v_idx = st.selectbox(
+            "Comparer la version actuelle à",
+            list(range(len(previous_versions))),
+            format_func=_version_label,
+            key="diff_prev_version"
+        )
+        feed = diff_workbooks(_store.load_rows(int(previous_versions.loc[v_idx, "id"])), df)
+        ds = diff_summary(feed)
+
+        st.markdown(
+            f"""
+            <div style="display:grid;grid-template-columns:repeat(5,minmax(0,1fr));gap:12px;margin:10px 0 4px 0;">
+              <div class="kpi kpi-good"><div class="kpi-title">Lignes ajoutées</div><div class="kpi-value">{ds['ajoutees']}</div></div>
+              <div class="kpi kpi-bad"><div class="kpi-title">Lignes supprimées</div><div class="kpi-value">{ds['supprimees']}</div></div>
+              <div class="kpi kpi-warn"><div class="kpi-title">Lignes modifiées</div><div class="kpi-value">{ds['modifiees']}</div></div>
+              <div class="kpi kpi-good"><div class="kpi-title">Devenues Terminé</div><div class="kpi-value">{ds['terminees']}</div></div>
+              <div class="kpi"><div class="kpi-title">Δ heures réalisées</div><div class="kpi-value">{ds['delta_h']:+.0f}</div></div>
+            </div>
+            """,
+            unsafe_allow_html=True
+        )
+
+        if feed.empty:
+            st.success("Aucun changement entre les deux versions ✅")
+        else:
+            kinds = [CHANGE_MODIFIED, CHANGE_ADDED, CHANGE_REMOVED]
+            kinds_sel = st.multiselect("Types de changement", kinds, default=kinds, key="diff_kinds")
+            only_done = st.checkbox("Uniquement les cours devenus « Terminé »", value=False, key="diff_only_done")
+
+            feed_view = feed[feed["Changement"].isin(kinds_sel)]
+            if only_done:
+                feed_view = feed_view[feed_view["Devenu_terminé"]]
+
+            show_cols = [
+                "Changement", "Classe", "Semestre", "Type", "Matière", "Responsable", "VHP",
+                "VHR_avant", "VHR_après", "ΔVHR", "Statut_avant", "Statut_après", "Mois_modifiés",
+            ] + [DELTA_PREFIX + m for m in MOIS_COLS]
+            st.dataframe(
+                feed_view[show_cols],
+                use_container_width=True,
+                height=460,
+                hide_index=True,
+                column_config={
+                    "VHP": st.column_config.NumberColumn("VHP", format="%.0f"),
+                    "VHR_avant": st.column_config.NumberColumn("VHR avant", format="%.0f"),
+                    "VHR_après": st.column_config.NumberColumn("VHR après", format="%.0f"),
+                    "ΔVHR": st.column_config.NumberColumn("Δ VHR", format="%+.0f"),
+                }
+            )
+
+            diff_key = artifact_key(
+                "changements", dataset_hash, previous_versions.loc[v_idx, "content_hash"], frame_signature(feed_view)
+            )
+            if st.button("Préparer l’Excel des changements", key="btn_diff_excel"):
+                export_cache(CFG["dept_code"]).get_or_build(
+                    diff_key, lambda: df_to_excel_bytes({"Changements": feed_view[show_cols]})
+                )
+            diff_bytes = export_cache(CFG["dept_code"]).get(diff_key)
+            if diff_bytes is not None:
+                st.download_button(
+                    "⬇️ Télécharger le fil des changements (Excel)",
+                    data=diff_bytes,
+                    file_name=f"{export_prefix}_changements_{dataset_hash[:8]}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    key="dl_diff_excel"
+                )
+
+
+# ====== HISTORIQUE (TENDANCES) ======
+with tab_history:
+    st.subheader("Historique — évolution au fil des versions du classeur")
+    st.caption("Une valeur par jour (dernière version du jour) • KPIs calculés sur l'année complète, seuils par défaut.")
+
+    if _store is None:
+        st.warning("Historique indisponible (stockage local inaccessible).")
+    else:
+        hc1, hc2 = st.columns(2)
+        with hc1:
+            trend_metric = st.selectbox("Indicateur", list(TREND_METRICS.keys()), index=2, key="trend_metric")
+        with hc2:
+            trend_by = st.radio("Détail", ["Global", "Classe", "Responsable"], horizontal=True, key="trend_by")
+
+        # Les filtres Classes / Responsables de la sidebar restreignent la tendance s'ils sont réduits
+        trend = _store.kpi_trend(
+            trend_metric,
+            by=None if trend_by == "Global" else trend_by,
+            classes=selected_classes if set(selected_classes) != set(classes) else None,
+            responsables=(
+                selected_responsables
+                if selected_responsables and set(selected_responsables) != set(responsables)
+                else None
+            ),
+        )
+
+        if trend["Date"].nunique() < 2:
+            st.info("Pas encore assez de versions enregistrées pour tracer une tendance (au moins 2 jours).")
+        if not trend.empty:
+            fig = px.line(
+                trend,
+                x="Date",
+                y=trend_metric,
+                color=None if trend_by == "Global" else trend_by,
+                markers=True,
+                title=f"{trend_metric} — évolution"
+            )
+            fig.update_layout(height=440, margin=dict(l=10, r=10, t=60, b=10))
+            st.plotly_chart(fig, use_container_width=True)
+
+        with st.expander("Versions enregistrées"):
+            snaps = _store.list_snapshots()
+            st.caption(f"{len(snaps)} version(s) • {_store.disk_usage_bytes() / 1e6:.1f} Mo sur disque")
+            st.dataframe(
+                snaps[["created_at", "source", "n_rows", "has_rows", "content_hash"]],
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "created_at": st.column_config.TextColumn("Enregistrée le"),
+                    "n_rows": st.column_config.NumberColumn("Lignes", format="%d"),
+                    "has_rows": st.column_config.CheckboxColumn("Détail conservé"),
+                    "content_hash": st.column_config.TextColumn("Empreinte"),
+                }
+            )
+
+
 # ====== EXPORTS ======
 with tab_export:
 
@@ -2844,6 +2860,63 @@ with tab_export:
     st.subheader("Exports (Excel consolidé + PDF officiel)")
     st.caption("Les exports respectent les filtres actifs + la période sélectionnée.")
 
+    # Même contenu (données, filtres, période, seuils) => même fichier, construit une seule fois
+    filtered_sig = frame_signature(filtered)
+    excel_key = artifact_key(
+        "excel_consolide", dataset_hash, filtered_sig, mois_min, mois_max, thresholds
+    )
+
+    # Les builders tournent dans des tâches de fond : pool et caches (`st.cache_resource`)
+    # sont résolus dans le thread du script puis passés en argument.
+    def build_main_pdf(executor, title: str, logo_bytes: Optional[bytes]) -> bytes:
+        return render_pdf_report(
+            executor,
+            df=filtered[
+                ["Classe","Semestre","Matière","Début prévu","Fin prévue","VHP"]
+                + mois_couverts
+                + ["VHR","Écart","Taux","Statut_auto","Observations"]
+            ].copy(),
+            title=title,
+            mois_couverts=mois_couverts,
+            thresholds=thresholds,
+            logo_bytes=logo_bytes,
+            author_name=CFG["author_name"],
+            assistant_name=CFG["assistant_name"],
+            department=CFG["department_long"],
+            institution=CFG["institution"],
+            author_role=CFG["author_role"],
+            assistant_label=CFG["assistant_label"],
+            assistant_role=CFG["assistant_role"],
+        )
+
+    def build_obs_pdf(executor, title: str, logo_bytes: Optional[bytes]) -> bytes:
+        return render_pdf_observations_report(
+            executor,
+            df=filtered[
+                ["Classe","Semestre","Type","Matière","Responsable","VHP","VHR","Écart","Taux","Statut_auto","Observations"]
+            ].copy(),
+            title=title,
+            mois_couverts=mois_couverts,
+            logo_bytes=logo_bytes,
+            author_name=CFG["author_name"],
+            assistant_name=CFG["assistant_name"],
+            department=CFG["department_long"],
+            institution=CFG["institution"],
+            author_role=CFG["author_role"],
+            assistant_label=CFG["assistant_label"],
+            assistant_role=CFG["assistant_role"],
+        )
+
+    def submit_export(kind: str, key: str, label: str, builder) -> Task:
+        """
+        Construit un export en tâche de fond ; réutilisé tel quel s'il est déjà en
+        cache. `builder(executor)` reçoit le pool de rendu résolu ici.
+        """
+        cache, executor = export_cache(CFG["dept_code"]), report_executor()
+        return task_manager().submit(
+            CFG["dept_code"], kind, label, lambda ctx: len(cache.get_or_build(key, lambda: builder(executor))), key=key
+        )
+
     col1, col2 = st.columns(2)
 
     # =========================================================
@@ -2852,47 +2925,23 @@ with tab_export:
     with col1:
         st.write("### Export Excel consolidé")
 
-        export_df = filtered[
-            ["Classe","Semestre","Matière","Début prévu","Fin prévue","VHP"]
-            + MOIS_COLS
-            + ["VHR","Écart","Taux","Statut_auto","Observations"]
-        ].copy()
-
-        export_df["Taux"] = (export_df["Taux"]*100).round(2)
-
-        synth_class = filtered.groupby("Classe").agg(
-            Matieres=("Matière","count"),
-            Taux_moy=("Taux","mean"),
-            VHP_total=("VHP","sum"),
-            VHR_total=("VHR","sum"),
-            Retard_h=("Écart", lambda s: float(s[s<0].sum()))
-        ).reset_index()
-        synth_class["Taux_moy"] = (synth_class["Taux_moy"]*100).round(2)
-
-        synth_resp = filtered.groupby("Responsable").agg(
-            Matieres=("Matière","count"),
-            Classes=("Classe","nunique"),
-            VHP_total=("VHP","sum"),
-            VHR_total=("VHR","sum"),
-            Taux_moy=("Taux","mean"),
-            Retard_h=("Écart", lambda s: float(s[s<0].sum())),
-            Non_demarre=("Statut_auto", lambda s: int((s=="Non démarré").sum())),
-        ).reset_index()
-        synth_resp["Taux_moy"] = (synth_resp["Taux_moy"]*100).round(2)
-
-        xbytes = df_to_excel_bytes({
-            "Consolidé": export_df,
-            "Synthese_Classes": synth_class,
-            "Synthese_Responsables": synth_resp,
-        })
+        # Construit seulement à la demande, puis réutilisé (reruns, sessions, envoi DG)
+        if st.button("Préparer l’Excel consolidé", key="btn_excel_main"):
+            submit_export(
+                "excel_consolide", excel_key, "Excel consolidé",
+                lambda executor: render_consolidated_excel(executor, filtered, mois_couverts),
+            )
+        show_task(task_manager().find(CFG["dept_code"], excel_key))
 
-        st.download_button(
-            "⬇️ Télécharger l’Excel consolidé",
-            data=xbytes,
-            file_name=f"{export_prefix}_consolide.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            key="dl_excel"
-        )
+        xbytes = export_cache(CFG["dept_code"]).get(excel_key)
+        if xbytes is not None:
+            st.download_button(
+                "⬇️ Télécharger l’Excel consolidé",
+                data=xbytes,
+                file_name=f"{export_prefix}_consolide.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="dl_excel"
+            )
 
     # =========================================================
     # 2) PDF + OPENAI
@@ -2908,25 +2957,20 @@ with tab_export:
             key="pdf_title_export"
         )
 
-        logo_bytes = logo.getvalue() if logo else None
+        # Logo réduit à sa taille rendue une fois (cache par empreinte), logo du département par défaut
+        logo_bytes = prepare_logo(logo.getvalue() if logo else None, CFG["logo_path"])
+        pdf_key = artifact_key(
+            "pdf_rapport", dataset_hash, filtered_sig, mois_couverts, thresholds, pdf_title, bytes_digest(logo_bytes)
+        )
 
         if st.button("Générer le PDF", key="btn_pdf_main"):
-            pdf = build_pdf_report(
-                df=filtered[
-                    ["Classe","Semestre","Matière","Début prévu","Fin prévue","VHP"]
-                    + mois_couverts
-                    + ["VHR","Écart","Taux","Statut_auto","Observations"]
-                ].copy(),
-                title=pdf_title,
-                mois_couverts=mois_couverts,
-                thresholds=thresholds,
-                logo_bytes=logo_bytes,
-                author_name=CFG["author_name"],
-                assistant_name=CFG["assistant_name"],
-                department=CFG["department_long"],
-                institution=CFG["institution"],
+            submit_export(
+                "pdf_rapport", pdf_key, "PDF rapport", lambda executor: build_main_pdf(executor, pdf_title, logo_bytes)
             )
+        show_task(task_manager().find(CFG["dept_code"], pdf_key))
 
+        pdf = export_cache(CFG["dept_code"]).get(pdf_key)
+        if pdf is not None:
             st.download_button(
                 "⬇️ Télécharger le PDF",
                 data=pdf,
@@ -2946,20 +2990,19 @@ with tab_export:
             key="pdf_obs_title"
         )
 
+        pdf_obs_key = artifact_key(
+            "pdf_observations", dataset_hash, filtered_sig, mois_couverts, pdf_obs_title, bytes_digest(logo_bytes)
+        )
+
         if st.button("Générer le PDF Observations", key="btn_pdf_obs"):
-            pdf_obs = build_pdf_observations_report(
-                df=filtered[
-                    ["Classe","Semestre","Type","Matière","Responsable","VHP","VHR","Écart","Taux","Statut_auto","Observations"]
-                ].copy(),
-                title=pdf_obs_title,
-                mois_couverts=mois_couverts,
-                logo_bytes=logo_bytes,
-                author_name=CFG["author_name"],
-                assistant_name=CFG["assistant_name"],
-                department=CFG["department_long"],
-                institution=CFG["institution"],
+            submit_export(
+                "pdf_observations", pdf_obs_key, "PDF Observations",
+                lambda executor: build_obs_pdf(executor, pdf_obs_title, logo_bytes),
             )
+        show_task(task_manager().find(CFG["dept_code"], pdf_obs_key))
 
+        pdf_obs = export_cache(CFG["dept_code"]).get(pdf_obs_key)
+        if pdf_obs is not None:
             st.download_button(
                 "⬇️ Télécharger PDF Observations",
                 data=pdf_obs,
@@ -2979,26 +3022,60 @@ with tab_export:
             st.info("🔒 Réservé Admin")
         else:
 
-            max_lines_llm = st.slider(
-                "Nombre max observations envoyées à l'IA",
-                50, 800, 300, 50,
-                key="slider_ai"
-            )
+            ai_c1, ai_c2 = st.columns(2)
+            with ai_c1:
+                max_lines_llm = st.slider(
+                    "Nombre max de lignes envoyées à l'IA",
+                    50, 800, 300, 50,
+                    key="slider_ai"
+                )
+            with ai_c2:
+                token_budget_llm = st.slider(
+                    "Budget du prompt (tokens, estimation)",
+                    1000, 30000, DEFAULT_TOKEN_BUDGET, 1000,
+                    key="slider_ai_tokens",
+                    help="Observations identiques regroupées avec leur nombre ; les retards critiques passent en premier.",
+                )
 
+            ai_key = artifact_key(
+                "resume_ia", dataset_hash, filtered_sig, mois_min, mois_max, int(max_lines_llm), int(token_budget_llm)
+            )
             if st.button("🧠 Générer résumé IA", key="btn_ai_obs"):
-                try:
-                    with st.spinner("Analyse IA en cours..."):
-                        st.session_state["obs_ai_md"] = summarize_observations_with_openai(
-                            df_filtered=filtered,
-                            mois_min=mois_min,
-                            mois_max=mois_max,
-                            cfg=CFG,
-                            model="gpt-4.1-mini",
-                            max_lines=int(max_lines_llm),
-                        )
-                except Exception as e:
-                    st.session_state["obs_ai_md"] = None
-                    st.error(f"Erreur IA : {e}")
+                st.session_state["obs_ai_md"] = None
+                openai_key = str(safe_secret("OPENAI_API_KEY", "")).strip()
+                ai_cache = ai_summary_cache(CFG["dept_code"])
+                ai_payload = build_obs_payload(filtered, max_lines=int(max_lines_llm), token_budget=int(token_budget_llm))
+                st.caption(
+                    f"🧾 {ai_payload.n_observations} observation(s) → {ai_payload.n_groups} distincte(s) → "
+                    f"{len(ai_payload.lines)} ligne(s) envoyée(s) (~{ai_payload.tokens} tokens, "
+                    f"{ai_payload.n_covered} observation(s) couvertes)"
+                )
+                task_manager().submit(
+                    CFG["dept_code"], "resume_ia", "Résumé IA des observations",
+                    lambda ctx: summarize_observations_with_openai(
+                        df_filtered=filtered,
+                        mois_min=mois_min,
+                        mois_max=mois_max,
+                        cfg=CFG,
+                        model="gpt-4.1-mini",
+                        max_lines=int(max_lines_llm),
+                        token_budget=int(token_budget_llm),
+                        payload=ai_payload,
+                        on_delta=ctx.stream,
+                        api_key=openai_key,
+                        cache=ai_cache,
+                        on_progress=lambda done, total: ctx.progress(
+                            0.9 * done / total, f"{done}/{total} appel(s) au modèle"
+                        ),
+                    ),
+                    key=ai_key,
+                )
+
+            # Résultat conservé par le gestionnaire de tâches : retrouvé après un rerun ou une reconnexion
+            ai_task = task_manager().find(CFG["dept_code"], ai_key)
+            show_task(ai_task)
+            if ai_task is not None and ai_task.status == TASK_DONE:
+                st.session_state["obs_ai_md"] = ai_task.result
 
             # ===== AFFICHAGE + DOWNLOAD =====
             if st.session_state["obs_ai_md"]:
@@ -3025,6 +3102,115 @@ with tab_export:
 
 
 
+    # =========================================================
+    # 🗂️ THÈMES DES OBSERVATIONS — local, sans API
+    # =========================================================
+    st.divider()
+    st.subheader("🗂️ Thèmes des observations (hors ligne, sans API)")
+    st.caption("Regroupement par mots-clés (TF-IDF + k-means) calculé localement sur les données filtrées • aucun envoi externe.")
+
+    t0_themes = time.perf_counter()
+    obs_themes = cached_observation_themes(dataset_hash, filtered_sig, filtered)
+    themes_ms = (time.perf_counter() - t0_themes) * 1000
+
+    if obs_themes.n_observations == 0:
+        st.info("Aucune observation renseignée sur la période sélectionnée.")
+    else:
+        st.caption(
+            f"{obs_themes.n_observations} observation(s) • {obs_themes.n_distinct} distincte(s) • "
+            f"{len(obs_themes.themes)} thème(s) • {themes_ms:.0f} ms"
+        )
+        st.write("#### Thèmes du département")
+        st.dataframe(obs_themes.themes, use_container_width=True, hide_index=True)
+
+        st.write("#### Thèmes par classe")
+        theme_classes = sorted(obs_themes.by_class["Classe"].unique())
+        theme_classe = st.selectbox("Classe", ["Toutes"] + theme_classes, key="obs_themes_classe")
+        by_class_view = obs_themes.by_class
+        if theme_classe != "Toutes":
+            by_class_view = by_class_view[by_class_view["Classe"] == theme_classe]
+        st.dataframe(by_class_view, use_container_width=True, hide_index=True)
+
+    # =========================================================
+    # 📚 EXPORT GROUPÉ — un PDF par classe / par responsable
+    # =========================================================
+    st.divider()
+    st.subheader("📚 Export groupé (un PDF par classe / par responsable)")
+    st.caption("Un rapport par délégué de classe ou par enseignant, à partir des données filtrées • rendu en parallèle, livré en ZIP.")
+
+    bc1, bc2 = st.columns(2)
+    with bc1:
+        bundle_by = st.multiselect(
+            "Découpage",
+            ["Classe", "Responsable"],
+            default=["Classe"],
+            format_func=lambda x: "Par classe" if x == "Classe" else "Par responsable",
+            key="bundle_by"
+        )
+    with bc2:
+        bundle_kinds = st.multiselect(
+            "Rapports",
+            ["rapport", "observations"],
+            default=["rapport"],
+            format_func=lambda x: "Rapport mensuel" if x == "rapport" else "Observations",
+            key="bundle_kinds"
+        )
+
+    bundle_key = artifact_key(
+        "pdf_bundle", dataset_hash, filtered_sig, mois_couverts, thresholds,
+        sorted(bundle_by), sorted(bundle_kinds), pdf_title, pdf_obs_title, bytes_digest(logo_bytes)
+    )
+
+    if st.button("Générer le ZIP", key="btn_pdf_bundle", disabled=not (bundle_by and bundle_kinds)):
+        bundle_df = filtered[
+            ["Classe","Semestre","Type","Matière","Responsable","Début prévu","Fin prévue","VHP"]
+            + mois_couverts
+            + ["VHR","Écart","Taux","Statut_auto","Observations"]
+        ].copy()
+        common = dict(
+            mois_couverts=mois_couverts,
+            logo_bytes=logo_bytes,
+            author_name=CFG["author_name"],
+            assistant_name=CFG["assistant_name"],
+            department=CFG["department_long"],
+            institution=CFG["institution"],
+            author_role=CFG["author_role"],
+            assistant_label=CFG["assistant_label"],
+            assistant_role=CFG["assistant_role"],
+        )
+        jobs = []
+        for by in bundle_by:
+            jobs += report_bundle_jobs(
+                bundle_df, by, bundle_kinds,
+                titles={"rapport": pdf_title, "observations": pdf_obs_title},
+                common_kwargs=common,
+                thresholds=thresholds,
+            )
+
+        bundle_cache, bundle_executor = export_cache(CFG["dept_code"]), report_executor()
+
+        def _build_bundle(ctx) -> int:
+            def _bundle_progress(done: int, total: int, name: str) -> None:
+                ctx.progress(done / max(total, 1), f"{done} / {total} PDF — {name}")
+
+            return len(bundle_cache.get_or_build(
+                bundle_key, lambda: build_report_bundle(bundle_executor, jobs, progress=_bundle_progress)
+            ))
+
+        task_manager().submit(CFG["dept_code"], "pdf_bundle", f"ZIP des rapports ({len(jobs)} PDF)", _build_bundle, key=bundle_key)
+
+    show_task(task_manager().find(CFG["dept_code"], bundle_key))
+
+    bundle_zip = export_cache(CFG["dept_code"]).get(bundle_key)
+    if bundle_zip is not None:
+        st.download_button(
+            "⬇️ Télécharger le ZIP des rapports",
+            data=bundle_zip,
+            file_name=f"{export_prefix}_rapports_{'_'.join(b.lower() for b in sorted(bundle_by))}.zip",
+            mime="application/zip",
+            key="dl_pdf_bundle"
+        )
+
     # =========================================================
     # 📩 ENVOI AU DG — avec Excel + PDF en pièces jointes
     # =========================================================
@@ -3039,90 +3225,77 @@ with tab_export:
         st.write(f"**Destinataires :** {', '.join(recipients)}")
         st.caption("L'email inclura le rapport Excel consolidé et le rapport PDF mensuel en pièces jointes.")
 
+        dg_key = artifact_key("envoi_dg", month_key, excel_key, pdf_key, pdf_obs_key, sorted(recipients))
+
+        def _send_dg(ctx, cache: ArtifactCache, executor, outbox: Outbox, worker: OutboxWorker, sender: str):
+            # — Excel, PDF et PDF Observations construits en parallèle (pool de processus),
+            #   chacun réutilisé s'il a déjà été préparé avec le même contenu —
+            ctx.progress(0.05, "préparation des pièces jointes (Excel + PDF + Observations)…")
+            built = cache.build_many({
+                "Excel consolidé": (
+                    excel_key, lambda: render_consolidated_excel(executor, filtered, mois_couverts)
+                ),
+                "PDF rapport": (pdf_key, lambda: build_main_pdf(executor, pdf_title, logo_bytes)),
+                "PDF observations": (pdf_obs_key, lambda: build_obs_pdf(executor, pdf_obs_title, logo_bytes)),
+            })
+            ctx.progress(0.7, "envoi de l'email…")
+
+            attachments = [
+                (
+                    f"{export_prefix}_consolide_{today.strftime('%Y%m')}.xlsx",
+                    built["Excel consolidé"].data,
+                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                ),
+                (
+                    f"{export_prefix}_rapport_{today.strftime('%Y%m')}.pdf",
+                    built["PDF rapport"].data,
+                    "application/pdf",
+                ),
+                (
+                    f"{export_prefix}_observations_{today.strftime('%Y%m')}.pdf",
+                    built["PDF observations"].data,
+                    "application/pdf",
+                ),
+            ]
+            status = do_send(
+                outbox, worker, sender, attachments=attachments, content_hash=artifact_key(excel_key, pdf_key, pdf_obs_key)
+            )
+            timings = {name: "cache" if b.cached else f"{b.seconds:.1f} s" for name, b in built.items()}
+            return timings, status
+
         if st.button("📩 Envoyer le rapport au DG (Excel + PDF + Observations joints)", key="btn_send_dg"):
-            if lock_is_active(month_key):
-                st.warning("Un envoi est déjà en cours (anti double-envoi).")
+            try:
+                dg_sender = _get_smtp_config()["smtp_from"]
+            except RuntimeError as e:
+                st.error(f"❌ {e}")
+            else:
+                # Ressources partagées résolues ici : la tâche tourne hors du contexte du script
+                dg_resources = (
+                    export_cache(CFG["dept_code"]), report_executor(),
+                    notification_outbox(CFG["dept_code"]), outbox_worker(CFG["dept_code"]), dg_sender,
+                )
+                task_manager().submit(
+                    CFG["dept_code"], "envoi_dg", "Envoi du rapport au DG",
+                    lambda ctx: _send_dg(ctx, *dg_resources), key=dg_key,
+                )
+
+        dg_task = task_manager().find(CFG["dept_code"], dg_key)
+        show_task(dg_task)
+        if dg_task is not None and dg_task.status == TASK_DONE:
+            _timings, _status = dg_task.result
+            st.caption("⏱️ " + " • ".join(f"{name} : {t}" for name, t in _timings.items()))
+            if _status is None:
+                st.warning("⏳ Un envoi du rapport DG pour ce mois est déjà en cours (autre session) : réessaie dans un instant.")
+            elif _status["status"] == STATUS_SENT:
+                st.success(
+                    f"✅ Email envoyé à {', '.join(recipients)} avec 3 fichiers joints (Excel + PDF rapport + PDF observations)"
+                    f" — {_status['sent_at']}."
+                )
+                st.caption("Un nouveau clic sur les mêmes rapports ne renvoie pas l'email.")
+            elif _status["status"] == STATUS_FAILED:
+                st.error(f"Erreur envoi : {_status['last_error']}")
             else:
-                with st.spinner("Génération des rapports et envoi en cours..."):
-                    try:
-                        _logo_bytes = logo.getvalue() if logo else None
-
-                        # — Excel consolidé —
-                        _export_df = filtered[
-                            ["Classe", "Semestre", "Matière", "Début prévu", "Fin prévue", "VHP"]
-                            + MOIS_COLS
-                            + ["VHR", "Écart", "Taux", "Statut_auto", "Observations"]
-                        ].copy()
-                        _export_df["Taux"] = (_export_df["Taux"] * 100).round(2)
-
-                        _synth_class = filtered.groupby("Classe").agg(
-                            Matieres=("Matière", "count"),
-                            Taux_moy=("Taux", "mean"),
-                            VHP_total=("VHP", "sum"),
-                            VHR_total=("VHR", "sum"),
-                            Retard_h=("Écart", lambda s: float(s[s < 0].sum())),
-                        ).reset_index()
-                        _synth_class["Taux_moy"] = (_synth_class["Taux_moy"] * 100).round(2)
-
-                        _xlsx = df_to_excel_bytes({
-                            "Consolidé": _export_df,
-                            "Synthese_Classes": _synth_class,
-                        })
-
-                        # — PDF rapport mensuel —
-                        _pdf = build_pdf_report(
-                            df=filtered[
-                                ["Classe", "Semestre", "Matière", "Début prévu", "Fin prévue", "VHP"]
-                                + mois_couverts
-                                + ["VHR", "Écart", "Taux", "Statut_auto", "Observations"]
-                            ].copy(),
-                            title=f"Rapport mensuel — Suivi des enseignements ({CFG['dept_code']}) | {today.strftime('%m/%Y')}",
-                            mois_couverts=mois_couverts,
-                            thresholds=thresholds,
-                            logo_bytes=_logo_bytes,
-                            author_name=CFG["author_name"],
-                            assistant_name=CFG["assistant_name"],
-                            department=CFG["department_long"],
-                            institution=CFG["institution"],
-                        )
-
-                        # — PDF observations —
-                        _pdf_obs = build_pdf_observations_report(
-                            df=filtered[
-                                ["Classe", "Semestre", "Type", "Matière", "Responsable",
-                                 "VHP", "VHR", "Écart", "Taux", "Statut_auto", "Observations"]
-                            ].copy(),
-                            title=f"Suivi des enseignements — Observations ({CFG['dept_code']}) | {today.strftime('%m/%Y')}",
-                            mois_couverts=mois_couverts,
-                            logo_bytes=_logo_bytes,
-                            author_name=CFG["author_name"],
-                            assistant_name=CFG["assistant_name"],
-                            department=CFG["department_long"],
-                            institution=CFG["institution"],
-                        )
-
-                        _attachments = [
-                            (
-                                f"{export_prefix}_consolide_{today.strftime('%Y%m')}.xlsx",
-                                _xlsx,
-                                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            ),
-                            (
-                                f"{export_prefix}_rapport_{today.strftime('%Y%m')}.pdf",
-                                _pdf,
-                                "application/pdf",
-                            ),
-                            (
-                                f"{export_prefix}_observations_{today.strftime('%Y%m')}.pdf",
-                                _pdf_obs,
-                                "application/pdf",
-                            ),
-                        ]
-
-                        do_send(attachments=_attachments)
-                        st.success(f"✅ Email envoyé à {', '.join(recipients)} avec 3 fichiers joints (Excel + PDF rapport + PDF observations).")
-                    except Exception as e:
-                        st.error(f"Erreur envoi : {e}")
+                st.info("📤 Email en file d'envoi : il partira en arrière-plan, même si cette page est fermée.")
 
 
 
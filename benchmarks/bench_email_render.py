@@ -0,0 +1,107 @@
+"""
+Benchmark du rendu des notifications enseignants (texte + HTML) : gabarit
+compilé et lignes rendues par colonnes, contre l'ancienne boucle `iterrows()`
+avec styles inline répétés sur chaque cellule.
+
+Usage:
+    python benchmarks/bench_email_render.py --teachers 200 --rows-per-teacher 12 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.email_templates import render_prof_email, render_prof_emails  # noqa: E402
+
+CFG = {"dept_code": "IAID", "department_long": "Département Intelligence Artificielle & Ingénierie des Données"}
+THRESHOLDS = {"ecart_critique": -6}
+TD = 'style="padding:10px;border-bottom:1px solid #E3E8F0;'
+
+
+def synthetic_alerts(n_teachers: int, rows_per_teacher: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = n_teachers * rows_per_teacher
+    vhp = rng.choice([15, 20, 30, 45, 60], size=n).astype(float)
+    vhr = np.round(vhp * rng.uniform(0, 1.1, size=n))
+    return pd.DataFrame({
+        "Responsable": np.repeat([f"Enseignant {i:03d}" for i in range(n_teachers)], rows_per_teacher),
+        "Email": np.repeat([f"prof{i:03d}@example.org" for i in range(n_teachers)], rows_per_teacher),
+        "Classe": rng.choice([f"L{1 + i % 3} Groupe {i:02d}" for i in range(30)], size=n),
+        "Semestre": rng.choice(["S1", "S2"], size=n),
+        "Type": rng.choice(["CM", "TD", "TP"], size=n),
+        "Matière": [f"Matière {i % 150} — Introduction aux systèmes & réseaux" for i in range(n)],
+        "VHP": vhp,
+        "VHR": vhr,
+        "Écart": vhr - vhp,
+        "Statut_auto": np.where(vhr <= 0, "Non démarré", np.where(vhr < vhp, "En cours", "Terminé")),
+        "Raison_alerte": rng.choice(["Retard critique", "Non démarré", "Fin dépassée", ""], size=n),
+    })
+
+
+def legacy_render(prof: str, lot: str, gprof: pd.DataFrame) -> tuple[str, str]:
+    """Cœur de l'ancien rendu : deux `iterrows()` et styles inline par cellule."""
+    lignes_txt = []
+    for _, r in gprof.sort_values(["Statut_auto", "Écart"]).iterrows():
+        lignes_txt.append(
+            f"- {r.get('Classe','')} | {r.get('Semestre','')} | {r.get('Type','')} | {r.get('Matière','')} | "
+            f"VHP={int(float(r.get('VHP',0) or 0))} VHR={int(float(r.get('VHR',0) or 0))} "
+            f"Écart={int(float(r.get('Écart',0) or 0))} | {r.get('Statut_auto','')} | {r.get('Raison_alerte','')}"
+        )
+    lignes_html = ""
+    for _, r in gprof.copy().sort_values(["Écart"], ascending=True).iterrows():
+        ec = int(float(r.get("Écart", 0) or 0))
+        ec_color = "#D93025" if ec <= THRESHOLDS["ecart_critique"] else "#0F172A"
+        lignes_html += f"""
+        <tr>
+          <td {TD}">{r.get("Classe", "")}</td>
+          <td {TD}">{r.get("Semestre", "")}</td>
+          <td {TD}">{r.get("Type", "")}</td>
+          <td {TD}">{str(r.get("Matière", ""))[:80]}</td>
+          <td {TD}text-align:center;">{int(float(r.get("VHP", 0) or 0))}</td>
+          <td {TD}text-align:center;">{int(float(r.get("VHR", 0) or 0))}</td>
+          <td {TD}text-align:center;font-weight:900;color:{ec_color};">{ec}</td>
+          <td {TD}"><span style="display:inline-block;padding:6px 10px;border-radius:999px;font-weight:900;font-size:12px;background:rgba(242,153,0,0.14);color:#B26A00;border:1px solid rgba(242,153,0,0.30);">{r.get("Statut_auto", "")}</span></td>
+          <td {TD}">{r.get("Raison_alerte", "")}</td>
+        </tr>
+        """
+    return "\n".join(lignes_txt), lignes_html
+
+
+def bench(label: str, render_all, repeat: int) -> None:
+    """`render_all()` rend tout le lot et retourne la liste des (texte, HTML)."""
+    bodies = render_all()  # échauffement
+    sizes = [len(h.encode("utf-8")) for _, h in bodies]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        render_all()
+    elapsed = (time.perf_counter() - t0) / repeat
+    print(f"{label:<16} {len(bodies):>8} {elapsed:>10.3f} {len(bodies) / elapsed:>10.0f} {np.mean(sizes) / 1024:>16.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teachers", type=int, default=200)
+    parser.add_argument("--rows-per-teacher", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = synthetic_alerts(args.teachers, args.rows_per_teacher)
+    lot = "🚨 Toutes les alertes"
+    groups = [(prof, g) for (prof, _), g in df.groupby(["Responsable", "Email"])]
+
+    print(f"{'rendu':<16} {'emails':>8} {'durée (s)':>10} {'emails/s':>10} {'HTML/email (Ko)':>16}")
+    bench("gabarit (lot)", lambda: list(render_prof_emails(df, lot, "Oct", "Mars", THRESHOLDS, CFG).values()), args.repeat)
+    bench("gabarit (unité)", lambda: [render_prof_email(p, lot, "Oct", "Mars", THRESHOLDS, g, CFG) for p, g in groups], args.repeat)
+    bench("iterrows", lambda: [legacy_render(p, lot, g) for p, g in groups], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de l'export Excel consolidé : écriture en flux (`df_to_excel_bytes`)
+contre l'ancien `pd.ExcelWriter(engine="openpyxl")` en mode normal.
+
+Usage:
+    python benchmarks/bench_excel_export.py --rows 5000 20000 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.data_pipeline import MOIS_COLS, df_to_excel_bytes  # noqa: E402
+
+
+def legacy_excel_bytes(sheets: Dict[str, pd.DataFrame]) -> bytes:
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for name, sheet_df in sheets.items():
+            sheet_df.to_excel(writer, sheet_name=name[:31], index=False)
+    return output.getvalue()
+
+
+def synthetic_export(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Même forme que la feuille « Consolidé » (toutes lignes × 11 mois + métriques)."""
+    rng = np.random.default_rng(seed)
+    vhp = rng.choice([15, 20, 30, 45, 60], size=n_rows).astype(float)
+    months = rng.integers(0, 8, size=(n_rows, len(MOIS_COLS))).astype(float)
+    months[rng.random(months.shape) < 0.3] = np.nan
+    vhr = np.nansum(months, axis=1)
+    df = pd.DataFrame({
+        "Classe": rng.choice([f"Classe {i}" for i in range(60)], size=n_rows),
+        "Semestre": rng.choice(["S1", "S2"], size=n_rows),
+        "Matière": [f"Matière {i % 400}" for i in range(n_rows)],
+        "Début prévu": pd.Timestamp("2025-10-01") + pd.to_timedelta(rng.integers(0, 120, n_rows), unit="D"),
+        "Fin prévue": pd.Timestamp("2026-02-01") + pd.to_timedelta(rng.integers(0, 150, n_rows), unit="D"),
+        "VHP": vhp,
+    })
+    for j, m in enumerate(MOIS_COLS):
+        df[m] = months[:, j]
+    df["VHR"] = vhr
+    df["Écart"] = vhr - vhp
+    df["Taux"] = np.round(np.where(vhp > 0, vhr / vhp, 0) * 100, 2)
+    df["Statut_auto"] = np.where(vhr <= 0, "Non démarré", np.where(vhr < vhp, "En cours", "Terminé"))
+    df["Observations"] = np.where(rng.random(n_rows) < 0.2, "Retard signalé par l'enseignant", "")
+    return df
+
+
+def measure(fn: Callable[[], bytes], memory: bool = True) -> tuple[float, float, int]:
+    """Durée mesurée sans tracemalloc (qui ralentit fortement), pic mémoire dans une 2e passe."""
+    t0 = time.perf_counter()
+    data = fn()
+    elapsed = time.perf_counter() - t0
+    peak_mb = float("nan")
+    if memory:
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1e6
+    return elapsed, peak_mb, len(data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--skip-legacy", action="store_true", help="ne mesurer que l'écriture en flux")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire (plus rapide)")
+    args = parser.parse_args()
+
+    print(f"{'lignes':>8} {'moteur':<10} {'durée (s)':>10} {'lignes/s':>10} {'pic mémoire (Mo)':>17} {'taille (Ko)':>12}")
+    for n in args.rows:
+        sheets = {"Consolidé": synthetic_export(n)}
+        engines = [("flux", lambda: df_to_excel_bytes(sheets))]
+        if not args.skip_legacy:
+            engines.append(("pandas", lambda: legacy_excel_bytes(sheets)))
+        for label, fn in engines:
+            elapsed, peak_mb, size = measure(fn, memory=not args.no_memory)
+            print(f"{n:>8} {label:<10} {elapsed:>10.2f} {n / elapsed:>10.0f} {peak_mb:>17.1f} {size / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark des thèmes d'observations hors ligne (TF-IDF + k-means NumPy) sur
+des observations toutes distinctes, le cas le plus coûteux.
+
+Usage:
+    python benchmarks/bench_obs_themes.py --rows 2000 5000 10000 --repeat 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from utils.obs_themes import observation_themes  # noqa: E402
+
+VOCAB = (
+    "absent salle indisponible retard rattrapage examen projet chapitre reprise enseignant "
+    "materiel panne greve ferie stage soutenance evaluation travaux pratiques dirige"
+).split()
+
+
+def synthetic_distinct(n_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Observations de 3 à 10 mots, quasiment toutes distinctes (vocabulaire de ~600 termes)."""
+    rng = np.random.default_rng(seed)
+    words = np.array(VOCAB + [f"terme{i}" for i in range(600)])
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 11))) for _ in range(n_rows)]
+    return pd.DataFrame({"Classe": [f"Classe {i % 60:02d}" for i in range(n_rows)], "Observations": texts})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[2000, 5000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    observation_themes(synthetic_distinct(50))  # échauffement
+    print(f"{'lignes':>8} {'distinctes':>10} {'thèmes':>7} {'durée (s)':>10}")
+    for n in args.rows:
+        df = synthetic_distinct(n)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            res = observation_themes(df)
+        elapsed = (time.perf_counter() - t0) / args.repeat
+        print(f"{n:>8} {res.n_distinct:>10} {len(res.themes):>7} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
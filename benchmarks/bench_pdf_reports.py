@@ -0,0 +1,107 @@
+"""
+Benchmark du rendu PDF (pages/s) sur un jeu de 60 classes.
+
+Usage:
+    python benchmarks/bench_pdf_reports.py --classes 60 --rows-per-class 22 --repeat 3
+    python benchmarks/bench_pdf_reports.py --workers 4   # + rendu parallèle (pool de processus)
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from pypdf import PdfReader
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.pdf_reports import (  # noqa: E402
+    build_pdf_observations_report,
+    build_pdf_report,
+    create_report_executor,
+    render_pdf_observations_report,
+    render_pdf_report,
+)
+
+MOIS = ["Oct", "Nov", "Déc", "Jan", "Fév", "Mars"]
+OBS_SAMPLES = [
+    "Retard dû aux jours fériés, rattrapage prévu.",
+    "Enseignant absent deux semaines.\nSéances reprogrammées en soirée.",
+    "Salle indisponible <labo> & matériel en panne.",
+    "RAS",
+]
+
+
+def synthetic_dataset(n_classes: int, rows_per_class: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = n_classes * rows_per_class
+    vhp = rng.choice([15, 20, 30, 45, 60], size=n).astype(float)
+    vhr = np.round(vhp * rng.uniform(0, 1.1, size=n))
+    df = pd.DataFrame({
+        "Classe": np.repeat([f"L{1 + i % 3} Groupe {i:02d}" for i in range(n_classes)], rows_per_class),
+        "Semestre": rng.choice(["S1", "S2"], size=n),
+        "Type": rng.choice(["CM", "TD", "TP"], size=n),
+        "Matière": [f"Matière {i % 150} — Introduction aux systèmes" for i in range(n)],
+        "Responsable": [f"Enseignant {i % 45}" for i in range(n)],
+        "Début prévu": "01/10/2025",
+        "Fin prévue": "28/02/2026",
+        "VHP": vhp,
+    })
+    for m in MOIS:
+        df[m] = np.round(vhr / len(MOIS))
+    df["VHR"] = vhr
+    df["Écart"] = vhr - vhp
+    df["Taux"] = np.where(vhp > 0, vhr / vhp, 0.0)
+    df["Statut_auto"] = np.where(vhr <= 0, "Non démarré", np.where(vhr < vhp, "En cours", "Terminé"))
+    df["Observations"] = np.where(rng.random(n) < 0.35, rng.choice(OBS_SAMPLES, size=n), "")
+    return df
+
+
+def pages(pdf: bytes) -> int:
+    return len(PdfReader(io.BytesIO(pdf)).pages)
+
+
+def bench(label: str, fn, repeat: int) -> None:
+    pdf = fn()  # échauffement (imports, polices)
+    n_pages = pages(pdf)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - t0) / repeat
+    print(f"{label:<34} {n_pages:>6} {elapsed:>10.3f} {n_pages / elapsed:>10.1f} {len(pdf) / 1024:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=60)
+    parser.add_argument("--rows-per-class", type=int, default=22)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="taille du pool pour le rendu parallèle (0 = non mesuré)")
+    args = parser.parse_args()
+
+    df = synthetic_dataset(args.classes, args.rows_per_class)
+    common = dict(title="Rapport mensuel — benchmark", mois_couverts=MOIS, department="Département (BENCH)", institution="Institut")
+    main_kw = dict(common, df=df, thresholds={"ecart_critique": -6})
+    obs_kw = dict(common, df=df)
+
+    print(f"{len(df)} lignes, {args.classes} classes")
+    print(f"{'rapport':<34} {'pages':>6} {'durée (s)':>10} {'pages/s':>10} {'taille (Ko)':>10}")
+    bench("mensuel (1 processus)", lambda: build_pdf_report(**main_kw), args.repeat)
+    bench("observations (1 processus)", lambda: build_pdf_observations_report(**obs_kw), args.repeat)
+
+    if args.workers > 0:
+        executor = create_report_executor(args.workers)
+        try:
+            bench(f"mensuel ({args.workers} workers)", lambda: render_pdf_report(executor, n_chunks=args.workers, **main_kw), args.repeat)
+            bench(f"observations ({args.workers} workers)", lambda: render_pdf_observations_report(executor, n_chunks=args.workers, **obs_kw), args.repeat)
+        finally:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
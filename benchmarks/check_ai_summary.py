@@ -0,0 +1,159 @@
+"""
+Vérification du résumé IA des observations avec un client local qui imite
+`client.responses.create` (aucun appel réseau) : payload dédupliqué sous
+budget de tokens, cache par prompt et modèle, map-reduce parallèle par
+classe, diffusion de la synthèse finale.
+
+Usage:
+    python benchmarks/check_ai_summary.py --classes 30 --rows-per-class 25 --latency 0.3
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.ai_summary import ObservationSummarizer, build_obs_payload  # noqa: E402
+from utils.artifacts import ArtifactCache  # noqa: E402
+
+
+class StandInResponses:
+    """`responses.create(model=, input=, stream=)` : réponse synthétique après `latency` secondes."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self.max_concurrent = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, model: str, messages: list) -> str:
+        with self._lock:
+            self.calls += 1
+            self._running += 1
+            self.max_concurrent = max(self.max_concurrent, self._running)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self._running -= 1
+        user = messages[-1]["content"]
+        return f"### Synthèse ({model})\n- {user.count(chr(10)) + 1} lignes de prompt analysées.\n- Actions : relancer les enseignants.\n"
+
+    def create(self, model: str, input: list, stream: bool = False):
+        text = self._answer(model, input)
+        if not stream:
+            return SimpleNamespace(output_text=text)
+
+        def events():
+            for i in range(0, len(text), 16):
+                yield SimpleNamespace(type="response.output_text.delta", delta=text[i:i + 16])
+            yield SimpleNamespace(type="response.completed")
+        return events()
+
+
+class StandInClient:
+    def __init__(self, latency: float):
+        self.responses = StandInResponses(latency)
+
+
+def synthetic_observations(n_classes: int, rows_per_class: int, seed: int = 0) -> pd.DataFrame:
+    """Observations répétitives (variantes de casse / ponctuation) et quelques textes propres à une matière."""
+    rng = np.random.default_rng(seed)
+    n = n_classes * rows_per_class
+    recurring = rng.choice(
+        ["Enseignant absent", "enseignant absent.", "Reprise prévue", "Reprise  prévue !", "Salle indisponible", ""],
+        size=n,
+    )
+    specific = np.array([f"Chapitre {k} non traité, rattrapage à planifier" for k in rng.integers(0, 400, size=n)])
+    return pd.DataFrame({
+        "Classe": np.repeat([f"L{1 + i % 3} Groupe {i:02d}" for i in range(n_classes)], rows_per_class),
+        "Matière": [f"Matière {i % 40}" for i in range(n)],
+        "Écart": rng.integers(-20, 5, size=n),
+        "Statut_auto": rng.choice(["Non démarré", "En cours", "Terminé"], size=n),
+        "Observations": np.where(rng.random(n) < 0.3, specific, recurring),
+    })
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=30)
+    parser.add_argument("--rows-per-class", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    df = synthetic_observations(args.classes, args.rows_per_class)
+
+    # 0) Payload : doublons regroupés, budget respecté, chaque classe représentée
+    t0 = time.perf_counter()
+    payload = build_obs_payload(df, max_lines=300, token_budget=3000)
+    elapsed = time.perf_counter() - t0
+    classes = set(df.loc[df["Observations"] != "", "Classe"])
+    assert payload.tokens <= 3000 and len(payload.lines) <= 300
+    assert {c for c, _ in payload.lines} == classes
+    assert payload.n_groups < payload.n_observations
+    print(
+        f"payload           : {payload.n_observations} observations → {payload.n_groups} distinctes → "
+        f"{len(payload.lines)} lignes (~{payload.tokens} tokens, {payload.n_covered} observations couvertes) "
+        f"en {elapsed * 1000:.0f} ms"
+    )
+    small = build_obs_payload(df, max_lines=100).lines
+    large = build_obs_payload(df, max_lines=800, token_budget=60000).lines
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(disk_dir=Path(tmp))
+
+        # 1) Petit volume : un appel, diffusé
+        client = StandInClient(args.latency)
+        deltas = []
+        s = ObservationSummarizer(client, cache=cache, map_workers=args.workers)
+        text = s.summarize(small, "Département test", "Oct", "Mars", on_delta=deltas.append)
+        assert client.responses.calls == 1 and "".join(deltas) == text
+        print(f"petit volume      : {len(small)} lignes, 1 appel, {len(deltas)} fragments diffusés")
+
+        # 2) Même données : servi depuis le cache (mémoire puis disque)
+        again = ObservationSummarizer(client, cache=cache).summarize(small, "Département test", "Oct", "Mars")
+        cold = ObservationSummarizer(client, cache=ArtifactCache(disk_dir=Path(tmp))).summarize(
+            small, "Département test", "Oct", "Mars"
+        )
+        assert again == text == cold and client.responses.calls == 1
+        print("cache             : 0 appel au second clic (mémoire et disque)")
+
+        # 3) Gros volume : map parallèle par classe + reduce
+        timings = {}
+        for workers in (1, args.workers):
+            client = StandInClient(args.latency)
+            progress = []
+            s = ObservationSummarizer(client, cache=ArtifactCache(), map_workers=workers)
+            t0 = time.perf_counter()
+            s.summarize(large, "Département test", "Oct", "Mars", on_progress=lambda d, t: progress.append((d, t)))
+            timings[workers] = time.perf_counter() - t0
+            n_batches = progress[-1][1] - 1
+            assert client.responses.calls == n_batches + 1 and progress[-1][0] == progress[-1][1]
+            assert client.responses.max_concurrent <= workers
+        print(
+            f"map-reduce        : {len(large)} lignes → {n_batches} lots + 1 fusion ; "
+            f"séquentiel {timings[1]:.2f} s, {args.workers} workers {timings[args.workers]:.2f} s"
+        )
+        assert timings[args.workers] < timings[1]
+
+        # 4) Autre modèle : nouvelles réponses
+        client = StandInClient(0)
+        ObservationSummarizer(client, model="autre-modele", cache=cache).summarize(small, "Département test", "Oct", "Mars")
+        assert client.responses.calls == 1
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
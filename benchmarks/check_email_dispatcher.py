@@ -0,0 +1,160 @@
+"""
+Vérification de `dispatch_emails` contre un serveur SMTP local de substitution
+(aucun email réel n'est envoyé) : débit plafonné, reprise sur erreurs 4xx,
+échec définitif sur 5xx, reconnexion après coupure.
+
+Usage:
+    python benchmarks/check_email_dispatcher.py --messages 60 --workers 4 --rate 20 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.email_dispatcher import dispatch_emails  # noqa: E402
+from services.email_notifications import build_email_message  # noqa: E402
+
+
+class StandInSMTP(socketserver.ThreadingTCPServer):
+    """
+    Serveur SMTP minimal (EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT) avec pannes simulées :
+    - `greylist` : 451 au premier RCPT de chaque adresse listée ;
+    - `reject`   : 550 pour les adresses listées ;
+    - `drop_every` : coupe la connexion après chaque N-ième message accepté ;
+    - `drop_in_data` : message reçu puis connexion coupée avant la réponse à
+      DATA (remise incertaine côté client) ;
+    - `latency`  : délai avant la réponse à DATA.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, greylist=(), reject=(), drop_every=0, latency=0.0, drop_in_data=()):
+        super().__init__(("127.0.0.1", 0), _SMTPHandler)
+        self.greylist = set(greylist)
+        self.reject = set(reject)
+        self.drop_in_data = set(drop_in_data)
+        self.drop_every = drop_every
+        self.latency = latency
+        self.delivered = Counter()
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._accepted = 0
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self) -> None:
+        srv = self.server
+        with srv.lock:
+            srv.connections += 1
+        self.reply("220 stand-in ESMTP")
+        rcpts = []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            cmd = raw.decode(errors="replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb == "MAIL":
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                addr = cmd.split(":", 1)[1].strip().strip("<>")
+                with srv.lock:
+                    if addr in srv.reject:
+                        self.reply("550 No such user")
+                        continue
+                    if addr in srv.greylist:
+                        srv.greylist.discard(addr)
+                        self.reply("451 Greylisted, try again later")
+                        continue
+                rcpts.append(addr)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(srv.latency)
+                with srv.lock:
+                    srv.delivered.update(rcpts)
+                    srv._accepted += 1
+                    drop = srv.drop_every and srv._accepted % srv.drop_every == 0
+                    if srv.drop_in_data.intersection(rcpts):
+                        return
+                self.reply("250 Queued")
+                if drop:
+                    return
+            elif verb in ("RSET", "NOOP"):
+                rcpts = []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=20.0, help="messages/s (0 = illimité)")
+    parser.add_argument("--latency", type=float, default=0.05, help="délai serveur par message (s)")
+    args = parser.parse_args()
+
+    emails = [f"prof{i}@example.org" for i in range(args.messages)]
+    greylisted, rejected, cut_in_data = set(emails[1::10]), {emails[5]}, {emails[8]}
+    server = StandInSMTP(
+        greylist=greylisted, reject=rejected, drop_every=7, latency=args.latency, drop_in_data=cut_in_data
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    messages = [
+        build_email_message("suivi@example.org", [e], f"Notification {i}", "texte", "<p>html</p>")
+        for i, e in enumerate(emails)
+    ]
+    report = dispatch_emails(
+        messages,
+        smtp_host=host,
+        smtp_port=port,
+        workers=args.workers,
+        rate_per_second=args.rate,
+        backoff_base_s=0.2,
+        starttls=False,
+        on_progress=lambda done, total, _: print(f"\r{done}/{total}", end="", flush=True),
+    )
+    print()
+    server.shutdown()
+
+    expected_sent = args.messages - len(rejected) - len(cut_in_data)
+    duration_floor = (args.messages - args.workers) / args.rate if args.rate > 0 else 0.0
+    print(f"envoyés {report.sent}/{args.messages}, échecs {report.failed}, reprises {report.retries}, "
+          f"connexions {server.connections}, {report.elapsed_s:.2f} s ({args.messages / report.elapsed_s:.1f} msg/s)")
+
+    assert report.sent == expected_sent, report.failures
+    assert {o.recipients[0] for o in report.failures} == rejected | cut_in_data
+    # Coupure pendant DATA : échec définitif, jamais renvoyé (le serveur a reçu le message)
+    assert all(not o.transient and o.attempts == 1 for o in report.failures if o.recipients[0] in cut_in_data)
+    assert report.retries >= len(greylisted)
+    assert all(o.attempts == 2 for o, e in zip(report.outcomes, emails) if e in greylisted)
+    assert all(server.delivered[e] == 1 for e in emails if e not in rejected), "doublon ou message perdu"
+    assert report.elapsed_s >= duration_floor * 0.9, "débit plafonné non respecté"
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
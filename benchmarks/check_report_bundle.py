@@ -0,0 +1,67 @@
+"""
+Vérification du ZIP des rapports (un PDF par classe / par responsable) :
+archive relisible en rendu séquentiel et en rendu parallèle, un fichier par
+PDF même quand deux noms donnent le même nom de fichier.
+
+Usage:
+    python benchmarks/check_report_bundle.py --classes 6 --workers 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import sys
+import zipfile
+from pathlib import Path
+
+from pypdf import PdfReader
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_pdf_reports import MOIS, synthetic_dataset  # noqa: E402
+from services.pdf_reports import build_report_bundle, create_report_executor, report_bundle_jobs  # noqa: E402
+
+
+def check_zip(label: str, data: bytes, jobs: list) -> None:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert sorted(names) == sorted(arcname for arcname, _, _ in jobs), names
+        for name in names:
+            assert len(PdfReader(io.BytesIO(zf.read(name))).pages) >= 1
+    print(f"{label:<12}: {len(names)} PDF, archive valide ({len(data) / 1024:.0f} Ko)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", type=int, default=6)
+    parser.add_argument("--rows-per-class", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    df = synthetic_dataset(args.classes, args.rows_per_class)
+    # Collision de noms de fichiers : "L1/Groupe 00" et "L1 Groupe 00" → "L1_Groupe_00"
+    df.loc[df["Classe"] == df["Classe"].iloc[0], "Classe"] = "L1/Groupe 00"
+    df.loc[df["Classe"] == df["Classe"].iloc[-1], "Classe"] = "L1 Groupe 00"
+
+    common = dict(mois_couverts=MOIS, department="Département (CHECK)", institution="Institut")
+    titles = {"rapport": "Rapport", "observations": "Observations"}
+    jobs = []
+    for by in ("Classe", "Responsable"):
+        jobs += report_bundle_jobs(df, by, ["rapport", "observations"], titles, common, thresholds={"ecart_critique": -6})
+    arcnames = [arcname for arcname, _, _ in jobs]
+    assert len(set(arcnames)) == len(arcnames), "noms dupliqués dans le ZIP"
+    assert "classes/rapport_L1_Groupe_00_2.pdf" in arcnames
+
+    check_zip("séquentiel", build_report_bundle(None, jobs), jobs)
+    executor = create_report_executor(args.workers)
+    try:
+        check_zip(f"{args.workers} workers", build_report_bundle(executor, jobs), jobs)
+    finally:
+        executor.shutdown()
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Stress du verrou d'envoi mensuel : plusieurs processus × plusieurs threads
+tentent, mois par mois, de prendre le verrou du même (profil, mois), « envoient »
+(section critique instrumentée) puis le relâchent. Vérifie :
+
+- exclusion mutuelle : jamais deux détenteurs dans la section critique ;
+- un seul envoi par mois : le premier détenteur envoie, les suivants voient
+  le mois déjà marqué envoyé et n'envoient pas.
+
+Usage:
+    python benchmarks/stress_reminder_state.py --processes 4 --threads 8 --months 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.reminder_state import ReminderStateStore, new_owner  # noqa: E402
+
+PROFILE = "IAID"
+
+
+def _worker(db: str, months: list, threads: int, hold_s: float, counters) -> None:
+    """
+    `counters` : (détenteurs présents par mois, violations, envois par mois, verrous
+    refusés), partagés entre processus.
+    """
+    inside, violations, sends, refused = counters
+    store = ReminderStateStore(Path(db))
+
+    def run() -> None:
+        for i, month in enumerate(months):
+            while True:
+                owner = new_owner()
+                if not store.try_acquire(PROFILE, month, owner, ttl_s=30):
+                    with refused.get_lock():
+                        refused.value += 1
+                    time.sleep(0.001)
+                    continue
+                with inside.get_lock():
+                    inside[i] += 1
+                    if inside[i] > 1:
+                        with violations.get_lock():
+                            violations.value += 1
+                sent = False
+                try:
+                    if not store.is_sent(PROFILE, month):
+                        time.sleep(hold_s)  # envoi simulé
+                        with sends.get_lock():
+                            sends[i] += 1
+                        sent = True
+                finally:
+                    with inside.get_lock():
+                        inside[i] -= 1
+                    store.release(PROFILE, month, owner, sent=sent)
+                break
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--months", type=int, default=5)
+    parser.add_argument("--hold-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    months = [f"2026-{m:02d}" for m in range(1, args.months + 1)]
+    with tempfile.TemporaryDirectory() as tmp:
+        db = str(Path(tmp) / "reminder_state.sqlite3")
+        ReminderStateStore(Path(db))
+        counters = (mp.Array("i", len(months)), mp.Value("i", 0), mp.Array("i", len(months)), mp.Value("i", 0))
+        t0 = time.perf_counter()
+        procs = [
+            mp.Process(target=_worker, args=(db, months, args.threads, args.hold_ms / 1000, counters))
+            for _ in range(args.processes)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - t0
+        last = ReminderStateStore(Path(db)).last_sent_month(PROFILE)
+
+    inside, sends = list(counters[0]), list(counters[2])
+    violations, refused = counters[1].value, counters[3].value
+    attempts = args.processes * args.threads * len(months)
+    print(f"détenteurs        : {attempts} ({args.processes} processus × {args.threads} threads × {len(months)} mois)")
+    print(f"verrous refusés   : {refused}")
+    print(f"violations        : {violations}")
+    print(f"envois par mois   : {sends} (attendu 1 chacun)")
+    print(f"dernier mois      : {last}")
+    print(f"durée             : {elapsed:.2f} s")
+    assert all(p.exitcode == 0 for p in procs), "un processus a échoué"
+    assert violations == 0 and not any(inside), "exclusion mutuelle violée"
+    assert sends == [1] * len(months), "nombre d'envois incorrect"
+    assert last == months[-1]
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
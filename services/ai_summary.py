@@ -0,0 +1,269 @@
+"""
+Résumé IA des observations (API Responses d'OpenAI ou tout client compatible).
+
+- Le client est injecté : l'app passe un `OpenAI(...)`, les vérifications un
+  client local qui imite `client.responses.create`.
+- Chaque réponse est mise en cache par (modèle, empreinte du prompt) : un
+  second clic sur les mêmes données ne rappelle pas l'API.
+- Au-delà de `map_threshold` lignes, les observations sont découpées par
+  classe et résumées en parallèle (map), puis fusionnées en une synthèse DG
+  (reduce). Seule la réponse finale est diffusée au fil de l'eau (`on_delta`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.artifacts import ArtifactCache
+from utils.obs_themes import normalize_observations
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+PROMPT_VERSION = 1  # à incrémenter si les prompts changent (invalide le cache)
+
+SYSTEM_PROMPT = (
+    "Tu es un assistant de pilotage académique. "
+    "Tu dois produire un résumé professionnel, clair, actionnable, style Direction Générale. "
+    "Ne divulgue aucune donnée sensible (emails, infos perso)."
+)
+
+_FINAL_TASK = """
+Tâche:
+1) Résumé exécutif (5–8 lignes)
+2) Points critiques récurrents (5–10 puces)
+3) Actions recommandées (3–7 actions)
+4) Synthèse par classe (1–2 lignes par classe max)
+Format: Markdown.
+""".strip()
+
+_MAP_TASK = """
+Tâche: pour chaque classe ci-dessus, en 3 à 6 puces maximum :
+points critiques, causes signalées, actions déjà prévues ou à prévoir.
+Reste factuel, pas d'introduction ni de conclusion. Format: Markdown, un titre `### <classe>` par classe.
+""".strip()
+
+EMPTY_SUMMARY = "Aucune observation renseignée sur la période sélectionnée."
+
+
+# -----------------------------
+# Payload
+# -----------------------------
+DEFAULT_TOKEN_BUDGET = 6000
+CHARS_PER_TOKEN = 4      # estimation sans tokenizer (texte français, ordre de grandeur suffisant)
+MAX_OBS_CHARS = 280      # une observation très longue ne doit pas consommer le budget à elle seule
+MAX_MATIERES = 3
+
+_STATUT_RANK = {"Non démarré": 0, "En cours": 1, "Terminé": 2}
+
+
+@dataclass
+class ObsPayload:
+    """Lignes envoyées au modèle [(classe, ligne)] et ce qu'elles couvrent."""
+
+    lines: List[Tuple[str, str]]
+    n_observations: int   # observations non vides en entrée
+    n_groups: int         # observations distinctes (par classe, après normalisation)
+    n_covered: int        # observations représentées par les lignes retenues
+    tokens: int           # estimation du coût des lignes retenues
+
+
+def build_obs_payload(
+    df_obs: pd.DataFrame,
+    max_lines: int = 300,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> ObsPayload:
+    """
+    Observations non vides regroupées par (classe, texte normalisé) avec leur
+    nombre d'occurrences, les matières concernées, le pire écart et son
+    statut. Priorité aux retards les plus critiques, puis aux plus fréquentes ;
+    chaque classe garde au moins sa ligne la plus critique tant que le budget
+    le permet. Au plus `max_lines` lignes et ~`token_budget` tokens.
+    """
+    d = pd.DataFrame(index=df_obs.index)
+    for c in ["Classe", "Matière", "Statut_auto", "Observations"]:
+        d[c] = df_obs[c].astype("string").fillna("").str.strip() if c in df_obs.columns else ""
+    d["Écart"] = pd.to_numeric(df_obs["Écart"], errors="coerce").fillna(0) if "Écart" in df_obs.columns else 0.0
+    d = d[(d["Observations"].str.len() > 0) & ~d["Observations"].str.casefold().isin(["nan", "none"])]
+    if d.empty:
+        return ObsPayload([], 0, 0, 0, 0)
+
+    d["_norm"] = normalize_observations(d["Observations"])
+    d["_rank"] = d["Statut_auto"].map(_STATUT_RANK).fillna(len(_STATUT_RANK))
+    # Ligne la plus critique de chaque groupe en tête : `first` = pire écart + son statut
+    d = d.sort_values(["Écart", "_rank"], kind="stable")
+    groups = (
+        d.groupby(["Classe", "_norm"], sort=False)
+        .agg(
+            Obs=("Observations", "first"),
+            n=("Observations", "size"),
+            ecart=("Écart", "first"),
+            statut=("Statut_auto", "first"),
+            matieres=("Matière", "unique"),
+        )
+        .reset_index()
+        .sort_values(["ecart", "n"], ascending=[True, False], kind="stable")
+    )
+
+    mat = groups["matieres"].map(
+        lambda m: ", ".join(x for x in m[:MAX_MATIERES] if x) + (f" (+{len(m) - MAX_MATIERES})" if len(m) > MAX_MATIERES else "")
+    )
+    obs = groups["Obs"].str.slice(0, MAX_OBS_CHARS)
+    count = groups["n"].map(lambda n: f" (×{n})" if n > 1 else "")
+    text = (
+        "- Classe: " + groups["Classe"] + " | Matière(s): " + mat + " | Statut: " + groups["statut"]
+        + " | Écart(h): " + groups["ecart"].map("{:g}".format) + " | Obs" + count + ": " + obs
+    )
+    cost = (text.str.len() + 1 + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    # Couverture : la ligne la plus critique de chaque classe passe avant le reste
+    first_of_class = ~groups["Classe"].duplicated()
+    order = np.concatenate([np.flatnonzero(first_of_class.to_numpy()), np.flatnonzero(~first_of_class.to_numpy())])
+    fits = np.cumsum(cost.to_numpy()[order]) <= token_budget
+    chosen = np.sort(order[fits][: max(0, int(max_lines))])  # retour à l'ordre de priorité
+
+    picked = groups.iloc[chosen]
+    return ObsPayload(
+        lines=list(zip(picked["Classe"].tolist(), text.iloc[chosen].tolist())),
+        n_observations=len(d),
+        n_groups=len(groups),
+        n_covered=int(picked["n"].sum()),
+        tokens=int(cost.iloc[chosen].sum()),
+    )
+
+
+def class_batches(lines: List[Tuple[str, str]], batch_lines: int) -> List[List[Tuple[str, str]]]:
+    """Regroupe les lignes par classe (ordre alphabétique) en lots d'environ `batch_lines` lignes."""
+    by_class: Dict[str, List[Tuple[str, str]]] = {}
+    for classe, line in lines:
+        by_class.setdefault(classe, []).append((classe, line))
+    batches: List[List[Tuple[str, str]]] = [[]]
+    for classe in sorted(by_class):
+        rows = by_class[classe]
+        if batches[-1] and len(batches[-1]) + len(rows) > batch_lines:
+            batches.append([])
+        batches[-1].extend(rows)
+    return [b for b in batches if b]
+
+
+def _context(department: str, mois_min: str, mois_max: str) -> str:
+    return f"Contexte:\n- Département: {department}\n- Période: {mois_min} → {mois_max}"
+
+
+# -----------------------------
+# Appels modèle
+# -----------------------------
+def prompt_key(model: str, system: str, user: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (str(PROMPT_VERSION), model, system, user):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return "ai_" + h.hexdigest()
+
+
+def _create_text(client, model: str, system: str, user: str, on_delta: Optional[Callable[[str], None]] = None) -> str:
+    """Un appel `responses.create` ; avec `on_delta`, la réponse est lue en streaming."""
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": user}]
+    if on_delta is None:
+        return client.responses.create(model=model, input=messages).output_text
+    parts = []
+    for event in client.responses.create(model=model, input=messages, stream=True):
+        if getattr(event, "type", "") == "response.output_text.delta":
+            parts.append(event.delta)
+            on_delta(event.delta)
+    return "".join(parts)
+
+
+class ObservationSummarizer:
+    """
+    `client` : objet exposant `responses.create(model=..., input=..., stream=...)`.
+    `cache` : ArtifactCache partagé (réponses stockées en UTF-8), optionnel.
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str = DEFAULT_MODEL,
+        cache: Optional[ArtifactCache] = None,
+        map_threshold: int = 150,
+        batch_lines: int = 80,
+        map_workers: int = 4,
+    ):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.map_threshold = int(map_threshold)
+        self.batch_lines = int(batch_lines)
+        self.map_workers = max(1, int(map_workers))
+        self.api_calls = 0
+
+    def _ask(self, user: str, on_delta: Optional[Callable[[str], None]] = None) -> str:
+        key = prompt_key(self.model, SYSTEM_PROMPT, user)
+        if self.cache is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                text = hit.decode("utf-8")
+                if on_delta is not None:
+                    on_delta(text)
+                return text
+        self.api_calls += 1
+        text = _create_text(self.client, self.model, SYSTEM_PROMPT, user, on_delta)
+        if self.cache is not None and text.strip():
+            self.cache.put(key, text.encode("utf-8"))
+        return text
+
+    def summarize(
+        self,
+        lines: List[Tuple[str, str]],
+        department: str,
+        mois_min: str,
+        mois_max: str,
+        on_delta: Optional[Callable[[str], None]] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> str:
+        """
+        Synthèse DG des lignes de `build_obs_payload`. `on_progress(faits, total)`
+        suit les appels (map + reduce) ; `on_delta(texte)` reçoit la synthèse
+        finale au fil de l'eau (d'un bloc si elle vient du cache).
+        """
+        if not lines:
+            return EMPTY_SUMMARY
+        ctx = _context(department, mois_min, mois_max)
+
+        if len(lines) <= self.map_threshold:
+            user = f"{ctx}\n\nDonnées (observations consolidées):\n" + "\n".join(l for _, l in lines) + f"\n\n{_FINAL_TASK}"
+            text = self._ask(user, on_delta)
+            if on_progress:
+                on_progress(1, 1)
+            return text
+
+        # Map : un résumé par lot de classes, en parallèle
+        batches = class_batches(lines, self.batch_lines)
+        total = len(batches) + 1
+        done = 0
+        with ThreadPoolExecutor(max_workers=min(self.map_workers, len(batches)), thread_name_prefix="ai-map") as pool:
+            futures = [
+                pool.submit(self._ask, f"{ctx}\n\nObservations:\n" + "\n".join(l for _, l in b) + f"\n\n{_MAP_TASK}")
+                for b in batches
+            ]
+            partials = []
+            for fut in futures:
+                partials.append(fut.result())
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+
+        # Reduce : synthèse DG à partir des résumés par classe (diffusée)
+        user = (
+            f"{ctx}\n\nDonnées (synthèses par classe, issues de {len(lines)} observations):\n"
+            + "\n\n".join(p.strip() for p in partials)
+            + f"\n\n{_FINAL_TASK}"
+        )
+        text = self._ask(user, on_delta)
+        if on_progress:
+            on_progress(total, total)
+        return text
@@ -0,0 +1,233 @@
+"""
+Envoi concurrent des notifications : pool de workers (une connexion SMTP
+chacun), débit plafonné (messages/s) et nouvelles tentatives avec
+backoff exponentiel pour les erreurs SMTP transitoires.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import random
+import smtplib
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import Callable, List, Optional, Sequence
+
+from services.email_notifications import SendOutcome, SMTPDeliveryUnknown, SMTPSession
+
+
+class TokenBucket:
+    """Limiteur de débit partagé entre threads : `rate` jetons/s, rafale `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Erreurs qui valent une nouvelle tentative : coupure/timeout réseau et
+    réponses SMTP 4xx (greylisting, 421, 451…). Les 5xx (adresse refusée,
+    authentification) sont définitives, comme une coupure pendant DATA
+    (`SMTPDeliveryUnknown`) : le message a pu être remis, la suite revient à l'outbox.
+    """
+    if isinstance(exc, SMTPDeliveryUnknown):
+        return False
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPException):
+        return False
+    return isinstance(exc, OSError)
+
+
+@dataclass
+class DispatchReport:
+    """Bilan d'un envoi : un `SendOutcome` par message, dans l'ordre d'entrée."""
+
+    outcomes: List[SendOutcome] = field(default_factory=list)
+    retries: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for o in self.outcomes if o is not None and o.ok)
+
+    @property
+    def failed(self) -> int:
+        return len(self.failures)
+
+    @property
+    def failures(self) -> List[SendOutcome]:
+        return [o for o in self.outcomes if o is not None and not o.ok]
+
+
+class _RetryQueue:
+    """File à échéances : un message en attente de backoff ne bloque aucun worker."""
+
+    def __init__(self, n_items: int):
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._remaining = n_items
+        self.cond = threading.Condition()
+
+    def put(self, item, ready_at: float = 0.0) -> None:
+        with self.cond:
+            heapq.heappush(self._heap, (ready_at, next(self._seq), item))
+            self.cond.notify()
+
+    def get(self):
+        """Prochain élément prêt, ou None quand tout est terminé."""
+        with self.cond:
+            while True:
+                if self._remaining <= 0:
+                    return None
+                if self._heap:
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        return heapq.heappop(self._heap)[2]
+                    self.cond.wait(delay)
+                else:
+                    self.cond.wait()
+
+    def done(self) -> None:
+        with self.cond:
+            self._remaining -= 1
+            self.cond.notify_all()
+
+    @property
+    def remaining(self) -> int:
+        return self._remaining
+
+
+def dispatch_emails(
+    messages: Sequence[EmailMessage],
+    smtp_host: str,
+    smtp_port: int,
+    smtp_user: str = "",
+    smtp_pass: str = "",
+    workers: int = 3,
+    rate_per_second: float = 2.0,
+    max_retries: int = 3,
+    backoff_base_s: float = 2.0,
+    backoff_max_s: float = 60.0,
+    on_progress: Optional[Callable[[int, int, DispatchReport], None]] = None,
+    **session_kwargs,
+) -> DispatchReport:
+    """
+    Envoie `messages` avec `workers` connexions SMTP en parallèle, sans dépasser
+    `rate_per_second` messages/s au total. Une erreur transitoire replanifie le
+    message après `backoff_base_s * 2**(tentative-1)` (± 20 %), jusqu'à
+    `max_retries` nouvelles tentatives.
+
+    `on_progress(terminés, total, rapport)` est appelé dans le thread appelant
+    (compatible Streamlit), à chaque message terminé.
+    """
+    total = len(messages)
+    report = DispatchReport(outcomes=[None] * total)  # type: ignore[list-item]
+    if total == 0:
+        return report
+
+    t0 = time.perf_counter()
+    bucket = TokenBucket(rate_per_second, burst=max(1, int(workers)))
+    pending = _RetryQueue(total)
+    for i in range(total):
+        pending.put((i, 1))
+    finished = 0
+    lock = threading.Lock()
+
+    def recipients_of(msg: EmailMessage) -> List[str]:
+        return [a.strip() for a in str(msg.get("To", "")).split(",") if a.strip()]
+
+    def finish(i: int, outcome: SendOutcome) -> None:
+        nonlocal finished
+        with lock:
+            report.outcomes[i] = outcome
+            finished += 1
+        pending.done()
+
+    def worker() -> None:
+        session = SMTPSession(smtp_host, smtp_port, smtp_user, smtp_pass, **session_kwargs)
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                i, attempt = item
+                msg = messages[i]
+                bucket.acquire()
+                try:
+                    session.send(msg)
+                except Exception as exc:
+                    session.close()  # repartir d'une connexion neuve
+                    transient = is_transient_error(exc)
+                    if attempt <= max_retries and transient:
+                        delay = min(backoff_max_s, backoff_base_s * 2 ** (attempt - 1))
+                        with lock:
+                            report.retries += 1
+                        pending.put((i, attempt + 1), time.monotonic() + delay * random.uniform(0.8, 1.2))
+                        continue
+                    finish(i, SendOutcome(recipients_of(msg), str(msg.get("Subject", "")), False, str(exc), attempt, transient))
+                else:
+                    finish(i, SendOutcome(recipients_of(msg), str(msg.get("Subject", "")), True, "", attempt))
+        finally:
+            session.close()
+
+    threads = [
+        threading.Thread(target=worker, name=f"email-dispatch-{k}", daemon=True)
+        for k in range(max(1, min(int(workers), total)))
+    ]
+    for t in threads:
+        t.start()
+
+    # Progression remontée dans le thread appelant (les workers n'ont pas de contexte Streamlit)
+    reported = 0
+    while True:
+        with pending.cond:
+            if pending.remaining > 0 and finished == reported:
+                pending.cond.wait(0.5)
+        if finished != reported:
+            reported = finished
+            report.elapsed_s = time.perf_counter() - t0
+            if on_progress is not None:
+                on_progress(reported, total, report)
+        if reported >= total:
+            break
+        if not any(t.is_alive() for t in threads):
+            # Workers arrêtés sur une erreur inattendue : ne pas attendre indéfiniment
+            for i, outcome in enumerate(report.outcomes):
+                if outcome is None:
+                    msg = messages[i]
+                    report.outcomes[i] = SendOutcome(
+                        recipients_of(msg), str(msg.get("Subject", "")), False, "Envoi interrompu (worker arrêté)", 0, True
+                    )
+            break
+
+    for t in threads:
+        t.join()
+    report.elapsed_s = time.perf_counter() - t0
+    return report
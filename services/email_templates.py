@@ -0,0 +1,260 @@
+"""
+Gabarits des emails enseignants, compilés une fois par département.
+
+Les parties fixes (styles, en-têtes, pied) sont assemblées à la création du
+gabarit ; seules les lignes varient. Elles sont rendues à partir des colonnes
+(valeurs converties et échappées en bloc), et produisent le texte brut et le
+HTML dans la même passe. Les styles de cellules sont partagés via des classes
+CSS au lieu d'être répétés sur chaque `<td>`.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import html
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+PROF_TABLE_COLS = ["Classe", "Semestre", "Type", "Matière", "VHP", "VHR", "Écart", "Statut_auto", "Raison_alerte"]
+
+_CSS = """
+.nt{border-collapse:collapse;width:100%;font-size:13px}
+.nt th{padding:10px;text-align:left;border-bottom:1px solid #E3E8F0;background:#F6F8FC}
+.nt td{padding:10px;border-bottom:1px solid #E3E8F0}
+.nt .n{text-align:center}
+.nt .e{text-align:center;font-weight:900;color:#0F172A}
+.nt .ec{color:#D93025}
+.chip{display:inline-block;padding:6px 10px;border-radius:999px;font-weight:900;font-size:12px}
+.ok{background:rgba(30,142,62,0.12);color:#1E8E3E;border:1px solid rgba(30,142,62,0.25)}
+.wip{background:rgba(242,153,0,0.14);color:#B26A00;border:1px solid rgba(242,153,0,0.30)}
+.ko{background:rgba(217,48,37,0.12);color:#D93025;border:1px solid rgba(217,48,37,0.25)}
+""".strip().replace("\n", "")
+
+_CHIPS = {
+    "Terminé": '<span class="chip ok">✅ Terminé</span>',
+    "En cours": '<span class="chip wip">🟠 En cours</span>',
+}
+_CHIP_DEFAULT = '<span class="chip ko">🔴 Non démarré</span>'
+
+_ROW_HTML = (
+    "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td>"
+    '<td class="n">{}</td><td class="n">{}</td><td class="{}">{}</td><td>{}</td><td>{}</td></tr>'
+)
+_ROW_TEXT = "- {} | {} | {} | {} | VHP={} VHR={} Écart={} | {} | {}"
+
+
+def _lit(s: str) -> str:
+    """Texte littéral inséré dans un gabarit `str.format` (accolades doublées)."""
+    return s.replace("{", "{{").replace("}", "}}")
+
+
+def _text_col(s: pd.Series, max_len: int = 0) -> np.ndarray:
+    out = s.fillna("").astype(str)
+    if max_len:
+        out = out.str.slice(0, max_len)
+    return out.to_numpy()
+
+
+def _int_col(s: pd.Series) -> np.ndarray:
+    """Équivalent vectorisé de `int(float(x or 0))` (troncature vers 0)."""
+    return pd.to_numeric(s, errors="coerce").fillna(0).to_numpy(dtype=float).astype(np.int64)
+
+
+def _escape_col(values: np.ndarray) -> List[str]:
+    # Beaucoup de répétitions (classes, types, statuts) : échapper chaque valeur distincte une fois
+    uniq, inverse = np.unique(values, return_inverse=True)
+    escaped = np.array([html.escape(v) for v in uniq], dtype=object)
+    return escaped[inverse].tolist()
+
+
+def render_prof_rows(df: pd.DataFrame, ecart_critique: float) -> Tuple[List[str], List[str]]:
+    """
+    Lignes HTML et texte de toutes les lignes de `df` (dans son ordre), calculées
+    colonne par colonne sur le frame entier : conversions et échappement une
+    seule fois pour tous les enseignants.
+    """
+    g = df.reindex(columns=PROF_TABLE_COLS)
+    classe, sem, typ = _text_col(g["Classe"]), _text_col(g["Semestre"]), _text_col(g["Type"])
+    mat_full = _text_col(g["Matière"])
+    statut, raison = _text_col(g["Statut_auto"]), _text_col(g["Raison_alerte"])
+    vhp, vhr, ec = _int_col(g["VHP"]), _int_col(g["VHR"]), _int_col(g["Écart"])
+    ec_cls = np.where(ec <= ecart_critique, "e ec", "e").tolist()
+    chips = [_CHIPS.get(s.strip(), _CHIP_DEFAULT) for s in statut]
+
+    vhp_l, vhr_l, ec_l = vhp.tolist(), vhr.tolist(), ec.tolist()
+    rows_html = list(map(
+        _ROW_HTML.format,
+        _escape_col(classe), _escape_col(sem), _escape_col(typ), _escape_col(_text_col(g["Matière"], max_len=80)),
+        vhp_l, vhr_l, ec_cls, ec_l, chips, _escape_col(raison),
+    ))
+    rows_text = list(map(
+        _ROW_TEXT.format,
+        classe.tolist(), sem.tolist(), typ.tolist(), mat_full.tolist(),
+        vhp_l, vhr_l, ec_l, statut.tolist(), raison.tolist(),
+    ))
+    return rows_html, rows_text
+
+
+class ProfEmailTemplate:
+    """Email de notification enseignant (texte + HTML) pour un département."""
+
+    def __init__(self, dept_code: str, department_long: str):
+        dept = _lit(html.escape(dept_code))
+        dept_long = html.escape(department_long)
+        self.dept_code = dept_code
+        self.department_long = department_long
+        # Parties fixes pré-assemblées ; {…} remplis au rendu
+        self._html_head = (
+            '<!doctype html><html lang="fr"><head><meta charset="utf-8"/>'
+            f"<style>{_lit(_CSS)}</style></head>"
+            '<body style="margin:0;padding:0;background:#0B3D91;">'
+            '<div style="background:linear-gradient(180deg,#0B3D91 0%,#134FA8 100%);padding:34px 12px;">'
+            '<div style="max-width:900px;margin:0 auto;background:#FFFFFF;border-radius:20px;'
+            "box-shadow:0 20px 50px rgba(0,0,0,0.25);overflow:hidden;"
+            'font-family:Arial,Helvetica,sans-serif;color:#0F172A;">'
+            '<div style="padding:22px 26px;background:linear-gradient(90deg,#0B3D91,#1F6FEB);color:#FFFFFF;">'
+            f'<div style="font-size:18px;font-weight:900;">{dept} — Notification Enseignant</div>'
+            '<div style="margin-top:6px;font-size:13px;font-weight:700;opacity:.95;">'
+            "{lot} • Période : {mois_min} → {mois_max}</div>"
+            '<div style="margin-top:6px;font-size:12px;font-weight:700;opacity:.9;">Mise à jour : {now}</div>'
+            "</div>"
+            '<div style="padding:26px;line-height:1.55;">'
+            '<p style="margin-top:0;">Bonjour <b>{prof}</b>,</p>'
+        )
+        self._html_section = (
+            "<p>Vous avez <b>{n} élément(s)</b> concerné(s) par le lot : <b>{lot}</b>.</p>"
+            '<div style="margin:18px 0;border:1px solid #E3E8F0;border-radius:14px;overflow:hidden;">'
+            '<table class="nt"><thead><tr>'
+            '<th>Classe</th><th>Sem</th><th>Type</th><th>Matière</th>'
+            '<th class="n">VHP</th><th class="n">VHR</th><th class="n">Écart</th><th>Statut</th><th>Raison</th>'
+            "</tr></thead><tbody>{rows}</tbody></table></div>"
+        )
+        self._html_info = (
+            '<div style="margin:14px 0;background:#F6F8FC;border:1px solid #E3E8F0;border-radius:14px;padding:14px 16px;">'
+            '<div style="font-weight:900;color:#0B3D91;margin-bottom:6px;">📌 Information</div>'
+            '<div style="font-size:13px;">Aucune action n’est requise. Message transmis à titre informatif.</div>'
+            "</div>"
+        )
+        self._html_foot = (
+            f'<p style="font-size:13px;color:#475569;">Message généré automatiquement — {dept_long}.</p>'
+            "</div>"
+            '<div style="padding:14px 26px;background:#FBFCFF;border-top:1px solid #E3E8F0;'
+            f'font-size:12px;color:#475569;text-align:center;">{dept_long}</div>'
+            "</div></div></body></html>"
+        )
+        self._text_head = (
+            f"{_lit(dept_code)} — Notification de suivi des enseignements\n"
+            "Période : {mois_min} → {mois_max}\n\n"
+            "Bonjour {prof},\n\n"
+        )
+        self._text_section = "Lot : {lot}\nÉléments concernés : {n}\n\n{rows}\n\n"
+        self._text_foot = f"{department_long}\n"
+
+    def render_body(
+        self,
+        prof: str,
+        lot_label: str,
+        mois_min: str,
+        mois_max: str,
+        sections: List[Tuple[str, int, str, str]],
+    ) -> Tuple[str, str]:
+        """
+        Assemble (texte brut, HTML) à partir de lignes déjà rendues.
+        `sections` : (lot, nb lignes, lignes HTML, lignes texte) — une seule
+        section pour un lot, plusieurs pour un digest.
+        """
+        now_str = dt.datetime.now().strftime("%d/%m/%Y %H:%M")
+        body_html = (
+            self._html_head.format(
+                lot=html.escape(lot_label), mois_min=html.escape(mois_min), mois_max=html.escape(mois_max),
+                now=now_str, prof=html.escape(prof),
+            )
+            + self._html_info
+            + "".join(self._html_section.format(n=n, lot=html.escape(sec), rows=rows) for sec, n, rows, _ in sections)
+            + self._html_foot
+        )
+        body_text = (
+            self._text_head.format(mois_min=mois_min, mois_max=mois_max, prof=prof)
+            + "".join(self._text_section.format(lot=sec, n=n, rows=rows) for sec, n, _, rows in sections)
+            + self._text_foot
+        )
+        return body_text, body_html
+
+
+@lru_cache(maxsize=8)
+def prof_email_template(dept_code: str, department_long: str) -> ProfEmailTemplate:
+    return ProfEmailTemplate(dept_code, department_long)
+
+
+def render_prof_emails(
+    alerts: pd.DataFrame,
+    lot_label: str,
+    mois_min: str,
+    mois_max: str,
+    thresholds: dict,
+    cfg: dict,
+    by: Tuple[str, str] = ("Responsable", "Email"),
+    section_col: Optional[str] = None,
+    sections: Optional[List[str]] = None,
+) -> Dict[tuple, Tuple[str, str]]:
+    """
+    (texte, HTML) de chaque enseignant de `alerts`, clé = valeurs de `by`.
+    Les lignes sont rendues une fois pour tout le frame, triées par (enseignant,
+    section, écart croissant), puis découpées par enseignant et par section.
+
+    Digest : avec `section_col` (ex. `_lot`), chaque enseignant reçoit un seul
+    message avec une section par valeur, dans l'ordre de `sections`.
+    """
+    if alerts.empty:
+        return {}
+    tpl = prof_email_template(str(cfg["dept_code"]), str(cfg["department_long"]))
+    codes = alerts.groupby(list(by), sort=True).ngroup().to_numpy()
+    ec = pd.to_numeric(alerts["Écart"], errors="coerce").to_numpy(dtype=float) if "Écart" in alerts else np.zeros(len(alerts))
+    if section_col:
+        sec_cat = pd.Categorical(alerts[section_col], categories=sections or sorted(alerts[section_col].unique()))
+        sec_codes = sec_cat.codes
+        sec_names = list(sec_cat.categories)
+    else:
+        sec_codes = np.zeros(len(alerts), dtype=np.int8)
+        sec_names = [lot_label]
+    order = np.lexsort((ec, sec_codes, codes))
+    d = alerts.iloc[order]
+    codes, sec_codes = codes[order], np.asarray(sec_codes)[order]
+    rows_html, rows_text = render_prof_rows(d, thresholds["ecart_critique"])
+
+    keys = list(d[list(by)].itertuples(index=False, name=None))
+    # Frontières (enseignant, section) ; un changement d'enseignant ouvre un nouveau message
+    cuts = np.flatnonzero((np.diff(codes) != 0) | (np.diff(sec_codes) != 0)) + 1
+    starts = np.concatenate(([0], cuts)).tolist()
+    ends = np.concatenate((cuts, [len(d)])).tolist()
+
+    grouped: Dict[tuple, List[Tuple[str, int, str, str]]] = {}
+    for start, end in zip(starts, ends):
+        grouped.setdefault(keys[start], []).append((
+            sec_names[sec_codes[start]], end - start,
+            "".join(rows_html[start:end]), "\n".join(rows_text[start:end]),
+        ))
+    return {
+        key: tpl.render_body(str(key[0]), lot_label, mois_min, mois_max, secs)
+        for key, secs in grouped.items()
+    }
+
+
+def render_prof_email(
+    prof: str,
+    lot_label: str,
+    mois_min: str,
+    mois_max: str,
+    thresholds: dict,
+    gprof: pd.DataFrame,
+    cfg: dict,
+) -> Tuple[str, str]:
+    """(texte, HTML) de la notification d'un seul enseignant (voir `render_prof_emails` pour un lot)."""
+    tpl = prof_email_template(str(cfg["dept_code"]), str(cfg["department_long"]))
+    ec = pd.to_numeric(gprof["Écart"], errors="coerce") if "Écart" in gprof else pd.Series(0, index=gprof.index)
+    g = gprof.iloc[np.argsort(ec.to_numpy(dtype=float), kind="stable")]
+    rows_html, rows_text = render_prof_rows(g, thresholds["ecart_critique"])
+    return tpl.render_body(prof, lot_label, mois_min, mois_max, [(lot_label, len(g), "".join(rows_html), "\n".join(rows_text))])
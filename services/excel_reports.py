@@ -0,0 +1,74 @@
+"""
+Excel consolidé (détail + synthèses + charge mensuelle).
+
+Comme les rapports PDF, il peut être construit dans le pool de processus de
+l'app : l'écriture openpyxl est du Python pur qui garde le GIL.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional
+
+import pandas as pd
+
+from utils.analytics import workload_matrix
+from utils.data_pipeline import MOIS_COLS, df_to_excel_bytes
+
+
+def build_consolidated_excel(filtered: pd.DataFrame, mois_couverts: List[str]) -> bytes:
+    """Excel consolidé (détail + synthèses + charge mensuelle) des lignes filtrées."""
+    export_df = filtered[
+        ["Classe","Semestre","Matière","Début prévu","Fin prévue","VHP"]
+        + MOIS_COLS
+        + ["VHR","Écart","Taux","Statut_auto","Observations"]
+    ].copy()
+
+    export_df["Taux"] = (export_df["Taux"]*100).round(2)
+
+    synth_class = filtered.groupby("Classe").agg(
+        Matieres=("Matière","count"),
+        Taux_moy=("Taux","mean"),
+        VHP_total=("VHP","sum"),
+        VHR_total=("VHR","sum"),
+        Retard_h=("Écart", lambda s: float(s[s<0].sum()))
+    ).reset_index()
+    synth_class["Taux_moy"] = (synth_class["Taux_moy"]*100).round(2)
+
+    synth_resp = filtered.groupby("Responsable").agg(
+        Matieres=("Matière","count"),
+        Classes=("Classe","nunique"),
+        VHP_total=("VHP","sum"),
+        VHR_total=("VHR","sum"),
+        Taux_moy=("Taux","mean"),
+        Retard_h=("Écart", lambda s: float(s[s<0].sum())),
+        Non_demarre=("Statut_auto", lambda s: int((s=="Non démarré").sum())),
+    ).reset_index()
+    synth_resp["Taux_moy"] = (synth_resp["Taux_moy"]*100).round(2)
+
+    charge_mensuelle = workload_matrix(filtered, mois_couverts).reset_index()
+
+    return df_to_excel_bytes({
+        "Consolidé": export_df,
+        "Synthese_Classes": synth_class,
+        "Synthese_Responsables": synth_resp,
+        "Charge_Mensuelle": charge_mensuelle,
+    })
+
+
+def render_consolidated_excel(executor: Optional[Executor], filtered: pd.DataFrame, mois_couverts: List[str]) -> bytes:
+    """`build_consolidated_excel` exécuté dans `executor` (rendu direct sans pool ou si le pool est cassé)."""
+    if executor is None:
+        return build_consolidated_excel(filtered, mois_couverts)
+    # Seules les colonnes utilisées traversent la frontière de processus
+    cols = list(dict.fromkeys(
+        ["Classe","Semestre","Matière","Début prévu","Fin prévue","VHP","Responsable","_resp_code"]
+        + MOIS_COLS
+        + ["VHR","Écart","Taux","Statut_auto","Observations"]
+    ))
+    frame = filtered[[c for c in cols if c in filtered.columns]]
+    try:
+        return executor.submit(build_consolidated_excel, frame, mois_couverts).result()
+    except BrokenProcessPool:
+        return build_consolidated_excel(filtered, mois_couverts)
@@ -0,0 +1,164 @@
+"""
+Registre des notifications enseignants réellement envoyées.
+
+Pour chaque message mis en file, le registre garde l'empreinte de chaque ligne
+d'alerte (clé de ligne + statut + tranche d'écart). Une ligne n'est « connue »
+que si le message correspondant est marqué envoyé dans l'outbox (même fichier
+SQLite). Le mode « changements uniquement » compare ainsi l'état courant au
+dernier envoi réussi et ne renvoie que les lignes nouvelles ou modifiées.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.outbox import STATUS_SENT
+
+# Largeur (heures) des tranches d'écart : -3h puis -4h = même tranche, pas de renvoi
+ECART_BUCKET_H = 5.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    idem_key    TEXT PRIMARY KEY,
+    responsable TEXT NOT NULL,
+    email       TEXT NOT NULL,
+    lot         TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    n_rows      INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_ledger_lot_email ON ledger(lot, email, responsable);
+
+CREATE TABLE IF NOT EXISTS ledger_rows (
+    idem_key TEXT NOT NULL,
+    row_fp   TEXT NOT NULL,
+    PRIMARY KEY (idem_key, row_fp)
+) WITHOUT ROWID;
+"""
+
+
+def row_fingerprints(df: pd.DataFrame, bucket_h: float = ECART_BUCKET_H) -> np.ndarray:
+    """Empreinte par ligne : `_rowkey` + statut + tranche d'écart (vectorisé)."""
+    bucket = np.floor(pd.to_numeric(df["Écart"], errors="coerce").fillna(0).to_numpy(dtype=float) / bucket_h)
+    parts = pd.DataFrame({
+        "k": df["_rowkey"].astype(str).to_numpy() if "_rowkey" in df.columns else df.index.astype(str),
+        "s": df["Statut_auto"].astype(str).to_numpy(),
+        "b": bucket.astype(np.int64),
+    })
+    h = pd.util.hash_pandas_object(parts, index=False).to_numpy()
+    return np.array([f"{x:016x}" for x in h.tolist()], dtype=object)
+
+
+def set_fingerprint(row_fps: Iterable[str]) -> str:
+    """Empreinte d'un ensemble de lignes (indépendante de l'ordre)."""
+    return hashlib.blake2b("\x1f".join(sorted(row_fps)).encode("ascii"), digest_size=16).hexdigest()
+
+
+def transition_fingerprint(current_fps: Iterable[str], last_sent_fps: Iterable[str]) -> str:
+    """
+    Empreinte du passage « dernier état envoyé → état courant » d'un enseignant,
+    à inclure dans la clé d'idempotence : un retour à un état déjà notifié
+    (X → Y → X) produit une nouvelle clé, un re-clic sur le même état non.
+    """
+    return set_fingerprint([set_fingerprint(last_sent_fps), set_fingerprint(current_fps)])
+
+
+class NotificationLedger:
+    """
+    Empreintes des lignes envoyées par (enseignant, email, lot). `path` est le fichier de
+    l'outbox : le statut « envoyé » y est lu par jointure.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._write_lock = threading.Lock()
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def record(self, entries: Iterable[Tuple[str, str, str, str, List[str]]]) -> None:
+        """
+        `entries` : (idem_key, responsable, email, lot, empreintes de lignes) des
+        messages mis en file. Elles ne comptent qu'une fois le message envoyé.
+        Une clé déjà enregistrée prend le nouvel état (ses lignes sont remplacées).
+        """
+        header, rows = [], []
+        for key, responsable, email, lot, fps in entries:
+            header.append((key, str(responsable).strip(), email.strip().lower(), lot, set_fingerprint(fps), len(fps)))
+            rows.extend((key, fp) for fp in fps)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)", header)
+            conn.executemany("DELETE FROM ledger_rows WHERE idem_key = ?", [(h[0],) for h in header])
+            conn.executemany("INSERT OR IGNORE INTO ledger_rows VALUES (?, ?)", rows)
+
+    def last_sent(self, lot: str, emails: Iterable[str]) -> Dict[Tuple[str, str], Set[str]]:
+        """
+        Empreintes des lignes du dernier message envoyé, par (responsable, email)
+        (absent = jamais notifié).
+        """
+        wanted = sorted({e.strip().lower() for e in emails})
+        if not wanted:
+            return {}
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TEMP TABLE wanted (e TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO wanted VALUES (?)", [(e,) for e in wanted])
+            # Dernier envoi réussi par email (id outbox croissant => le plus récent gagne)
+            latest = {(resp, email): key for resp, email, key in conn.execute(
+                "SELECT l.responsable, l.email, l.idem_key FROM ledger l "
+                "JOIN wanted w ON w.e = l.email "
+                "JOIN outbox o ON o.idem_key = l.idem_key "
+                "WHERE l.lot = ? AND o.status = ? ORDER BY o.id",
+                (lot, STATUS_SENT),
+            )}
+            if not latest:
+                return {}
+            conn.execute("CREATE TEMP TABLE last_keys (k TEXT PRIMARY KEY)")
+            conn.executemany("INSERT INTO last_keys VALUES (?)", [(k,) for k in latest.values()])
+            by_key: Dict[str, Set[str]] = {k: set() for k in latest.values()}
+            for key, fp in conn.execute(
+                "SELECT r.idem_key, r.row_fp FROM ledger_rows r JOIN last_keys k ON k.k = r.idem_key"
+            ):
+                by_key[key].add(fp)
+        return {who: by_key[key] for who, key in latest.items()}
+
+
+def changed_rows(
+    alerts: pd.DataFrame,
+    ledger: NotificationLedger,
+    lot: str,
+    bucket_h: float = ECART_BUCKET_H,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Sépare un lot en lignes à envoyer (nouvelles ou modifiées depuis le dernier
+    envoi réussi à cet enseignant) et synthèse par enseignant (lignes
+    courantes / à envoyer / inchangé). Retourne (lignes à envoyer, synthèse).
+    Les empreintes sont lues dans `_notif_fp` si la colonne existe déjà.
+    """
+    fps = alerts["_notif_fp"].to_numpy() if "_notif_fp" in alerts.columns else row_fingerprints(alerts, bucket_h)
+    emails = alerts["Email"].astype(str).str.strip().str.lower().to_numpy()
+    profs = alerts["Responsable"].astype(str).str.strip().to_numpy()
+    known = ledger.last_sent(lot, set(emails))
+    is_new = np.fromiter(
+        (fp not in known.get((p, e), ()) for p, e, fp in zip(profs, emails, fps)),
+        dtype=bool,
+        count=len(alerts),
+    )
+    summary = (
+        pd.DataFrame({"Responsable": alerts["Responsable"].to_numpy(), "Email": alerts["Email"].to_numpy(), "nouveau": is_new})
+        .groupby(["Responsable", "Email"], sort=True)
+        .agg(Lignes=("nouveau", "size"), A_envoyer=("nouveau", "sum"))
+        .reset_index()
+    )
+    summary["Inchangé"] = summary["A_envoyer"] == 0
+    return alerts[is_new], summary
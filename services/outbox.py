@@ -0,0 +1,357 @@
+"""
+File d'envoi persistante (SQLite, WAL) pour les notifications.
+
+Chaque message est enregistré avant l'envoi avec une clé d'idempotence
+(mois, lot, destinataire, empreinte du contenu) : un double clic, un rerun
+ou un redémarrage ne met jamais deux fois le même message en file. Un worker
+en arrière-plan réclame les messages par bail (`lease`) et les envoie ; un
+bail expiré (process tué pendant l'envoi) rend le message à nouveau disponible.
+
+Remise « au moins une fois » : chaque message accepté par le serveur SMTP est
+marqué envoyé aussitôt (pas en fin de lot), mais si le process meurt entre
+l'acceptation et cette écriture, le message repart à l'expiration du bail.
+Une coupure pendant DATA n'est jamais retentée automatiquement (échec
+définitif, à relancer manuellement) : voir `SMTPDeliveryUnknown`.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from email import message_from_bytes
+from email import policy
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.email_dispatcher import DispatchReport, dispatch_emails
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+STATUS_LABELS = {
+    STATUS_PENDING: "⏳ En file",
+    STATUS_SENDING: "📤 En cours",
+    STATUS_SENT: "✅ Envoyé",
+    STATUS_FAILED: "❌ Échec",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY,
+    idem_key        TEXT NOT NULL UNIQUE,
+    kind            TEXT NOT NULL,
+    month           TEXT NOT NULL,
+    lot             TEXT NOT NULL DEFAULT '',
+    recipient       TEXT NOT NULL,
+    label           TEXT NOT NULL DEFAULT '',
+    subject         TEXT NOT NULL,
+    message         BLOB NOT NULL,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    last_error      TEXT NOT NULL DEFAULT '',
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    lease_until     REAL NOT NULL DEFAULT 0,
+    created_at      TEXT NOT NULL,
+    sent_at         TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON outbox(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_outbox_month_kind ON outbox(month, kind, status);
+"""
+
+
+def idempotency_key(month: str, lot: str, email: str, content_hash: str) -> str:
+    """Clé d'un message : même mois, même lot, même destinataire, même contenu => même clé."""
+    raw = "\x1f".join([month, lot, email.strip().lower(), content_hash])
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def rows_content_hash(df: pd.DataFrame, columns: Optional[List[str]] = None) -> str:
+    """
+    Empreinte des lignes notifiées, indépendante de leur ordre : un enseignant
+    n'est renotifié que si ses lignes (statut, écart, raison…) ont changé.
+    """
+    cols = [c for c in (columns or list(df.columns)) if c in df.columns]
+    if df.empty or not cols:
+        return ""
+    hashed = np.sort(pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy())
+    return hashlib.blake2b(repr(cols).encode("utf-8") + hashed.tobytes(), digest_size=16).hexdigest()
+
+
+class Outbox:
+    """Messages en attente / envoyés, un fichier SQLite par profil."""
+
+    def __init__(self, path: Path, max_attempts: int = 5, lease_s: float = 300.0):
+        self.path = Path(path)
+        self.max_attempts = max_attempts
+        self.lease_s = lease_s
+        self._write_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # -----------------------------
+    # Écriture
+    # -----------------------------
+    def enqueue(
+        self,
+        kind: str,
+        month: str,
+        messages: Iterable[tuple],
+        lot: str = "",
+    ) -> int:
+        """
+        `messages` : tuples (idem_key, recipient, label, EmailMessage).
+        Les clés déjà présentes sont ignorées (INSERT OR IGNORE). Retourne le
+        nombre de messages réellement ajoutés.
+        """
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (key, kind, month, lot, recipient, label, str(msg.get("Subject", "")), msg.as_bytes(), now)
+            for key, recipient, label, msg in messages
+        ]
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox "
+                "(idem_key, kind, month, lot, recipient, label, subject, message, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return conn.total_changes - before
+
+    def claim(self, limit: int = 50) -> List[tuple]:
+        """
+        Réserve jusqu'à `limit` messages dus (en file, ou bail expiré) pour
+        `lease_s` secondes. Retourne des tuples (id, EmailMessage).
+        """
+        now = time.time()
+        with self._write_lock, closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, message FROM outbox "
+                "WHERE (status = ? AND next_attempt_at <= ?) OR (status = ? AND lease_until < ?) "
+                "ORDER BY id LIMIT ?",
+                (STATUS_PENDING, now, STATUS_SENDING, now, int(limit)),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET status = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                [(STATUS_SENDING, now + self.lease_s, rid) for rid, _ in rows],
+            )
+            conn.commit()
+        return [(rid, message_from_bytes(blob, policy=policy.SMTP)) for rid, blob in rows]
+
+    def mark_sent(self, ids: List[int]) -> None:
+        now = dt.datetime.now().isoformat(timespec="seconds")
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "UPDATE outbox SET status = ?, sent_at = ?, last_error = '', lease_until = 0 WHERE id = ?",
+                [(STATUS_SENT, now, rid) for rid in ids],
+            )
+
+    def mark_failed(self, rid: int, error: str, transient: bool, backoff_s: float = 60.0) -> None:
+        """Échec transitoire : remis en file avec backoff, sauf si `max_attempts` atteint."""
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            (attempts,) = conn.execute("SELECT attempts FROM outbox WHERE id = ?", (rid,)).fetchone()
+            if transient and attempts < self.max_attempts:
+                delay = backoff_s * 2 ** max(0, attempts - 1)
+                conn.execute(
+                    "UPDATE outbox SET status = ?, last_error = ?, next_attempt_at = ?, lease_until = 0 WHERE id = ?",
+                    (STATUS_PENDING, error, time.time() + delay, rid),
+                )
+            else:
+                conn.execute(
+                    "UPDATE outbox SET status = ?, last_error = ?, lease_until = 0 WHERE id = ?",
+                    (STATUS_FAILED, error, rid),
+                )
+
+    def retry_failed(self, month: str, kind: Optional[str] = None) -> int:
+        """Remet en file les échecs définitifs d'un mois (après correction d'une adresse, du SMTP…)."""
+        q = "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = 0 WHERE status = ? AND month = ?"
+        params: list = [STATUS_PENDING, STATUS_FAILED, month]
+        if kind:
+            q += " AND kind = ?"
+            params.append(kind)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            return conn.execute(q, params).rowcount
+
+    def cancel_pending(self, keys: List[str], reason: str = "Annulé") -> int:
+        """Passe en échec les messages `keys` encore en attente (ceux en cours d'envoi partent quand même)."""
+        if not keys:
+            return 0
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            return sum(
+                conn.execute(
+                    "UPDATE outbox SET status = ?, last_error = ? WHERE idem_key = ? AND status = ?",
+                    (STATUS_FAILED, reason, k, STATUS_PENDING),
+                ).rowcount
+                for k in keys
+            )
+
+    # -----------------------------
+    # Lecture
+    # -----------------------------
+    def status_of(self, keys: List[str]) -> pd.DataFrame:
+        """Statut des messages identifiés par leurs clés d'idempotence."""
+        if not keys:
+            return pd.DataFrame(columns=["idem_key", "recipient", "label", "status", "attempts", "last_error", "sent_at"])
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TEMP TABLE wanted (k TEXT PRIMARY KEY)")
+            conn.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", [(k,) for k in keys])
+            return pd.read_sql_query(
+                "SELECT idem_key, recipient, label, status, attempts, last_error, sent_at "
+                "FROM outbox JOIN wanted ON outbox.idem_key = wanted.k ORDER BY outbox.id",
+                conn,
+            )
+
+    def summary(self, month: str) -> pd.DataFrame:
+        """Nombre de messages par (kind, lot, status) pour un mois."""
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT kind, lot, status, COUNT(*) AS n FROM outbox WHERE month = ? "
+                "GROUP BY kind, lot, status ORDER BY kind, lot, status",
+                conn,
+                params=(month,),
+            )
+
+    def failures(self, month: str) -> pd.DataFrame:
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                "SELECT kind, lot, recipient, label, attempts, last_error, created_at FROM outbox "
+                "WHERE month = ? AND status = ? ORDER BY id",
+                conn,
+                params=(month, STATUS_FAILED),
+            )
+
+    def has_sent(self, kind: str, month: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT 1 FROM outbox WHERE kind = ? AND month = ? AND status = ? LIMIT 1",
+                (kind, month, STATUS_SENT),
+            ).fetchone()
+        return row is not None
+
+    def pending_count(self) -> int:
+        with closing(self._connect()) as conn:
+            (n,) = conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN (?, ?)", (STATUS_PENDING, STATUS_SENDING)
+            ).fetchone()
+        return n
+
+
+class OutboxWorker:
+    """
+    Thread d'arrière-plan qui vide l'outbox : réclame un lot, l'envoie via
+    `dispatch_emails`, enregistre chaque résultat. Indépendant des sessions
+    Streamlit ; au démarrage de l'app il reprend ce qui restait en file.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        smtp_config: Callable[[], dict],
+        batch_size: int = 50,
+        poll_s: float = 15.0,
+    ):
+        self.outbox = outbox
+        self.smtp_config = smtp_config
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.last_error = ""
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def drain_once(self) -> int:
+        """Envoie un lot de messages dus. Retourne le nombre de messages traités."""
+        claimed = self.outbox.claim(self.batch_size)
+        if not claimed:
+            return 0
+        try:
+            cfg = self.smtp_config()
+        except Exception as exc:
+            self.last_error = str(exc)
+            for rid, _ in claimed:
+                self.outbox.mark_failed(rid, self.last_error, transient=True)
+            return len(claimed)
+
+        # Chaque résultat est enregistré dès qu'il est connu : si le process meurt en
+        # cours de lot, seuls les messages sans résultat repartent au prochain bail.
+        recorded = [False] * len(claimed)
+
+        def record(report: DispatchReport) -> None:
+            sent = []
+            for i, o in enumerate(report.outcomes):
+                if o is None or recorded[i]:
+                    continue
+                recorded[i] = True
+                if o.ok:
+                    sent.append(claimed[i][0])
+                else:
+                    self.outbox.mark_failed(claimed[i][0], o.error, o.transient)
+            if sent:
+                self.outbox.mark_sent(sent)
+
+        report = dispatch_emails(
+            [msg for _, msg in claimed],
+            smtp_host=cfg["smtp_host"],
+            smtp_port=cfg["smtp_port"],
+            smtp_user=cfg["smtp_user"],
+            smtp_pass=cfg["smtp_pass"],
+            workers=cfg.get("smtp_workers", 3),
+            rate_per_second=cfg.get("smtp_rate", 2.0),
+            on_progress=lambda done, total, rep: record(rep),
+        )
+        record(report)
+        self.last_error = report.failures[-1].error if report.failures else ""
+        return len(claimed)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                while not self._stop.is_set() and self.drain_once():
+                    pass
+            except Exception as exc:  # ne jamais tuer le worker (base verrouillée, disque plein…)
+                self.last_error = str(exc)
+            self._wake.wait(self.poll_s)
+            self._wake.clear()
+
+    def wait_for(self, keys: List[str], timeout_s: float, on_poll: Optional[Callable[[pd.DataFrame], None]] = None) -> pd.DataFrame:
+        """
+        Attend (au plus `timeout_s`) que les messages `keys` soient envoyés ou en
+        échec définitif. `on_poll(statuts)` permet d'afficher la progression.
+        """
+        deadline = time.monotonic() + timeout_s
+        while True:
+            status = self.outbox.status_of(keys)
+            if on_poll is not None:
+                on_poll(status)
+            done = status["status"].isin([STATUS_SENT, STATUS_FAILED]).all()
+            if done or time.monotonic() >= deadline:
+                return status
+            time.sleep(0.5)
@@ -0,0 +1,669 @@
+"""
+Rapports PDF (ReportLab) : rapport mensuel officiel et rapport Observations.
+
+Le rendu est du Python pur (GIL) : depuis l'app, il passe par un pool de
+processus. Le « Détail par classe » est découpé en blocs de classes rendus en
+parallèle, puis assemblés (pypdf) avec une numérotation de pages continue.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import datetime as dt
+import io
+import multiprocessing as mp
+import os
+import re
+import sys
+import threading
+import types
+import zipfile
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Tuple
+
+import pandas as pd
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas as rl_canvas
+from reportlab.platypus import Image as RLImage, PageBreak, Paragraph, Spacer
+
+from services.report_engine import (
+    ParagraphCache,
+    column_rows,
+    draw_footer,
+    number_column,
+    render_story,
+    report_styles,
+    styled_table,
+    text_column,
+)
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # sans pypdf : rendu en un seul bloc (toujours hors du thread Streamlit)
+    PdfReader = PdfWriter = None
+
+REPORT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+PARALLEL_MIN_CLASSES = 8  # en dessous, le coût de découpage/assemblage dépasse le gain
+
+FOOTER_MAIN = "Rapport de suivi des enseignements"
+FOOTER_OBS = "Suivi des enseignements (Observations)"
+
+
+# -----------------------------
+# En-tête officiel (commun aux deux rapports)
+# -----------------------------
+def _header_story(
+    title: str,
+    mois_couverts: List[str],
+    logo_bytes: Optional[bytes],
+    author_name: str,
+    assistant_name: str,
+    department: str,
+    institution: str,
+    author_role: str,
+    assistant_label: str,
+    assistant_role: str,
+    subtitle: str,
+    ref_tag: str,
+) -> list:
+    """En-tête officiel : logo + infos, bandeau titre, bloc signatures."""
+    S = report_styles()
+    P = S["P"]
+    now_dt = dt.datetime.now()
+    date_gen = now_dt.strftime("%d/%m/%Y %H:%M")
+    periode_str = " – ".join(mois_couverts) if mois_couverts else "—"
+
+    # Tableau en-tête (logo + infos)
+    logo_cell = ""
+    if logo_bytes:
+        try:
+            img = RLImage(io.BytesIO(logo_bytes))
+            img.drawHeight = 2.2*cm
+            img.drawWidth  = 2.2*cm
+            logo_cell = img
+        except Exception:
+            logo_cell = ""
+
+    header_rows = [
+        [
+            logo_cell,
+            Paragraph(
+                f"""
+                <b>{institution}</b><br/>
+                {department}<br/>
+                <font size="9" color="#475569">
+                {subtitle}<br/>
+                </font>
+                """,
+                P
+            ),
+            Paragraph(
+                f"""
+                <b>Date :</b> {date_gen}<br/>
+                <b>Période :</b> {periode_str}<br/>
+                <b>Référence :</b> {department.split('(')[-1].replace(')','').strip() or 'DEPT'}-{ref_tag}-{now_dt.strftime("%Y%m")}
+                """,
+                P
+            )
+        ]
+    ]
+    header_tbl = styled_table(header_rows, "header", [2.6*cm, 9.4*cm, 4.0*cm])
+
+    # Bandeau titre (style "document officiel")
+    banner = styled_table([[Paragraph(f"<b>{title}</b>", S["Banner"])]], "banner", [15.9*cm])
+
+    # Bloc signatures (Auteur + Assistante)
+    sign_tbl = styled_table(
+        [[
+            Paragraph(
+                f"<b>Auteur :</b> {author_name}<br/>"
+                f"<font size='8' color='#475569'>{author_role}</font>",
+                P,
+            ),
+            Paragraph(
+                f"<b>{assistant_label} :</b> {assistant_name}<br/>"
+                f"<font size='8' color='#475569'>{assistant_role}</font>",
+                P,
+            ),
+        ]],
+        "signatures",
+        [7.9*cm, 8.0*cm],
+    )
+
+    return [header_tbl, banner, Spacer(1, 10), sign_tbl]
+
+
+# -----------------------------
+# Rapport mensuel officiel
+# -----------------------------
+def _main_head_story(df: pd.DataFrame, thresholds: dict, header_kwargs: dict) -> list:
+    S = report_styles()
+    story = _header_story(
+        subtitle="Rapport officiel de suivi des enseignements", ref_tag="SUIVI", **header_kwargs
+    )
+    story.append(Spacer(1, 10))
+
+    # KPIs globaux
+    statut = df["Statut_auto"]
+    total = len(df)
+    taux_moy = float(df["Taux"].mean() * 100) if total else 0.0
+    story.append(styled_table(
+        [
+            ["Matières", "Taux moyen", "Terminées", "En cours", "Non démarrées"],
+            [
+                str(total), f"{taux_moy:.1f}%", str(int((statut == "Terminé").sum())),
+                str(int((statut == "En cours").sum())), str(int((statut == "Non démarré").sum())),
+            ],
+        ],
+        "kpi",
+        [3.0*cm, 3.0*cm, 3.0*cm, 3.0*cm, 3.4*cm],
+    ))
+    story.append(Spacer(1, 12))
+
+    # Alertes synthèse : top 12 (tri par classe puis écart)
+    story.append(Paragraph("Synthèse – alertes clés", S["H2"]))
+    crit = df[(df["Écart"] <= thresholds["ecart_critique"]) | (statut == "Non démarré")]
+    if crit.empty:
+        story.append(Paragraph("Aucune alerte critique détectée selon les seuils actuels.", S["P"]))
+    else:
+        top = crit.sort_values(["Classe", "Écart"]).head(12)
+        rows = column_rows(
+            ["Classe", "Matière", "VHP", "VHR", "Écart", "Statut"],
+            [
+                text_column(top["Classe"]), text_column(top["Matière"], 45),
+                number_column(top["VHP"]), number_column(top["VHR"]), number_column(top["Écart"]),
+                text_column(top["Statut_auto"]),
+            ],
+        )
+        story.append(styled_table(rows, "alerts", [2.4*cm, 8.2*cm, 1.3*cm, 1.3*cm, 1.3*cm, 2.6*cm]))
+        story.append(Paragraph("NB : liste limitée aux 12 premières alertes (tri par écart).", S["Small"]))
+    return story
+
+
+def _main_classes_story(df: pd.DataFrame, heading: bool = True) -> list:
+    S = report_styles()
+    story = [Paragraph("Détail par classe", S["H1"])] if heading else []
+    if df.empty:
+        return story
+
+    # KPIs de toutes les classes en une agrégation
+    statut = df["Statut_auto"]
+    kpis = pd.DataFrame({
+        "Classe": df["Classe"],
+        "Taux": df["Taux"],
+        "nd": statut.eq("Non démarré"),
+        "enc": statut.eq("En cours"),
+        "term": statut.eq("Terminé"),
+    }).groupby("Classe").agg(
+        total=("Taux", "size"), taux=("Taux", "mean"), nd=("nd", "sum"), enc=("enc", "sum"), term=("term", "sum")
+    )
+    # Top 20 retards par classe : un seul tri global
+    top = df.sort_values(["Classe", "Écart"]).groupby("Classe", sort=True).head(20)
+    cols = {
+        "Classe": top["Classe"].to_numpy(),
+        "Matière": text_column(top["Matière"], 45),
+        "VHP": number_column(top["VHP"]),
+        "VHR": number_column(top["VHR"]),
+        "Écart": number_column(top["Écart"]),
+        "Taux": [f"{t}%" for t in number_column(top["Taux"], scale=100)],
+        "Statut": text_column(top["Statut_auto"]),
+    }
+    bounds = pd.Series(range(len(top))).groupby(cols["Classe"], sort=False).agg(["min", "max"])
+
+    for classe, total_c, taux, nd_c, enc_c, term_c in kpis.itertuples(name=None):
+        story.append(Paragraph(f"Classe : {classe}", S["H2"]))
+        taux_c = float(taux * 100) if total_c else 0.0
+        story.append(Paragraph(f"Matières: <b>{total_c}</b> — Taux moyen: <b>{taux_c:.1f}%</b> — Terminé: <b>{term_c}</b> — En cours: <b>{enc_c}</b> — Non démarré: <b>{nd_c}</b>", S["P"]))
+        story.append(Spacer(1, 6))
+
+        a, b = bounds.loc[classe, "min"], bounds.loc[classe, "max"] + 1
+        rows = column_rows(
+            ["Matière", "VHP", "VHR", "Écart", "Taux", "Statut"],
+            [cols[c][a:b] for c in ("Matière", "VHP", "VHR", "Écart", "Taux", "Statut")],
+        )
+        story.append(styled_table(rows, "class", [8.6*cm, 1.3*cm, 1.3*cm, 1.3*cm, 1.3*cm, 2.2*cm]))
+        story.append(Spacer(1, 8))
+    return story
+
+
+def build_pdf_report(
+    df: pd.DataFrame,
+    title: str,
+    mois_couverts: List[str],
+    thresholds: dict,
+    logo_bytes: Optional[bytes] = None,
+    author_name: str = "",
+    assistant_name: str = "",
+    department: str = "",
+    institution: str = "",
+    author_role: str = "",
+    assistant_label: str = "Assistante",
+    assistant_role: str = "",
+) -> bytes:
+    """Rapport mensuel en un seul document (un seul processus)."""
+    header_kwargs = dict(
+        title=title, mois_couverts=mois_couverts, logo_bytes=logo_bytes,
+        author_name=author_name, assistant_name=assistant_name, department=department,
+        institution=institution, author_role=author_role, assistant_label=assistant_label,
+        assistant_role=assistant_role,
+    )
+    story = _main_head_story(df, thresholds, header_kwargs)
+    story.append(PageBreak())
+    story += _main_classes_story(df)
+    return render_story(story, department, FOOTER_MAIN)
+
+
+# -----------------------------
+# Rapport Observations
+# -----------------------------
+OBS_COLUMNS = [
+    # (colonne, en-tête, largeur, retours ligne conservés)
+    ("Semestre", "Sem", 1.0*cm, False),
+    ("Type", "Type", 1.5*cm, False),
+    ("Matière", "Matière", 4.0*cm, True),
+    ("Responsable", "Responsable", 3.1*cm, True),
+    ("Observations", "Observation", 6.3*cm, True),  # ✅ PAS TRONQUÉ
+]
+
+
+def _prepare_observations(df: pd.DataFrame) -> pd.DataFrame:
+    """Uniquement les lignes avec Observations, triées par classe puis écart."""
+    d = df.copy()
+    if "Observations" not in d.columns:
+        d["Observations"] = ""
+
+    d["Observations"] = (
+        d["Observations"].astype(str)
+        .replace({"nan": "", "None": ""})
+        .fillna("")
+        .str.replace("\r", "", regex=False)  # ✅ garder \n (retours ligne)
+        .str.strip()
+    )
+
+    d = d[d["Observations"].str.len() > 0].copy()
+    if "Classe" not in d.columns:
+        d["Classe"] = "—"
+    if "Responsable" not in d.columns:
+        d["Responsable"] = "—"
+
+    sort_cols = ["Classe"]
+    if "Écart" in d.columns:
+        sort_cols += ["Écart"]
+    return d.sort_values(sort_cols, ascending=[True] + ([True] if "Écart" in d.columns else []))
+
+
+def _obs_head_story(d: pd.DataFrame, header_kwargs: dict) -> list:
+    S = report_styles()
+    story = _header_story(
+        subtitle="Rapport officiel — Suivi des enseignements (Observations)", ref_tag="OBS", **header_kwargs
+    )
+    story.append(Spacer(1, 12))
+
+    if d.empty:
+        story.append(Paragraph("Aucune observation renseignée sur la période sélectionnée.", S["P"]))
+        story.append(Paragraph("Le suivi des enseignements par observations ne peut pas être établi sans commentaires.", S["Small"]))
+        return story
+
+    story.append(styled_table(
+        [
+            ["Modules avec observation", "Classes concernées", "Responsables concernés"],
+            [str(len(d)), str(int(d["Classe"].nunique())), str(int(d["Responsable"].nunique()))],
+        ],
+        "kpi",
+        [5.2*cm, 5.2*cm, 5.5*cm],
+    ))
+    story.append(Spacer(1, 10))
+    return story
+
+
+def _obs_classes_story(d: pd.DataFrame, max_rows_per_class: int = 9999, heading: bool = True) -> list:
+    S = report_styles()
+    story = [Paragraph("Détail — Observations par classe", S["H1"])] if heading else []
+
+    # ✅ Table WRAP : Paragraph dans toutes les cellules texte, un seul objet par texte répété
+    cells = ParagraphCache(S["CELL"])
+    header = [Paragraph(f"<b>{label}</b>", S["HEAD"]) for _, label, _, _ in OBS_COLUMNS]
+    widths = [w for _, _, w, _ in OBS_COLUMNS]  # total ~ 15.9cm
+
+    for classe, g in d.groupby("Classe"):
+        story.append(Paragraph(f"Classe : {classe}", S["H2"]))
+
+        if max_rows_per_class and max_rows_per_class > 0:
+            g = g.head(max_rows_per_class)
+
+        columns = [
+            cells.column(col, g[col].tolist() if col in g.columns else [""] * len(g), allow_br)
+            for col, _, _, allow_br in OBS_COLUMNS
+        ]
+        story.append(styled_table(
+            column_rows(header, columns),
+            "observations",
+            widths,
+            repeatRows=1,
+            splitByRow=1,  # ✅ découpage multi-pages
+        ))
+        story.append(Spacer(1, 10))
+    return story
+
+
+def build_pdf_observations_report(
+    df: pd.DataFrame,
+    title: str,
+    mois_couverts: List[str],
+    logo_bytes: Optional[bytes] = None,
+    author_name: str = "",
+    assistant_name: str = "",
+    department: str = "",
+    institution: str = "",
+    max_rows_per_class: int = 9999,  # mets 18 si tu veux limiter
+    author_role: str = "",
+    assistant_label: str = "Assistante",
+    assistant_role: str = "",
+) -> bytes:
+    """Rapport Observations en un seul document (un seul processus)."""
+    d = _prepare_observations(df)
+    header_kwargs = dict(
+        title=title, mois_couverts=mois_couverts, logo_bytes=logo_bytes,
+        author_name=author_name, assistant_name=assistant_name, department=department,
+        institution=institution, author_role=author_role, assistant_label=assistant_label,
+        assistant_role=assistant_role,
+    )
+    story = _obs_head_story(d, header_kwargs)
+    if not d.empty:
+        story += _obs_classes_story(d, max_rows_per_class)
+    return render_story(story, department, FOOTER_OBS)
+
+
+# -----------------------------
+# Rendu parallèle (pool de processus)
+# -----------------------------
+# `sys.modules["__main__"]` est global au process : un seul remplacement à la fois
+# (thread du script et threads des tâches peuvent créer un pool en même temps).
+_MAIN_SWAP_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def _neutral_main():
+    """
+    Un worker `spawn` ré-exécute le script `__main__` du parent ; sous Streamlit
+    c'est app.py. Les workers sont donc lancés avec un `__main__` sans fichier.
+    À garder autour du démarrage des workers uniquement, sous `_MAIN_SWAP_LOCK`.
+    """
+    with _MAIN_SWAP_LOCK:
+        main = sys.modules.get("__main__")
+        neutral = types.ModuleType("__main__")
+        sys.modules["__main__"] = neutral
+        try:
+            yield
+        finally:
+            # Ne pas écraser un `__main__` installé entre-temps (rerun Streamlit)
+            if sys.modules.get("__main__") is neutral:
+                sys.modules["__main__"] = main
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class ReportExecutor(Executor):
+    """
+    Pool de processus avec un état « inutilisable » suivi explicitement : un
+    `BrokenProcessPool` vu sur un `submit` ou un résultat, ou un `shutdown`,
+    le marque (sans dépendre des attributs internes de `ProcessPoolExecutor`).
+    """
+
+    def __init__(self, pool: ProcessPoolExecutor):
+        self._pool = pool
+        self.broken = False
+        self.closed = False
+
+    def _check(self, fut) -> None:
+        if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool):
+            self.broken = True
+
+    def submit(self, fn, /, *args, **kwargs):
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self.broken = True
+            raise
+        fut.add_done_callback(self._check)
+        return fut
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self.closed = True
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    @property
+    def usable(self) -> bool:
+        return not (self.broken or self.closed)
+
+
+def create_report_executor(max_workers: int = REPORT_WORKERS) -> ReportExecutor:
+    """
+    Pool dédié au rendu PDF ; `spawn` évite de forker un process Streamlit
+    multi-thread. Tous les workers sont démarrés ici (un `submit` par worker).
+    """
+    with _neutral_main():
+        executor = ReportExecutor(ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context("spawn")))
+        wait([executor.submit(_ping) for _ in range(max_workers)])
+    return executor
+
+
+def executor_is_usable(executor: ReportExecutor) -> bool:
+    """Faux si un worker est mort (pool « broken ») ou si le pool est arrêté : il faut en recréer un."""
+    return executor.usable
+
+
+def class_chunks(df: pd.DataFrame, n_chunks: int, rows_cap: Optional[int] = None) -> List[pd.DataFrame]:
+    """
+    Découpe en blocs de classes consécutives (ordre alphabétique) de poids
+    comparable ; `rows_cap` borne le poids d'une classe (lignes réellement rendues).
+    """
+    sizes = df.groupby("Classe", sort=True).size()
+    if sizes.empty:
+        return []
+    weights = sizes.clip(upper=rows_cap) if rows_cap else sizes
+    weights = weights + 6  # titre + KPIs de la classe
+    n_chunks = max(1, min(int(n_chunks), len(sizes)))
+    target = float(weights.sum()) / n_chunks
+
+    groups: List[List[str]] = [[]]
+    acc = 0.0
+    for classe, w in weights.items():
+        if groups[-1] and acc + w / 2 > target * len(groups) and len(groups) < n_chunks:
+            groups.append([])
+        groups[-1].append(classe)
+        acc += w
+    return [df[df["Classe"].isin(g)] for g in groups if g]
+
+
+def stamp_and_merge(parts: List[bytes], department: str, footer_label: str) -> bytes:
+    """Concatène les PDF partiels et ajoute le pied de page avec une numérotation continue."""
+    writer = PdfWriter()
+    for part in parts:
+        for page in PdfReader(io.BytesIO(part)).pages:
+            writer.add_page(page)
+
+    generated_at = dt.datetime.now().strftime("%d/%m/%Y %H:%M")
+    overlay_buf = io.BytesIO()
+    c = rl_canvas.Canvas(overlay_buf, pagesize=A4)
+    for i in range(len(writer.pages)):
+        draw_footer(c, i + 1, department, footer_label, generated_at)
+        c.showPage()
+    c.save()
+
+    overlay = PdfReader(io.BytesIO(overlay_buf.getvalue()))
+    for page, stamp in zip(writer.pages, overlay.pages):
+        page.merge_page(stamp)
+        page.compress_content_streams()
+    writer.compress_identical_objects()  # polices / ressources dupliquées entre blocs
+
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _header_kwargs(kwargs: dict) -> dict:
+    keys = (
+        "title", "mois_couverts", "logo_bytes", "author_name", "assistant_name", "department",
+        "institution", "author_role", "assistant_label", "assistant_role",
+    )
+    defaults = {"assistant_label": "Assistante", "logo_bytes": None}
+    return {k: kwargs.get(k, defaults.get(k, "")) for k in keys}
+
+
+def _render_main_head(df: pd.DataFrame, thresholds: dict, header_kwargs: dict) -> bytes:
+    return render_story(_main_head_story(df, thresholds, header_kwargs))
+
+
+def _render_main_classes(df: pd.DataFrame, heading: bool) -> bytes:
+    return render_story(_main_classes_story(df, heading=heading))
+
+
+def _render_obs_head(d: pd.DataFrame, header_kwargs: dict) -> bytes:
+    return render_story(_obs_head_story(d, header_kwargs))
+
+
+def _render_obs_classes(d: pd.DataFrame, max_rows_per_class: int, heading: bool) -> bytes:
+    return render_story(_obs_classes_story(d, max_rows_per_class, heading=heading))
+
+
+def render_pdf_report(executor: Optional[Executor], n_chunks: int = REPORT_WORKERS, **kwargs) -> bytes:
+    """
+    `build_pdf_report` exécuté dans `executor` : l'appelant ne fait qu'attendre
+    des futures. Avec assez de classes (et pypdf), l'en-tête et chaque bloc de
+    classes sont rendus en parallèle puis assemblés. Sans pool : rendu direct.
+    """
+    if executor is None:
+        return build_pdf_report(**kwargs)
+    df = kwargs["df"]
+    try:
+        if PdfWriter is None or n_chunks < 2 or df["Classe"].nunique() < PARALLEL_MIN_CLASSES:
+            return executor.submit(build_pdf_report, **kwargs).result()
+
+        head = executor.submit(_render_main_head, df, kwargs["thresholds"], _header_kwargs(kwargs))
+        chunks = [
+            executor.submit(_render_main_classes, chunk, i == 0)
+            for i, chunk in enumerate(class_chunks(df, n_chunks, rows_cap=20))
+        ]
+        parts = [head.result()] + [f.result() for f in chunks]
+        return executor.submit(stamp_and_merge, parts, kwargs.get("department", ""), FOOTER_MAIN).result()
+    except BrokenProcessPool:
+        return build_pdf_report(**kwargs)
+
+
+def render_pdf_observations_report(executor: Optional[Executor], n_chunks: int = REPORT_WORKERS, **kwargs) -> bytes:
+    """Équivalent de `render_pdf_report` pour le rapport Observations."""
+    if executor is None:
+        return build_pdf_observations_report(**kwargs)
+    try:
+        d = _prepare_observations(kwargs["df"])
+        if PdfWriter is None or n_chunks < 2 or d["Classe"].nunique() < PARALLEL_MIN_CLASSES:
+            return executor.submit(build_pdf_observations_report, **kwargs).result()
+
+        max_rows = kwargs.get("max_rows_per_class", 9999)
+        head = executor.submit(_render_obs_head, d, _header_kwargs(kwargs))
+        chunks = [
+            executor.submit(_render_obs_classes, chunk, max_rows, i == 0)
+            for i, chunk in enumerate(class_chunks(d, n_chunks, rows_cap=max_rows))
+        ]
+        parts = [head.result()] + [f.result() for f in chunks]
+        return executor.submit(stamp_and_merge, parts, kwargs.get("department", ""), FOOTER_OBS).result()
+    except BrokenProcessPool:
+        return build_pdf_observations_report(**kwargs)
+
+
+# -----------------------------
+# Export groupé : un PDF par classe / par responsable
+# -----------------------------
+BUNDLE_KINDS = {"rapport": build_pdf_report, "observations": build_pdf_observations_report}
+
+
+def _safe_filename(name: str) -> str:
+    s = re.sub(r"[^\w\-]+", "_", str(name).strip(), flags=re.UNICODE).strip("_")
+    return s or "sans_nom"
+
+
+def report_bundle_jobs(
+    df: pd.DataFrame,
+    by: str,
+    kinds: List[str],
+    titles: dict,
+    common_kwargs: dict,
+    thresholds: Optional[dict] = None,
+) -> List[Tuple[str, str, dict]]:
+    """
+    Une tâche (nom dans le ZIP, type, arguments) par valeur de `by` ("Classe"
+    ou "Responsable") et par type de rapport. Les groupes sans observation
+    n'ont pas de PDF Observations.
+    """
+    jobs = []
+    obs_index = _prepare_observations(df).index if "observations" in kinds else pd.Index([])
+    folder = "classes" if by == "Classe" else "responsables"
+    used = set()
+    for name, g in df.groupby(by, sort=True):
+        # Deux noms qui donnent le même nom de fichier ("L1/A", "L1 A") : suffixe numérique
+        stem = base = _safe_filename(name)
+        n = 2
+        while stem in used:
+            stem, n = f"{base}_{n}", n + 1
+        used.add(stem)
+        for kind in kinds:
+            if kind == "observations" and not g.index.isin(obs_index).any():
+                continue
+            kw = dict(common_kwargs, df=g, title=f"{titles[kind]} — {name}")
+            if kind == "rapport":
+                kw["thresholds"] = thresholds
+            jobs.append((f"{folder}/{kind}_{stem}.pdf", kind, kw))
+    return jobs
+
+
+def build_report_bundle(
+    executor: Optional[Executor],
+    jobs: List[Tuple[str, str, dict]],
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> bytes:
+    """
+    Rend les PDF des `jobs` (en parallèle dans `executor`) et les écrit dans un
+    ZIP au fil de l'eau ; `progress(terminés, total, nom)` après chaque PDF.
+    """
+    out = io.BytesIO()
+    total = len(jobs)
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        if executor is None:
+            for done, (arcname, kind, kw) in enumerate(jobs, start=1):
+                zf.writestr(arcname, BUNDLE_KINDS[kind](**kw))
+                if progress:
+                    progress(done, total, arcname)
+        else:
+            _write_pooled_bundle(zf, executor, jobs, progress)
+    # Après fermeture du ZIP seulement : le répertoire central est écrit à la sortie du `with`
+    return out.getvalue()
+
+
+def _write_pooled_bundle(
+    zf: zipfile.ZipFile,
+    executor: Executor,
+    jobs: List[Tuple[str, str, dict]],
+    progress: Optional[Callable[[int, int, str], None]],
+) -> None:
+    total = len(jobs)
+    futures = {executor.submit(BUNDLE_KINDS[kind], **kw): (arcname, kind, kw) for arcname, kind, kw in jobs}
+    try:
+        for done, fut in enumerate(as_completed(futures), start=1):
+            arcname, kind, kw = futures[fut]
+            try:
+                data = fut.result()
+            except BrokenProcessPool:
+                data = BUNDLE_KINDS[kind](**kw)
+            zf.writestr(arcname, data)
+            if progress:
+                progress(done, total, arcname)
+    except BaseException:
+        # `progress` peut interrompre (annulation) : les PDF pas encore démarrés sont abandonnés
+        for fut in futures:
+            fut.cancel()
+        raise
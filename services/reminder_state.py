@@ -0,0 +1,202 @@
+"""
+État du rappel mensuel DG (verrou d'envoi + dernier mois envoyé), par profil.
+
+Stocké dans SQLite et modifié uniquement dans des transactions `BEGIN
+IMMEDIATE` : la vérification et l'écriture sont atomiques entre threads,
+sessions et processus (plusieurs réplicas sur le même volume). Le verrou est
+un bail : un processus tué pendant l'envoi ne bloque pas le mois suivant au-delà
+de `ttl_s`.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+STATE_FILE = Path(".streamlit") / "reminder_state.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminder_state (
+    profile     TEXT NOT NULL,
+    month       TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    owner       TEXT NOT NULL DEFAULT '',
+    lease_until REAL NOT NULL DEFAULT 0,
+    updated_at  TEXT NOT NULL,
+    PRIMARY KEY (profile, month)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS reminder_sent (
+    profile TEXT NOT NULL,
+    month   TEXT NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (profile, month)
+) WITHOUT ROWID;
+"""
+
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_IDLE = "idle"
+
+
+def current_profile() -> str:
+    """Profil lu à l'appel (et non à l'import) : un même process peut servir plusieurs profils."""
+    return os.getenv("APP_DEPT_PROFILE", "IAID").upper()
+
+
+def new_owner() -> str:
+    """Identifiant unique d'un détenteur de verrou (process + aléa)."""
+    return f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+class ReminderStateStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None : transactions explicites (BEGIN IMMEDIATE = verrou d'écriture immédiat)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def _row(self, conn: sqlite3.Connection, profile: str, month: str):
+        return conn.execute(
+            "SELECT status, owner, lease_until FROM reminder_state WHERE profile = ? AND month = ?",
+            (profile, month),
+        ).fetchone()
+
+    def _upsert(self, conn, profile: str, month: str, status: str, owner: str, lease_until: float) -> None:
+        conn.execute(
+            "INSERT INTO reminder_state (profile, month, status, owner, lease_until, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(profile, month) DO UPDATE SET "
+            "status = excluded.status, owner = excluded.owner, "
+            "lease_until = excluded.lease_until, updated_at = excluded.updated_at",
+            (profile, month, status, owner, lease_until, dt.datetime.now().isoformat(timespec="seconds")),
+        )
+
+    # -----------------------------
+    # Verrou d'envoi
+    # -----------------------------
+    def try_acquire(self, profile: str, month: str, owner: str, ttl_s: float = 600.0) -> bool:
+        """
+        Prend le verrou d'envoi du mois si personne ne le détient (ou si le bail
+        a expiré). Atomique : au plus un détenteur à la fois, tous processus confondus.
+        Le statut « envoyé » du mois est conservé pendant un nouvel envoi.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._row(conn, profile, month)
+                if row and row[0] == STATUS_SENDING and row[2] > now and row[1] != owner:
+                    conn.execute("ROLLBACK")
+                    return False
+                self._upsert(conn, profile, month, STATUS_SENDING, owner, now + ttl_s)
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def release(self, profile: str, month: str, owner: str, sent: bool = False) -> bool:
+        """
+        Libère le verrou s'il appartient encore à `owner` ; `sent=True` marque le
+        mois comme envoyé. Retourne False si le bail avait été repris entre-temps.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._row(conn, profile, month)
+                if not row or row[0] != STATUS_SENDING or row[1] != owner:
+                    conn.execute("ROLLBACK")
+                    return False
+                was_sent = self._was_sent(conn, profile, month)
+                status = STATUS_SENT if (sent or was_sent) else STATUS_IDLE
+                self._upsert(conn, profile, month, status, "", 0)
+                if sent:
+                    self._mark_sent_history(conn, profile, month)
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def is_locked(self, profile: str, month: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = self._row(conn, profile, month)
+        return bool(row and row[0] == STATUS_SENDING and row[2] > time.time())
+
+    # -----------------------------
+    # Dernier mois envoyé
+    # -----------------------------
+    def _was_sent(self, conn, profile: str, month: str) -> bool:
+        return conn.execute(
+            "SELECT 1 FROM reminder_sent WHERE profile = ? AND month = ?", (profile, month)
+        ).fetchone() is not None
+
+    def _mark_sent_history(self, conn, profile: str, month: str) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO reminder_sent (profile, month, sent_at) VALUES (?, ?, ?)",
+            (profile, month, dt.datetime.now().isoformat(timespec="seconds")),
+        )
+
+    def mark_sent(self, profile: str, month: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._mark_sent_history(conn, profile, month)
+                row = self._row(conn, profile, month)
+                if not row or row[0] != STATUS_SENDING:
+                    self._upsert(conn, profile, month, STATUS_SENT, "", 0)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def is_sent(self, profile: str, month: str) -> bool:
+        with closing(self._connect()) as conn:
+            return self._was_sent(conn, profile, month)
+
+    def last_sent_month(self, profile: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT month FROM reminder_sent WHERE profile = ? ORDER BY month DESC LIMIT 1", (profile,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def import_legacy(self, profile: str, legacy_file: Path) -> None:
+        """Reprend le mois stocké par l'ancien fichier JSON `last_reminder_<PROFIL>.json`."""
+        if self.last_sent_month(profile) is not None or not legacy_file.exists():
+            return
+        try:
+            month = json.loads(legacy_file.read_text()).get("month")
+        except Exception:
+            return
+        if month:
+            self.mark_sent(profile, month)
+
+
+_default_lock = threading.Lock()
+_default: Optional[ReminderStateStore] = None
+
+
+def default_store() -> ReminderStateStore:
+    """Store partagé du process (`STATE_FILE`), créé au premier usage."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = ReminderStateStore(STATE_FILE)
+        return _default
@@ -0,0 +1,300 @@
+"""
+Moteur de rendu ReportLab partagé par les rapports PDF.
+
+Styles et TableStyles créés une fois par processus, lignes de tableaux
+construites à partir des colonnes (pas d'`iterrows`), et cache de Paragraph
+par document pour les textes répétés (semestre, type, matière, responsable…).
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+BRAND_BLUE = colors.HexColor("#0B3D91")
+MUTED = colors.HexColor("#475569")
+
+LOGO_SIZE_CM = 2.2   # taille rendue dans l'en-tête des rapports
+LOGO_DPI = 300       # résolution d'impression visée
+
+
+# -----------------------------
+# Styles (une fois par processus)
+# -----------------------------
+@lru_cache(maxsize=1)
+def report_styles() -> Dict[str, ParagraphStyle]:
+    styles = getSampleStyleSheet()
+    H1 = ParagraphStyle("H1", parent=styles["Heading1"], fontSize=16, spaceAfter=10)
+    return {
+        "H1": H1,
+        "H2": ParagraphStyle("H2", parent=styles["Heading2"], fontSize=12, spaceAfter=6),
+        "P": ParagraphStyle("P", parent=styles["BodyText"], fontSize=9, leading=12),
+        "Small": ParagraphStyle("Small", parent=styles["BodyText"], fontSize=8, leading=10),
+        "Banner": ParagraphStyle("Banner", parent=H1, textColor=colors.white, fontSize=14),
+        # Observations : wrap robuste (mots longs) + en-têtes blancs
+        "CELL": ParagraphStyle(
+            "CELL_OBS", parent=styles["BodyText"], fontSize=8.2, leading=10.5,
+            spaceBefore=0, spaceAfter=0, alignment=TA_LEFT, wordWrap="CJK",
+        ),
+        "HEAD": ParagraphStyle(
+            "HEAD_OBS", parent=styles["BodyText"], fontSize=8.4, leading=10,
+            spaceBefore=0, spaceAfter=0, alignment=TA_LEFT, textColor=colors.white,
+        ),
+    }
+
+
+@lru_cache(maxsize=1)
+def table_styles() -> Dict[str, TableStyle]:
+    return {
+        "header": TableStyle([
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+            ("ALIGN", (0,0), (0,0), "LEFT"),
+            ("ALIGN", (2,0), (2,0), "RIGHT"),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
+        ]),
+        "banner": TableStyle([
+            ("BACKGROUND", (0,0), (-1,-1), BRAND_BLUE),
+            ("LEFTPADDING", (0,0), (-1,-1), 10),
+            ("RIGHTPADDING", (0,0), (-1,-1), 10),
+            ("TOPPADDING", (0,0), (-1,-1), 8),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        ]),
+        "signatures": TableStyle([
+            ("BACKGROUND", (0,0), (-1,-1), colors.HexColor("#F6F8FC")),
+            ("BOX", (0,0), (-1,-1), 0.4, colors.HexColor("#E3E8F0")),
+            ("INNERGRID", (0,0), (-1,-1), 0.25, colors.HexColor("#E3E8F0")),
+            ("LEFTPADDING", (0,0), (-1,-1), 10),
+            ("RIGHTPADDING", (0,0), (-1,-1), 10),
+            ("TOPPADDING", (0,0), (-1,-1), 8),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 8),
+        ]),
+        "kpi": TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND_BLUE),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+            ("ALIGN", (0,0), (-1,-1), "CENTER"),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
+            ("BACKGROUND", (0,1), (-1,1), colors.whitesmoke),
+        ]),
+        "alerts": TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#F0F3F8")),
+            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+            ("FONTSIZE", (0,0), (-1,-1), 8),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        ]),
+        "class": TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND_BLUE),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+            ("FONTSIZE", (0,0), (-1,-1), 8),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.lightgrey),
+            ("VALIGN", (0,0), (-1,-1), "MIDDLE"),
+        ]),
+        "observations": TableStyle([
+            ("BACKGROUND", (0,0), (-1,0), BRAND_BLUE),
+            ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+            ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+
+            ("FONTSIZE", (0,0), (-1,-1), 8),
+            ("GRID", (0,0), (-1,-1), 0.25, colors.HexColor("#D7DEE8")),
+            ("VALIGN", (0,0), (-1,-1), "TOP"),
+
+            ("LEFTPADDING", (0,0), (-1,-1), 6),
+            ("RIGHTPADDING", (0,0), (-1,-1), 6),
+            ("TOPPADDING", (0,0), (-1,-1), 4),
+            ("BOTTOMPADDING", (0,0), (-1,-1), 4),
+        ]),
+    }
+
+
+def styled_table(rows: list, style: str, col_widths: Sequence[float], **kwargs) -> Table:
+    t = Table(rows, colWidths=list(col_widths), **kwargs)
+    t.setStyle(table_styles()[style])
+    return t
+
+
+# -----------------------------
+# Document + pied de page
+# -----------------------------
+def new_doc(out: io.BytesIO) -> SimpleDocTemplate:
+    return SimpleDocTemplate(
+        out,
+        pagesize=A4,
+        leftMargin=1.6*cm, rightMargin=1.6*cm,
+        topMargin=1.4*cm, bottomMargin=1.4*cm
+    )
+
+
+def draw_footer(canvas, page: int, department: str, label: str, generated_at: str) -> None:
+    canvas.saveState()
+    canvas.setFont("Helvetica", 8)
+    canvas.setFillColor(MUTED)
+    canvas.drawString(1.6*cm, 1.0*cm, f"{department} — {label}")
+    canvas.drawRightString(19.4*cm, 1.0*cm, f"Généré le {generated_at}  |  Page {page}")
+    canvas.restoreState()
+
+
+def render_story(story: list, department: Optional[str] = None, footer_label: str = "") -> bytes:
+    """Construit le document ; sans `department`, pas de pied de page (ajouté à l'assemblage)."""
+    out = io.BytesIO()
+    doc = new_doc(out)
+    if department is None:
+        doc.build(story)
+    else:
+        generated_at = dt.datetime.now().strftime("%d/%m/%Y %H:%M")
+
+        def _footer(canvas, doc_):
+            draw_footer(canvas, doc_.page, department, footer_label, generated_at)
+
+        doc.build(story, onFirstPage=_footer, onLaterPages=_footer)
+    return out.getvalue()
+
+
+# -----------------------------
+# Cellules et lignes de tableaux
+# -----------------------------
+def escape_markup(x) -> str:
+    s = "" if x is None else str(x)
+    return (
+        s.replace("&", "&amp;")
+         .replace("<", "&lt;")
+         .replace(">", "&gt;")
+    )
+
+
+class SharedParagraph(Paragraph):
+    """
+    Paragraph réutilisable dans plusieurs cellules d'une même colonne :
+    le découpage en lignes (coûteux, surtout en wordWrap CJK) est calculé une
+    fois par largeur disponible.
+    """
+
+    _wrap_memo = None
+
+    def wrap(self, availWidth, availHeight):
+        memo = self._wrap_memo
+        if memo is not None and memo[0] == availWidth:
+            self.width = availWidth
+            return memo[1]
+        size = super().wrap(availWidth, availHeight)
+        self._wrap_memo = (availWidth, size)
+        return size
+
+
+class ParagraphCache:
+    """Un Paragraph par (colonne, texte) pour la durée d'un document."""
+
+    def __init__(self, style: ParagraphStyle, empty: str = "—"):
+        self.style = style
+        self.empty = empty
+        self._items: Dict[tuple, Paragraph] = {}
+
+    def get(self, column: str, value, allow_br: bool = True) -> Paragraph:
+        key = (column, value, allow_br)
+        p = self._items.get(key)
+        if p is None:
+            s = escape_markup(value).strip()
+            if allow_br:
+                s = s.replace("\n", "<br/>")
+            p = SharedParagraph(s if s else self.empty, self.style)
+            self._items[key] = p
+        return p
+
+    def column(self, column: str, values: Sequence, allow_br: bool = True) -> List[Paragraph]:
+        return [self.get(column, v, allow_br) for v in values]
+
+
+def text_column(s: pd.Series, max_len: Optional[int] = None) -> List[str]:
+    """Colonne -> textes (NaN -> ""), tronqués à `max_len` caractères."""
+    out = s.astype(object).where(s.notna(), "").astype(str)
+    if max_len:
+        out = out.str.slice(0, max_len)
+    return out.tolist()
+
+
+def number_column(s: pd.Series, fmt: str = "{:.0f}", scale: float = 1.0) -> List[str]:
+    """Colonne numérique -> textes formatés (même rendu que `f"{v:.0f}"`)."""
+    vals = pd.to_numeric(s, errors="coerce").to_numpy(dtype=float) * scale
+    return [fmt.format(v) for v in vals]
+
+
+def column_rows(header: Sequence, columns: Sequence[List]) -> list:
+    """En-tête + lignes assemblées à partir de listes par colonne."""
+    return [list(header)] + [list(r) for r in zip(*columns)]
+
+
+# -----------------------------
+# Logo : décodé et redimensionné une fois
+# -----------------------------
+_logo_cache: "OrderedDict[str, Optional[bytes]]" = OrderedDict()
+_logo_lock = threading.Lock()
+
+
+def logo_target_px(size_cm: float = LOGO_SIZE_CM, dpi: int = LOGO_DPI) -> int:
+    return int(round(size_cm / 2.54 * dpi))
+
+
+def optimize_logo(data: bytes, size_cm: float = LOGO_SIZE_CM, dpi: int = LOGO_DPI) -> Optional[bytes]:
+    """
+    Réduit l'image à sa taille rendue (2,2 cm à 300 DPI ≈ 260 px), orientation
+    EXIF appliquée. PNG si transparence, sinon JPEG. None si illisible ou si
+    Pillow est absent.
+    """
+    try:
+        from PIL import Image, ImageOps
+
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            target = logo_target_px(size_cm, dpi)
+            img.thumbnail((target, target), Image.LANCZOS)
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            out = io.BytesIO()
+            if has_alpha:
+                img.convert("RGBA").save(out, format="PNG", optimize=True)
+            else:
+                img.convert("RGB").save(out, format="JPEG", quality=90, optimize=True)
+    except Exception:
+        return None
+    # Une image déjà petite et compacte est gardée telle quelle
+    return data if len(data) <= out.tell() else out.getvalue()
+
+
+def prepare_logo(logo_bytes: Optional[bytes], fallback_path: Optional[str] = None) -> Optional[bytes]:
+    """
+    Logo prêt pour les rapports : l'upload s'il y en a un, sinon `fallback_path`
+    (logo du département). Résultat mis en cache par empreinte du contenu.
+    """
+    if not logo_bytes and fallback_path:
+        path = Path(fallback_path)
+        logo_bytes = path.read_bytes() if path.exists() else None
+    if not logo_bytes:
+        return None
+
+    digest = hashlib.blake2b(logo_bytes, digest_size=16).hexdigest()
+    with _logo_lock:
+        if digest in _logo_cache:
+            _logo_cache.move_to_end(digest)
+            return _logo_cache[digest]
+
+    optimized = optimize_logo(logo_bytes)
+    with _logo_lock:
+        _logo_cache[digest] = optimized
+        while len(_logo_cache) > 8:
+            _logo_cache.popitem(last=False)
+    return optimized
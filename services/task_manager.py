@@ -0,0 +1,205 @@
+"""
+Tâches d'administration longues (PDF, résumé IA, envoi DG, notifications
+enseignants) exécutées hors du thread du script Streamlit.
+
+Le gestionnaire est partagé par tout le process (`st.cache_resource`) : une
+tâche survit aux reruns (slider, auto-refresh) et aux reconnexions, son
+résultat reste disponible `result_ttl_s` secondes. Le nombre de tâches
+simultanées est plafonné par profil ; au-delà, elles attendent leur tour.
+L'annulation est coopérative : la tâche la constate au prochain
+`ctx.progress(...)` ou `ctx.check_cancelled()`.
+"""
+
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "⏳ En attente",
+    STATUS_RUNNING: "⚙️ En cours",
+    STATUS_DONE: "✅ Terminé",
+    STATUS_FAILED: "❌ Échec",
+    STATUS_CANCELLED: "🛑 Annulé",
+}
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+
+class TaskCancelled(Exception):
+    """Levée dans la tâche quand une annulation a été demandée."""
+
+
+@dataclass
+class Task:
+    id: str
+    profile: str
+    kind: str
+    label: str
+    key: Optional[str] = None
+    status: str = STATUS_QUEUED
+    progress: float = 0.0
+    message: str = ""
+    output: str = ""
+    result: Any = None
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    @property
+    def elapsed_s(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class TaskContext:
+    """Passé à la fonction de la tâche : progression + point d'annulation."""
+
+    def __init__(self, task: Task):
+        self._task = task
+
+    @property
+    def cancelled(self) -> bool:
+        return self._task.cancel_requested.is_set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, fraction: float, message: str = "") -> None:
+        """Met à jour la progression (0..1) ; lève TaskCancelled si l'annulation est demandée."""
+        self._task.progress = min(1.0, max(0.0, float(fraction)))
+        if message:
+            self._task.message = message
+        self.check_cancelled()
+
+    def stream(self, delta: str) -> None:
+        """Ajoute du texte à la sortie partielle (affichée pendant l'exécution) ; point d'annulation."""
+        self._task.output += delta
+        self.check_cancelled()
+
+
+class TaskManager:
+    def __init__(self, max_per_profile: int = 2, result_ttl_s: float = 1800.0):
+        self.max_per_profile = max(1, int(max_per_profile))
+        self.result_ttl_s = float(result_ttl_s)
+        self._tasks: Dict[str, Task] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    # -----------------------------
+    # Soumission
+    # -----------------------------
+    def submit(
+        self,
+        profile: str,
+        kind: str,
+        label: str,
+        fn: Callable[[TaskContext], Any],
+        key: Optional[str] = None,
+    ) -> Task:
+        """
+        Lance `fn(ctx)` dans un thread. Avec `key`, une tâche identique encore en
+        attente ou en cours est retournée au lieu d'en relancer une : double clic
+        et reruns ne dupliquent pas le travail.
+        """
+        with self._lock:
+            self._purge()
+            if key is not None:
+                existing = self._find(profile, key)
+                if existing is not None and existing.active:
+                    return existing
+            task = Task(id=f"{kind}-{next(self._ids)}", profile=profile, kind=kind, label=label, key=key)
+            self._tasks[task.id] = task
+            slots = self._slots.setdefault(profile, threading.BoundedSemaphore(self.max_per_profile))
+        threading.Thread(target=self._run, args=(task, fn, slots), name=f"task-{task.id}", daemon=True).start()
+        return task
+
+    def _run(self, task: Task, fn: Callable[[TaskContext], Any], slots: threading.BoundedSemaphore) -> None:
+        # File d'attente par profil : on attend un créneau en restant annulable
+        while not slots.acquire(timeout=0.5):
+            if task.cancel_requested.is_set():
+                self._finish(task, STATUS_CANCELLED)
+                return
+        try:
+            if task.cancel_requested.is_set():
+                self._finish(task, STATUS_CANCELLED)
+                return
+            task.status = STATUS_RUNNING
+            task.started_at = time.time()
+            try:
+                result = fn(TaskContext(task))
+            except TaskCancelled:
+                self._finish(task, STATUS_CANCELLED)
+            except Exception as exc:
+                self._finish(task, STATUS_FAILED, error=str(exc) or type(exc).__name__)
+            else:
+                task.result = result
+                task.progress = 1.0
+                self._finish(task, STATUS_DONE)
+        finally:
+            slots.release()
+
+    def _finish(self, task: Task, status: str, error: str = "") -> None:
+        task.error = error
+        task.finished_at = time.time()
+        task.status = status
+
+    # -----------------------------
+    # Suivi
+    # -----------------------------
+    def get(self, task_id: Optional[str]) -> Optional[Task]:
+        with self._lock:
+            return self._tasks.get(task_id) if task_id else None
+
+    def find(self, profile: str, key: str) -> Optional[Task]:
+        """Dernière tâche soumise avec cette clé (utile après une reconnexion)."""
+        with self._lock:
+            return self._find(profile, key)
+
+    def _find(self, profile: str, key: str) -> Optional[Task]:
+        found = [t for t in self._tasks.values() if t.profile == profile and t.key == key]
+        return max(found, key=lambda t: t.created_at) if found else None
+
+    def latest(self, profile: str, kind: str) -> Optional[Task]:
+        """Dernière tâche d'un type pour ce profil (résultat à réafficher après un rerun)."""
+        return next((t for t in self.tasks(profile) if t.kind == kind), None)
+
+    def tasks(self, profile: Optional[str] = None) -> List[Task]:
+        with self._lock:
+            self._purge()
+            return sorted(
+                (t for t in self._tasks.values() if profile is None or t.profile == profile),
+                key=lambda t: t.created_at,
+                reverse=True,
+            )
+
+    def cancel(self, task_id: str) -> bool:
+        task = self.get(task_id)
+        if task is None or not task.active:
+            return False
+        task.cancel_requested.set()
+        return True
+
+    def _purge(self) -> None:
+        """Oublie les tâches terminées depuis plus de `result_ttl_s` (appelé sous `_lock`)."""
+        limit = time.time() - self.result_ttl_s
+        for tid in [t.id for t in self._tasks.values() if t.finished_at is not None and t.finished_at < limit]:
+            del self._tasks[tid]
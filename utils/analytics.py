@@ -0,0 +1,311 @@
+"""Calculs vectorisés sur la matrice des heures mensuelles (lignes × MOIS_COLS)."""
+
+from __future__ import annotations
+
+import datetime as dt
+import warnings
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.data_pipeline import MOIS_COLS
+
+
+def hours_matrix(df: pd.DataFrame, months: List[str]) -> np.ndarray:
+    """Matrice float (n_lignes × n_mois) des heures saisies, NaN → 0."""
+    if not months:
+        return np.zeros((len(df), 0), dtype=float)
+    return np.nan_to_num(df[months].to_numpy(dtype=float, na_value=0.0))
+
+
+# -----------------------------
+# Charge enseignant (Responsable × Mois)
+# -----------------------------
+def workload_matrix(
+    df: pd.DataFrame,
+    months: List[str],
+    code_col: str = "_resp_code",
+    label_col: str = "Responsable",
+) -> pd.DataFrame:
+    """
+    Somme des heures par Responsable et par mois.
+
+    Le regroupement se fait sur les codes entiers calculés au chargement
+    (`_resp_code`, mis en cache avec le dataset) : un `np.bincount` par mois,
+    sans regrouper de chaînes à chaque rerun.
+    """
+    if df.empty or not months:
+        return pd.DataFrame(columns=months, dtype=float)
+
+    if code_col in df.columns:
+        codes = df[code_col].to_numpy()
+    else:
+        codes = pd.factorize(df[label_col])[0]
+
+    uniq, inv = np.unique(codes, return_inverse=True)
+    k = len(uniq)
+    hours = hours_matrix(df, months)
+
+    mat = np.empty((k, len(months)), dtype=float)
+    for j in range(len(months)):
+        mat[:, j] = np.bincount(inv, weights=hours[:, j], minlength=k)
+
+    # Libellé = première occurrence de chaque code dans le sous-ensemble filtré
+    first = np.empty(k, dtype=np.int64)
+    first[inv[::-1]] = np.arange(len(inv) - 1, -1, -1)
+    labels = df[label_col].to_numpy()[first]
+
+    out = pd.DataFrame(mat, index=pd.Index(labels, name=label_col), columns=months)
+    return out
+
+
+def workload_summary(matrix: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """Synthèse par enseignant : total, pic mensuel, nb de mois au-dessus du seuil."""
+    cols = ["Responsable", "Total_h", "Pic_h", "Mois_pic", "Mois_surcharge", "Nb_mois_surcharge"]
+    if matrix.empty:
+        return pd.DataFrame(columns=cols)
+
+    values = matrix.to_numpy(dtype=float)
+    months = np.asarray(matrix.columns, dtype=object)
+    over = values > threshold
+
+    peak_idx = values.argmax(axis=1)
+    mois_surcharge = [", ".join(months[row]) for row in over]
+
+    out = pd.DataFrame({
+        "Responsable": matrix.index.to_numpy(),
+        "Total_h": values.sum(axis=1),
+        "Pic_h": values.max(axis=1),
+        "Mois_pic": months[peak_idx],
+        "Mois_surcharge": mois_surcharge,
+        "Nb_mois_surcharge": over.sum(axis=1),
+    })
+    return out.sort_values(["Total_h", "Pic_h"], ascending=[False, False]).reset_index(drop=True)
+
+
+def overload_cells(matrix: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """Liste (Responsable, Mois, Heures) des cellules au-dessus du seuil, triée par heures."""
+    cols = ["Responsable", "Mois", "Heures"]
+    if matrix.empty:
+        return pd.DataFrame(columns=cols)
+
+    values = matrix.to_numpy(dtype=float)
+    r, c = np.nonzero(values > threshold)
+    out = pd.DataFrame({
+        "Responsable": matrix.index.to_numpy()[r],
+        "Mois": np.asarray(matrix.columns, dtype=object)[c],
+        "Heures": values[r, c],
+    })
+    return out.sort_values("Heures", ascending=False).reset_index(drop=True)
+
+
+# -----------------------------
+# Projection de fin (rythme récent)
+# -----------------------------
+def academic_year_start(ref: Optional[dt.date] = None) -> int:
+    """Année civile du mois d'Oct de l'année académique contenant `ref` (sept → nouvelle année)."""
+    ref = ref or dt.date.today()
+    return ref.year if ref.month >= 9 else ref.year - 1
+
+
+def parse_dates(s: pd.Series) -> pd.Series:
+    return pd.to_datetime(s, errors="coerce", dayfirst=True)
+
+
+def dates_to_ordinals(d: pd.Series) -> np.ndarray:
+    """Dates → ordinal absolu du mois (année*12 + mois-1), NaN si inconnue."""
+    return (d.dt.year * 12 + d.dt.month - 1).to_numpy(dtype=float)
+
+
+def infer_academic_year(dates: pd.Series, ref_date: Optional[dt.date] = None) -> int:
+    """Année académique du classeur : médiane des dates prévues, sinon `ref_date`/aujourd'hui."""
+    valid = dates.dropna()
+    if not valid.empty:
+        return academic_year_start(valid.median().date())
+    return academic_year_start(ref_date)
+
+
+def project_completion(
+    df: pd.DataFrame,
+    asof: str,
+    window: int = 3,
+    ref_date: Optional[dt.date] = None,
+    fin_col: str = "Fin prévue",
+) -> pd.DataFrame:
+    """
+    Projection de la date de fin de chaque ligne, en une passe NumPy.
+
+    - Rythme = moyenne des heures sur les `window` derniers mois jusqu'à `asof`
+      (fenêtre raccourcie au premier mois d'activité pour les cours récents).
+    - Fin projetée = premier mois où le cumul atteint VHP (cours terminés) ou
+      `asof` + ceil(reste / rythme) sinon ; vide si aucun rythme mesurable.
+    - Projection_hors_délai = cours en cours dont la fin projetée dépasse
+      `Fin prévue` (les non démarrés relèvent déjà de leur propre alerte).
+      L'année académique est déduite des dates `Fin prévue` du classeur.
+    """
+    n = len(df)
+    cols = ["Rythme_h_mois", "Reste_h", "Fin_projetée", "Projection_hors_délai"]
+    if n == 0:
+        return pd.DataFrame(columns=cols, index=df.index)
+
+    a = MOIS_COLS.index(asof)
+    hours = hours_matrix(df, MOIS_COLS[: a + 1])
+    vhp = df["VHP"].to_numpy(dtype=float)
+
+    cum = np.cumsum(hours, axis=1)
+    csum = np.concatenate([np.zeros((n, 1)), cum], axis=1)
+    vhr = cum[:, -1]
+
+    active = hours > 0
+    first_active = np.where(active.any(axis=1), active.argmax(axis=1), a)
+    start = np.maximum(a - window + 1, first_active)
+    span = (a + 1 - start).astype(float)
+    rate = (csum[:, a + 1] - csum[np.arange(n), start]) / span
+
+    remaining = vhp - vhr
+    done = (vhp > 0) & (remaining <= 0)
+    running = (vhp > 0) & ~done & (rate > 0)
+
+    proj_idx = np.full(n, np.nan)
+    proj_idx[done] = (cum[done] >= vhp[done, None]).argmax(axis=1)
+    proj_idx[running] = a + np.ceil(remaining[running] / rate[running])
+
+    fin_dt = parse_dates(df[fin_col]) if fin_col in df.columns else pd.Series(pd.NaT, index=df.index)
+    y0 = infer_academic_year(fin_dt, ref_date)
+    proj_ord = y0 * 12 + 9 + proj_idx
+    fin_ord = dates_to_ordinals(fin_dt)
+    late = running & ~np.isnan(fin_ord) & (proj_ord > fin_ord)
+
+    labels = np.array(MOIS_COLS + ["Après Août"], dtype=object)
+    label_idx = np.minimum(np.nan_to_num(proj_idx, nan=0), len(MOIS_COLS)).astype(int)
+    fin_proj = np.where(np.isnan(proj_idx), "", labels[label_idx])
+
+    return pd.DataFrame(
+        {
+            "Rythme_h_mois": rate.round(1),
+            "Reste_h": np.maximum(remaining, 0),
+            "Fin_projetée": fin_proj,
+            "Projection_hors_délai": late,
+        },
+        index=df.index,
+    )
+
+
+# -----------------------------
+# Anomalies de saisie (heures mensuelles)
+# -----------------------------
+ANOMALY_COLS = ["Classe", "Ligne", "Matière", "Responsable", "Mois", "Heures", "VHP", "Anomalie", "Détail"]
+
+
+def detect_hour_anomalies(
+    df: pd.DataFrame,
+    z_threshold: float = 3.5,
+    spike_ratio: float = 2.0,
+    mad_floor: float = 1.0,
+    overrun_tol: float = 0.05,
+    ref_date: Optional[dt.date] = None,
+) -> pd.DataFrame:
+    """
+    Détecte, sur toute la matrice des heures à la fois, les saisies suspectes :
+
+    - « Mois > VHP » : un seul mois dépasse le volume prévu du cours ;
+    - « Cumul > VHP » : premier mois où le cumul dépasse VHP (+ `overrun_tol`) ;
+    - « Valeur atypique » : z-score robuste (médiane/MAD des mois non nuls de la
+      ligne, MAD plancher `mad_floor` h) au-delà de `z_threshold` ;
+    - « Pic isolé » : mois entouré de mois vides, ≥ `spike_ratio` × médiane ;
+    - « Hors fenêtre » : heures avant le mois de `Début prévu` ou après celui de `Fin prévue`.
+
+    Une ligne de sortie par (ligne, mois, type) avec la référence feuille/ligne Excel.
+    """
+    n, m = len(df), len(MOIS_COLS)
+    if n == 0:
+        return pd.DataFrame(columns=ANOMALY_COLS)
+
+    hours = hours_matrix(df, MOIS_COLS)
+    vhp = df["VHP"].to_numpy(dtype=float)
+    pos = hours > 0
+    has_vhp = (vhp > 0)[:, None]
+
+    masks = {}
+    details = {}
+
+    # Mois isolé supérieur au VHP
+    masks["Mois > VHP"] = has_vhp & (hours > vhp[:, None])
+    details["Mois > VHP"] = "heures du mois > VHP"
+
+    # Premier mois où le cumul dépasse VHP
+    over = has_vhp & (np.cumsum(hours, axis=1) > (vhp * (1 + overrun_tol))[:, None])
+    first_over = over & ~np.concatenate([np.zeros((n, 1), dtype=bool), over[:, :-1]], axis=1)
+    masks["Cumul > VHP"] = first_over
+    details["Cumul > VHP"] = "VHR cumulé dépasse VHP à partir de ce mois"
+
+    # z-score robuste par ligne (mois non nuls uniquement)
+    nz = np.where(pos, hours, np.nan)
+    enough = pos.sum(axis=1) >= 3
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # lignes sans mois non nul
+        med = np.nanmedian(np.where(enough[:, None], nz, np.nan), axis=1)
+        mad = np.nanmedian(np.abs(nz - med[:, None]), axis=1)
+        row_med = np.nanmedian(nz, axis=1)
+    with np.errstate(invalid="ignore"):
+        z = 0.6745 * (hours - med[:, None]) / np.maximum(mad, mad_floor)[:, None]
+    masks["Valeur atypique"] = enough[:, None] & pos & (z > z_threshold)
+    details["Valeur atypique"] = f"z-score robuste > {z_threshold:g}"
+
+    # Pic isolé : voisins vides, ligne active ailleurs, valeur élevée
+    padded = np.pad(pos, ((0, 0), (1, 1)))
+    lonely = pos & ~padded[:, :-2] & ~padded[:, 2:]
+    multi = (pos.sum(axis=1) >= 2)[:, None]
+    masks["Pic isolé"] = lonely & multi & (hours >= spike_ratio * np.nan_to_num(row_med)[:, None])
+    details["Pic isolé"] = f"mois isolé ≥ {spike_ratio:g} × médiane de la ligne"
+
+    # Activité hors de la fenêtre Début prévu → Fin prévue
+    deb_dt = parse_dates(df["Début prévu"]) if "Début prévu" in df.columns else pd.Series(pd.NaT, index=df.index)
+    fin_dt = parse_dates(df["Fin prévue"]) if "Fin prévue" in df.columns else pd.Series(pd.NaT, index=df.index)
+    y0 = infer_academic_year(pd.concat([deb_dt, fin_dt]), ref_date)
+    month_ord = y0 * 12 + 9 + np.arange(m)
+    deb_ord = dates_to_ordinals(deb_dt)[:, None]
+    fin_ord = dates_to_ordinals(fin_dt)[:, None]
+    with np.errstate(invalid="ignore"):
+        outside = (month_ord[None, :] < deb_ord) | (month_ord[None, :] > fin_ord)
+    masks["Hors fenêtre"] = pos & outside
+    details["Hors fenêtre"] = "heures hors de la période Début prévu → Fin prévue"
+
+    classe = df["Classe"].to_numpy() if "Classe" in df.columns else np.full(n, "")
+    ligne = df["_sheet_row"].to_numpy() if "_sheet_row" in df.columns else np.arange(n) + 2
+    matiere = df["Matière"].to_numpy() if "Matière" in df.columns else np.full(n, "")
+    resp = df["Responsable"].to_numpy() if "Responsable" in df.columns else np.full(n, "")
+    mois = np.asarray(MOIS_COLS, dtype=object)
+
+    parts = []
+    for kind, mask in masks.items():
+        r, c = np.nonzero(mask)
+        if len(r) == 0:
+            continue
+        parts.append(pd.DataFrame({
+            "Classe": classe[r],
+            "Ligne": ligne[r],
+            "Matière": matiere[r],
+            "Responsable": resp[r],
+            "Mois": mois[c],
+            "Heures": hours[r, c],
+            "VHP": vhp[r],
+            "Anomalie": kind,
+            "Détail": details[kind],
+            "_mois_idx": c,
+        }))
+
+    if not parts:
+        return pd.DataFrame(columns=ANOMALY_COLS)
+
+    out = pd.concat(parts, ignore_index=True)
+    out = out.sort_values(["Classe", "Ligne", "_mois_idx"]).drop(columns="_mois_idx")
+    return out.reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=20)
+def cached_hour_anomalies(dataset_hash: str, _df: pd.DataFrame) -> pd.DataFrame:
+    """Anomalies calculées une fois par version du classeur (clé = hash du contenu)."""
+    return detect_hour_anomalies(_df)
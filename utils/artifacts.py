@@ -0,0 +1,203 @@
+"""Cache des exports générés à la demande (Excel, PDF…), partagé entre sessions."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+
+def artifact_key(*parts) -> str:
+    """Clé stable à partir de parties hétérogènes (str, nombres, dicts, listes)."""
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        if isinstance(p, dict):
+            p = sorted(p.items())
+        h.update(repr(p).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def frame_signature(df: pd.DataFrame) -> str:
+    """
+    Empreinte d'un sous-ensemble filtré du dataset : lignes retenues (`_rowkey`)
+    et colonnes présentes. Combinée au hash du dataset et à la période, elle
+    identifie le contenu exporté sans hacher toutes les cellules.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((len(df), list(df.columns))).encode("utf-8"))
+    if "_rowkey" in df.columns:
+        h.update(pd.util.hash_pandas_object(df["_rowkey"], index=False).to_numpy().tobytes())
+    else:
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def bytes_digest(data: Optional[bytes]) -> str:
+    """Empreinte courte d'un contenu binaire (logo…), "" si absent."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest() if data else ""
+
+
+@dataclass
+class BuiltArtifact:
+    """Résultat de `ArtifactCache.build_many` : contenu, durée d'obtention, servi depuis le cache ou non."""
+
+    data: bytes
+    seconds: float
+    cached: bool
+
+
+class ArtifactCache:
+    """
+    LRU en mémoire borné en octets, sûr entre threads (un process Streamlit
+    sert plusieurs sessions). Un même artefact n'est construit qu'une fois :
+    les appels concurrents sur la même clé attendent le premier constructeur.
+
+    Avec `disk_dir`, un second niveau sur disque (un fichier par clé, borné à
+    `max_disk_bytes`, éviction des moins récemment lus) survit aux redémarrages.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[Path] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = int(max_disk_bytes)
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._building: dict[str, threading.Lock] = {}
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.bin"
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # mtime = dernier accès, utilisé pour l'éviction
+        except OSError:
+            return None
+        return data
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        if not self.disk_dir or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            return
+        self._disk_prune()
+
+    def _disk_prune(self) -> None:
+        entries = []
+        for p in self.disk_dir.glob("*.bin"):
+            try:
+                st_ = p.stat()
+            except OSError:
+                continue
+            entries.append((st_.st_mtime, st_.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_disk_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                return data
+        data = self._disk_get(key)
+        if data is not None:
+            self._put_memory(key, data)
+        return data
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._items:
+                return True
+        return bool(self.disk_dir) and self._disk_path(key).exists()
+
+    def put(self, key: str, data: bytes) -> None:
+        self._put_memory(key, data)
+        self._disk_put(key, data)
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_or_build(self, key: str, builder: Callable[[], bytes]) -> bytes:
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            data = self.get(key)
+            if data is None:
+                data = builder()
+                self.put(key, data)
+        with self._lock:
+            self._building.pop(key, None)
+        return data
+
+    def build_many(self, jobs: Dict[str, Tuple[str, Callable[[], bytes]]]) -> Dict[str, BuiltArtifact]:
+        """
+        Construit plusieurs artefacts en même temps : `jobs` = {nom: (clé, constructeur)}.
+        Un thread par artefact attend son constructeur (qui délègue au pool de
+        processus) ; les artefacts déjà en cache sont servis sans reconstruction.
+        Retourne {nom: BuiltArtifact} une fois tous terminés (la première erreur remonte).
+        """
+        def run(key: str, builder: Callable[[], bytes]) -> BuiltArtifact:
+            t0 = time.perf_counter()
+            built = False
+
+            def build() -> bytes:
+                nonlocal built
+                built = True
+                return builder()
+
+            data = self.get_or_build(key, build)
+            return BuiltArtifact(data, time.perf_counter() - t0, cached=not built)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(jobs)), thread_name_prefix="artifact") as pool:
+            futures = {name: pool.submit(run, key, builder) for name, (key, builder) in jobs.items()}
+            return {name: fut.result() for name, fut in futures.items()}
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import hashlib
 import io
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
 
 import numpy as np
@@ -34,6 +35,7 @@ DEFAULT_THRESHOLDS = {
     "taux_orange": 0.60,
     "ecart_critique": -6,
     "max_non_demarre": 0.25,
+    "charge_mensuelle_max": 40,
 }
 
 
@@ -169,11 +171,50 @@ def compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+ROW_KEY_COLS = ["Classe", "Matière", "Semestre", "Type", "Responsable"]
+
+
+def normalize_key_text(s: pd.Series) -> pd.Series:
+    """Texte comparable : sans accents, minuscules, ponctuation/espaces réduits."""
+    s = s.astype(str).replace({"nan": "", "None": ""}).fillna("")
+    s = s.str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+    return s.str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+
+
+def build_row_keys(df: pd.DataFrame) -> pd.Series:
+    """
+    Clé de ligne stable, dérivée du contenu (Classe, Matière normalisée, Semestre,
+    Type, Responsable) et non de la position : insérer une ligne dans une feuille
+    ne change pas la clé des autres. Les doublons exacts reçoivent un suffixe
+    `~1`, `~2`… dans leur ordre d'apparition.
+    """
+    parts = []
+    for c in ROW_KEY_COLS:
+        col = df[c] if c in df.columns else pd.Series("", index=df.index)
+        if c == "Semestre":
+            col = col.apply(normalize_semestre_value)
+        parts.append(normalize_key_text(col))
+
+    joined = parts[0].str.cat(parts[1:], sep="\x1f")
+    base = pd.Series(
+        [hashlib.blake2b(x.encode("utf-8"), digest_size=8).hexdigest() for x in joined],
+        index=df.index,
+    )
+    dup = base.groupby(base, sort=False).cumcount()
+    return base.where(dup.eq(0), base + "~" + dup.astype(str))
+
+
+def build_row_index(keys: pd.Series) -> Dict[str, int]:
+    """Index de hachage clé → position (lookup O(1))."""
+    return {k: i for i, k in enumerate(keys.tolist())}
+
+
 def unpivot_months(df: pd.DataFrame) -> pd.DataFrame:
     id_cols = [
         c
         for c in [
             "_rowid",
+            "_rowkey",
             "Classe",
             "Semestre",
             "Matière",
@@ -195,11 +236,130 @@ def unpivot_months(df: pd.DataFrame) -> pd.DataFrame:
     return long
 
 
-def df_to_excel_bytes(sheets: Dict[str, pd.DataFrame]) -> bytes:
+# -----------------------------
+# Export Excel (openpyxl en mode write-only)
+# -----------------------------
+EXCEL_STATUS_FILLS = {
+    "Terminé": "C6EFCE",
+    "En cours": "FFEB9C",
+    "Non démarré": "FFC7CE",
+}
+EXCEL_HEADER_FILL = "1F2A44"
+
+
+def _excel_column_values(s: pd.Series) -> list:
+    """Valeurs Python prêtes pour openpyxl (NaN/NaT -> cellule vide)."""
+    if pd.api.types.is_bool_dtype(s):
+        return s.astype(object).where(s.notna(), None).tolist()
+    if pd.api.types.is_integer_dtype(s) and not s.isna().any():
+        return s.to_numpy(dtype=np.int64).tolist()
+    if pd.api.types.is_numeric_dtype(s):
+        return [None if v != v else v for v in s.to_numpy(dtype=float, na_value=np.nan).tolist()]
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.astype(object).where(s.notna(), None).tolist()
+    return s.astype(object).where(s.notna(), None).tolist()
+
+
+def _excel_number_format(s: pd.Series) -> Optional[str]:
+    if pd.api.types.is_bool_dtype(s) or not pd.api.types.is_numeric_dtype(s):
+        return None
+    if pd.api.types.is_integer_dtype(s):
+        return "0"
+    vals = s.to_numpy(dtype=float, na_value=np.nan)
+    vals = vals[~np.isnan(vals)]
+    if len(vals) and np.all(vals == np.round(vals)):
+        return "0"
+    return "0.00"
+
+
+def _excel_width(header: str, values: list, sample: int = 200) -> float:
+    longest = max([len(str(header))] + [len(str(v)) for v in values[:sample] if v is not None])
+    return float(min(max(longest + 2, 8), 50))
+
+
+def df_to_excel_bytes(
+    sheets: Dict[str, pd.DataFrame],
+    freeze_header: bool = True,
+    autofilter: bool = True,
+    status_col: str = "Statut_auto",
+) -> bytes:
+    """
+    Écrit les feuilles en flux (openpyxl write-only) : les lignes partent
+    directement dans le XML sans modèle objet complet en mémoire.
+
+    Seul l'en-tête porte un style de cellule (partagé). Formats numériques et
+    couleurs de statut sont des règles de mise en forme conditionnelle au niveau
+    de la feuille, une par colonne / par statut, quel que soit le nombre de lignes.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.formatting.rule import CellIsRule, Rule
+    from openpyxl.styles import Alignment, Font, PatternFill
+    from openpyxl.styles.differential import DifferentialStyle
+    from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE, NumberFormat
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill("solid", fgColor=EXCEL_HEADER_FILL)
+    header_align = Alignment(vertical="center", wrap_text=True)
+    for name, sheet_df in sheets.items():
+        ws = wb.create_sheet(title=name[:31])
+        columns = [str(c) for c in sheet_df.columns]
+        values = [_excel_column_values(sheet_df.iloc[:, j]) for j in range(sheet_df.shape[1])]
+        n_rows = len(sheet_df)
+        last_row = n_rows + 1
+
+        # Mise en page : à définir avant la première ligne écrite
+        for j, col in enumerate(columns, start=1):
+            ws.column_dimensions[get_column_letter(j)].width = _excel_width(col, values[j - 1])
+        if freeze_header:
+            ws.freeze_panes = "A2"
+        if autofilter and columns:
+            ws.auto_filter.ref = f"A1:{get_column_letter(len(columns))}{last_row}"
+
+        if n_rows:
+            for j, col in enumerate(columns, start=1):
+                fmt = _excel_number_format(sheet_df.iloc[:, j - 1])
+                if fmt is None:
+                    continue
+                letter = get_column_letter(j)
+                rule = Rule(
+                    type="expression",
+                    formula=["TRUE"],
+                    dxf=DifferentialStyle(numFmt=NumberFormat(numFmtId=BUILTIN_FORMATS_REVERSE[fmt], formatCode=fmt)),
+                )
+                ws.conditional_formatting.add(f"{letter}2:{letter}{last_row}", rule)
+
+            if status_col in columns:
+                letter = get_column_letter(columns.index(status_col) + 1)
+                for statut, color in EXCEL_STATUS_FILLS.items():
+                    ws.conditional_formatting.add(
+                        f"{letter}2:{letter}{last_row}",
+                        CellIsRule(
+                            operator="equal",
+                            formula=[f'"{statut}"'],
+                            fill=PatternFill("solid", start_color=color, end_color=color),
+                        ),
+                    )
+
+        header = []
+        for col in columns:
+            cell = WriteOnlyCell(ws, value=col)
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = header_align
+            header.append(cell)
+        ws.append(header)
+
+        for row in zip(*values):
+            ws.append(row)
+
+    if not sheets:
+        wb.create_sheet(title="Feuille1")
+
     output = io.BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
-        for name, sheet_df in sheets.items():
-            sheet_df.to_excel(writer, sheet_name=name[:31], index=False)
+    wb.save(output)
     return output.getvalue()
 
 
@@ -283,6 +443,7 @@ def load_excel_all_sheets(file_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str, Li
             )
 
         df["Classe"] = sheet
+        df["_sheet_row"] = np.arange(len(df)) + 2  # ligne Excel (en-tête = ligne 1)
         frames.append(df)
 
     if not frames:
@@ -291,6 +452,9 @@ def load_excel_all_sheets(file_bytes: bytes) -> Tuple[pd.DataFrame, Dict[str, Li
     all_df = pd.concat(frames, ignore_index=True)
     all_df = compute_metrics(all_df)
     all_df["_rowid"] = np.arange(len(all_df))
+    all_df["_rowkey"] = build_row_keys(all_df)
+    # Codes entiers des responsables, calculés une fois et mis en cache avec le dataset
+    all_df["_resp_code"] = pd.factorize(all_df["Responsable"])[0]
 
     if all_df["Matière_vide"].mean() > 0.05:
         quality_issues.setdefault("__GLOBAL__", []).append(
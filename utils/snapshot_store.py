@@ -0,0 +1,330 @@
+"""
+Historique local des versions du classeur (SQLite).
+
+Chaque version distincte (clé = hash du contenu) est enregistrée avec ses lignes
+consolidées et des lignes KPI pré-agrégées par (Classe, Responsable), indexées
+pour que les courbes de tendance sur l'année se requêtent en quelques ms.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.data_pipeline import DEFAULT_THRESHOLDS, MOIS_COLS
+
+NON_AFFECTE = "⚠️ Non affecté"
+
+_ROW_TEXT_COLS = ["Classe", "Semestre", "Type", "Matière", "Responsable", "Statut_auto"]
+_MONTH_SQL = ", ".join(f'"{m}" REAL' for m in MOIS_COLS)
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS snapshots (
+    id            INTEGER PRIMARY KEY,
+    content_hash  TEXT NOT NULL UNIQUE,
+    snapshot_date TEXT NOT NULL,
+    created_at    TEXT NOT NULL,
+    source        TEXT,
+    n_rows        INTEGER NOT NULL,
+    has_rows      INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_date ON snapshots(snapshot_date);
+
+CREATE TABLE IF NOT EXISTS snapshot_rows (
+    snapshot_id  INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    rowkey       TEXT NOT NULL,
+    "Classe" TEXT, "Semestre" TEXT, "Type" TEXT, "Matière" TEXT, "Responsable" TEXT, "Statut_auto" TEXT,
+    "VHP" REAL,
+    {_MONTH_SQL},
+    PRIMARY KEY (snapshot_id, rowkey)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS snapshot_kpis (
+    snapshot_id    INTEGER NOT NULL REFERENCES snapshots(id) ON DELETE CASCADE,
+    snapshot_date  TEXT NOT NULL,
+    level          TEXT NOT NULL,
+    classe         TEXT NOT NULL,
+    responsable    TEXT NOT NULL,
+    n_rows         INTEGER NOT NULL,
+    vhp            REAL NOT NULL,
+    vhr            REAL NOT NULL,
+    retard_h       REAL NOT NULL,
+    nb_termine     INTEGER NOT NULL,
+    nb_en_cours    INTEGER NOT NULL,
+    nb_non_demarre INTEGER NOT NULL,
+    nb_alertes     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_kpis_level_date_classe_resp ON snapshot_kpis(level, snapshot_date, classe, responsable);
+CREATE INDEX IF NOT EXISTS idx_kpis_level_classe_date ON snapshot_kpis(level, classe, snapshot_date);
+CREATE INDEX IF NOT EXISTS idx_kpis_level_resp_date ON snapshot_kpis(level, responsable, snapshot_date);
+CREATE INDEX IF NOT EXISTS idx_kpis_snapshot ON snapshot_kpis(snapshot_id);
+"""
+
+TREND_METRICS = {
+    "VHR": "SUM(vhr)",
+    "VHP": "SUM(vhp)",
+    "Taux (%)": "CASE WHEN SUM(vhp) > 0 THEN 100.0 * SUM(vhr) / SUM(vhp) ELSE 0 END",
+    "Retard (h)": "SUM(retard_h)",
+    "Alertes": "SUM(nb_alertes)",
+    "Non démarrés": "SUM(nb_non_demarre)",
+    "Terminés": "SUM(nb_termine)",
+}
+
+
+KPI_LEVELS = {
+    "all": [],
+    "classe": ["classe"],
+    "responsable": ["responsable"],
+    "classe_responsable": ["classe", "responsable"],
+}
+
+
+def compute_kpi_rows(df: pd.DataFrame, ecart_critique: float = DEFAULT_THRESHOLDS["ecart_critique"]) -> pd.DataFrame:
+    """
+    KPIs pré-agrégés d'une version du classeur, à plusieurs niveaux (`KPI_LEVELS`) :
+    global, par Classe, par Responsable et par (Classe, Responsable). Une tendance
+    lit ainsi quelques lignes par date au lieu de ré-agréger tout le détail.
+    """
+    d = pd.DataFrame({
+        "classe": df["Classe"].astype(str).to_numpy(),
+        "responsable": df["Responsable"].astype(str).str.strip().replace({"": NON_AFFECTE}).to_numpy(),
+        "vhp": df["VHP"].to_numpy(dtype=float),
+        "vhr": df["VHR"].to_numpy(dtype=float),
+    })
+    ecart = df["Écart"].to_numpy(dtype=float)
+    statut = df["Statut_auto"].to_numpy()
+    d["retard_h"] = np.where(ecart < 0, ecart, 0.0)
+    d["nb_termine"] = (statut == "Terminé").astype(int)
+    d["nb_en_cours"] = (statut == "En cours").astype(int)
+    d["nb_non_demarre"] = (statut == "Non démarré").astype(int)
+    d["nb_alertes"] = ((ecart <= ecart_critique) | (statut == "Non démarré")).astype(int)
+    d["n_rows"] = 1
+
+    fine = d.groupby(["classe", "responsable"], as_index=False, sort=False).sum()
+    levels = []
+    for level, keys in KPI_LEVELS.items():
+        if keys == ["classe", "responsable"]:
+            agg = fine.copy()
+        elif keys:
+            agg = fine.drop(columns=[c for c in ("classe", "responsable") if c not in keys])
+            agg = agg.groupby(keys, as_index=False, sort=False).sum()
+        else:
+            agg = fine.drop(columns=["classe", "responsable"]).sum().to_frame().T
+        for c in ("classe", "responsable"):
+            if c not in keys:
+                agg[c] = ""
+        agg["level"] = level
+        levels.append(agg)
+    return pd.concat(levels, ignore_index=True)
+
+
+class SnapshotStore:
+    """
+    Magasin SQLite des versions du classeur.
+
+    Rétention / compaction (`compact`) :
+    - toutes les versions des `keep_all_days` derniers jours sont gardées ;
+    - au-delà, une seule version par jour, puis une par semaine après `keep_daily_days` ;
+    - les lignes détaillées ne sont gardées que `rows_retention_days` jours (plus la
+      dernière version) ; les versions plus anciennes ne conservent que leurs KPIs ;
+    - au plus `max_snapshots` versions au total.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        keep_all_days: int = 14,
+        keep_daily_days: int = 120,
+        rows_retention_days: int = 60,
+        max_snapshots: int = 400,
+    ):
+        self.path = Path(path)
+        self.keep_all_days = keep_all_days
+        self.keep_daily_days = keep_daily_days
+        self.rows_retention_days = rows_retention_days
+        self.max_snapshots = max_snapshots
+        self._write_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    # -----------------------------
+    # Écriture
+    # -----------------------------
+    def has(self, content_hash: str) -> bool:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT 1 FROM snapshots WHERE content_hash = ?", (content_hash,)).fetchone()
+        return row is not None
+
+    def record(
+        self,
+        content_hash: str,
+        df: pd.DataFrame,
+        source: str = "",
+        when: Optional[dt.datetime] = None,
+    ) -> bool:
+        """Enregistre une version si elle est nouvelle. Retourne False si déjà connue."""
+        if self.has(content_hash):
+            return False
+
+        when = when or dt.datetime.now()
+        rows = pd.DataFrame({"rowkey": df["_rowkey"].to_numpy()})
+        for c in _ROW_TEXT_COLS:
+            rows[c] = df[c].astype(str).to_numpy() if c in df.columns else ""
+        rows["VHP"] = df["VHP"].to_numpy(dtype=float)
+        for m in MOIS_COLS:
+            rows[m] = df[m].to_numpy(dtype=float)
+        kpis = compute_kpi_rows(df)
+
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO snapshots (content_hash, snapshot_date, created_at, source, n_rows) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, when.date().isoformat(), when.isoformat(timespec="seconds"), source, len(df)),
+            )
+            if cur.rowcount == 0:
+                return False
+            sid = cur.lastrowid
+
+            cols = ["rowkey"] + _ROW_TEXT_COLS + ["VHP"] + MOIS_COLS
+            placeholders = ", ".join("?" * (len(cols) + 1))
+            quoted = ", ".join(f'"{c}"' for c in cols)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO snapshot_rows (snapshot_id, {quoted}) VALUES ({placeholders})",
+                ((sid, *r) for r in rows[cols].itertuples(index=False, name=None)),
+            )
+
+            kcols = ["level", "classe", "responsable", "n_rows", "vhp", "vhr", "retard_h",
+                     "nb_termine", "nb_en_cours", "nb_non_demarre", "nb_alertes"]
+            conn.executemany(
+                f"INSERT INTO snapshot_kpis (snapshot_id, snapshot_date, {', '.join(kcols)}) "
+                f"VALUES (?, ?, {', '.join('?' * len(kcols))})",
+                ((sid, when.date().isoformat(), *r) for r in kpis[kcols].itertuples(index=False, name=None)),
+            )
+            # Statistiques à jour pour que le planificateur choisisse les bons index
+            conn.execute("PRAGMA optimize")
+        return True
+
+    # -----------------------------
+    # Lecture
+    # -----------------------------
+    def list_snapshots(self, with_rows_only: bool = False) -> pd.DataFrame:
+        q = "SELECT id, content_hash, snapshot_date, created_at, source, n_rows, has_rows FROM snapshots"
+        if with_rows_only:
+            q += " WHERE has_rows = 1"
+        q += " ORDER BY created_at DESC"
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(q, conn)
+
+    def load_rows(self, snapshot_id: int) -> pd.DataFrame:
+        """Lignes consolidées d'une version, au format attendu par `diff_workbooks`."""
+        with closing(self._connect()) as conn:
+            d = pd.read_sql_query("SELECT * FROM snapshot_rows WHERE snapshot_id = ?", conn, params=(snapshot_id,))
+        d = d.drop(columns="snapshot_id").rename(columns={"rowkey": "_rowkey"})
+        d["VHR"] = d[MOIS_COLS].sum(axis=1)
+        return d
+
+    def kpi_trend(
+        self,
+        metric: str,
+        by: Optional[str] = None,
+        classes: Optional[List[str]] = None,
+        responsables: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Série (snapshot_date[, Classe|Responsable], valeur) pour un indicateur de TREND_METRICS.
+        Une date = dernière version du jour.
+        """
+        expr = TREND_METRICS[metric]
+        group_col = {"Classe": "classe", "Responsable": "responsable"}.get(by or "", "")
+
+        # Niveau pré-agrégé le plus grossier compatible avec les filtres et la dimension
+        dims = {group_col} - {""}
+        if classes:
+            dims.add("classe")
+        if responsables:
+            dims.add("responsable")
+        level = next(lv for lv, keys in KPI_LEVELS.items() if set(keys) == dims)
+
+        where = [
+            "k.level = ?",
+            "k.snapshot_id IN (SELECT MAX(id) FROM snapshots GROUP BY snapshot_date)",
+        ]
+        params: List[object] = [level]
+        if classes:
+            where.append(f"k.classe IN ({', '.join('?' * len(classes))})")
+            params += list(classes)
+        if responsables:
+            where.append(f"k.responsable IN ({', '.join('?' * len(responsables))})")
+            params += list(responsables)
+
+        select_dim = f", k.{group_col} AS \"{by}\"" if group_col else ""
+        group_dim = f", k.{group_col}" if group_col else ""
+        q = (
+            f"SELECT k.snapshot_date AS Date{select_dim}, {expr} AS \"{metric}\" "
+            f"FROM snapshot_kpis k WHERE {' AND '.join(where)} "
+            f"GROUP BY k.snapshot_date{group_dim} ORDER BY k.snapshot_date"
+        )
+        with closing(self._connect()) as conn:
+            out = pd.read_sql_query(q, conn, params=params)
+        out["Date"] = pd.to_datetime(out["Date"])
+        return out
+
+    def disk_usage_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.path.parent.glob(self.path.name + "*") if p.exists())
+
+    # -----------------------------
+    # Rétention
+    # -----------------------------
+    def compact(self, today: Optional[dt.date] = None) -> Dict[str, int]:
+        """Applique la politique de rétention ; VACUUM si des données ont été supprimées."""
+        today = today or dt.date.today()
+        snaps = self.list_snapshots()
+        if snaps.empty:
+            return {"supprimees": 0, "lignes_purgees": 0}
+
+        snaps["created_at"] = pd.to_datetime(snaps["created_at"])
+        snaps["age"] = (pd.Timestamp(today) - snaps["created_at"].dt.normalize()).dt.days
+        snaps["bucket"] = np.where(
+            snaps["age"] <= self.keep_all_days,
+            "id:" + snaps["id"].astype(str),
+            np.where(
+                snaps["age"] <= self.keep_daily_days,
+                "d:" + snaps["snapshot_date"],
+                "w:" + snaps["created_at"].dt.strftime("%G-%V"),
+            ),
+        )
+        # list_snapshots est trié du plus récent au plus ancien : on garde le 1er de chaque bucket
+        keep = snaps.drop_duplicates("bucket", keep="first").head(self.max_snapshots)
+        drop_ids = sorted(set(snaps["id"]) - set(keep["id"]))
+
+        latest_id = int(snaps["id"].iloc[0])
+        old_rows = keep[(keep["age"] > self.rows_retention_days) & (keep["has_rows"] == 1) & (keep["id"] != latest_id)]
+        purge_ids = old_rows["id"].astype(int).tolist()
+
+        if not drop_ids and not purge_ids:
+            return {"supprimees": 0, "lignes_purgees": 0}
+
+        with self._write_lock, closing(self._connect()) as conn:
+            with conn:
+                for sid in drop_ids:
+                    conn.execute("DELETE FROM snapshots WHERE id = ?", (int(sid),))
+                for sid in purge_ids:
+                    conn.execute("DELETE FROM snapshot_rows WHERE snapshot_id = ?", (sid,))
+                    conn.execute("UPDATE snapshots SET has_rows = 0 WHERE id = ?", (sid,))
+            conn.execute("ANALYZE")
+            conn.execute("VACUUM")
+        return {"supprimees": len(drop_ids), "lignes_purgees": len(purge_ids)}
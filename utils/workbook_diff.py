@@ -0,0 +1,113 @@
+"""Comparaison rapide de deux versions consolidées du classeur (jointure sur `_rowkey`)."""
+
+from __future__ import annotations
+
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from utils.analytics import hours_matrix
+from utils.data_pipeline import MOIS_COLS
+
+CHANGE_ADDED = "Ajoutée"
+CHANGE_REMOVED = "Supprimée"
+CHANGE_MODIFIED = "Modifiée"
+
+ID_COLS = ["Classe", "Semestre", "Type", "Matière", "Responsable"]
+DELTA_PREFIX = "Δ "
+
+
+def _col(df: pd.DataFrame, c: str, fill="") -> np.ndarray:
+    return df[c].to_numpy() if c in df.columns else np.full(len(df), fill, dtype=object)
+
+
+def diff_workbooks(prev: pd.DataFrame, curr: pd.DataFrame, months: List[str] = MOIS_COLS) -> pd.DataFrame:
+    """
+    Fil des changements entre deux DataFrames consolidés (sortie de `load_excel_all_sheets`).
+
+    Jointure par hachage sur `_rowkey` (`Index.get_indexer`), puis comparaison
+    vectorisée des colonnes mois, de VHP et du statut. Une ligne par ligne
+    ajoutée, supprimée ou modifiée, avec les écarts mois par mois (`Δ Oct`…).
+    """
+    prev_keys = pd.Index(prev["_rowkey"])
+    curr_keys = pd.Index(curr["_rowkey"])
+
+    pos = prev_keys.get_indexer(curr_keys)          # position dans prev, -1 si nouvelle
+    matched = pos >= 0
+    removed = curr_keys.get_indexer(prev_keys) < 0  # lignes de prev absentes de curr
+
+    hp = hours_matrix(prev, months)
+    hc = hours_matrix(curr, months)
+    vhp_p = prev["VHP"].to_numpy(dtype=float)
+    vhp_c = curr["VHP"].to_numpy(dtype=float)
+    st_p = _col(prev, "Statut_auto").astype(str)
+    st_c = _col(curr, "Statut_auto").astype(str)
+
+    ci = np.nonzero(matched)[0]
+    pi = pos[matched]
+    delta_m = hc[ci] - hp[pi]
+    modified = (
+        (np.abs(delta_m) > 1e-9).any(axis=1)
+        | (vhp_c[ci] != vhp_p[pi])
+        | (st_c[ci] != st_p[pi])
+    )
+    ci, pi, delta_m = ci[modified], pi[modified], delta_m[modified]
+    ai = np.nonzero(~matched)[0]
+    ri = np.nonzero(removed)[0]
+
+    def block(kind, src, idx, deltas, vhr_before, vhr_after, statut_before, statut_after):
+        out = pd.DataFrame({"Changement": kind, "_rowkey": _col(src, "_rowkey")[idx]})
+        for c in ID_COLS:
+            out[c] = _col(src, c)[idx]
+        out["VHP"] = src["VHP"].to_numpy(dtype=float)[idx]
+        out["VHR_avant"] = vhr_before
+        out["VHR_après"] = vhr_after
+        out["Statut_avant"] = statut_before
+        out["Statut_après"] = statut_after
+        for j, m in enumerate(months):
+            out[DELTA_PREFIX + m] = deltas[:, j]
+        return out
+
+    parts = [
+        block(CHANGE_MODIFIED, curr, ci, delta_m,
+              hp[pi].sum(axis=1), hc[ci].sum(axis=1), st_p[pi], st_c[ci]),
+        block(CHANGE_ADDED, curr, ai, hc[ai],
+              np.zeros(len(ai)), hc[ai].sum(axis=1), np.full(len(ai), "", dtype=object), st_c[ai]),
+        block(CHANGE_REMOVED, prev, ri, -hp[ri],
+              hp[ri].sum(axis=1), np.zeros(len(ri)), st_p[ri], np.full(len(ri), "", dtype=object)),
+    ]
+    non_empty = [p for p in parts if len(p)]
+    if not non_empty:
+        return parts[0]
+    feed = pd.concat(non_empty, ignore_index=True)
+
+    feed["ΔVHR"] = feed["VHR_après"] - feed["VHR_avant"]
+    feed["Devenu_terminé"] = feed["Statut_après"].eq("Terminé") & feed["Statut_avant"].ne("Terminé")
+
+    # Mois touchés, en texte court : "Oct +4, Nov -2"
+    dm = feed[[DELTA_PREFIX + m for m in months]].to_numpy(dtype=float)
+    txt = np.full(len(feed), "", dtype=object)
+    for j, m in enumerate(months):
+        nz = np.abs(dm[:, j]) > 1e-9
+        if nz.any():
+            piece = np.char.add(f"{m} ", np.char.mod("%+g", dm[nz, j])).astype(object)
+            txt[nz] = np.where(txt[nz] == "", piece, txt[nz] + ", " + piece)
+    feed["Mois_modifiés"] = txt
+
+    order = {CHANGE_MODIFIED: 0, CHANGE_ADDED: 1, CHANGE_REMOVED: 2}
+    feed["_o"] = feed["Changement"].map(order)
+    feed = feed.sort_values(["_o", "Classe", "ΔVHR"], ascending=[True, True, False]).drop(columns="_o")
+    return feed.reset_index(drop=True)
+
+
+def diff_summary(feed: pd.DataFrame) -> Dict[str, float]:
+    if feed.empty:
+        return {"ajoutees": 0, "supprimees": 0, "modifiees": 0, "terminees": 0, "delta_h": 0.0}
+    return {
+        "ajoutees": int(feed["Changement"].eq(CHANGE_ADDED).sum()),
+        "supprimees": int(feed["Changement"].eq(CHANGE_REMOVED).sum()),
+        "modifiees": int(feed["Changement"].eq(CHANGE_MODIFIED).sum()),
+        "terminees": int(feed["Devenu_terminé"].sum()),
+        "delta_h": float(feed["ΔVHR"].sum()),
+    }